@@ -0,0 +1,111 @@
+"""
+Non-blocking, structured logging.
+
+Request and worker threads only put records on a bounded queue; a listener thread formats
+them and does the file and stream I/O. Messages are formatted in the listener too, so
+`logger.info("Stored %d chunks", count)` costs the caller little more than a queue put, and
+records below the logger level cost a level check. When the queue is full, records are
+dropped and counted in the ai_cooking_log_records_dropped metric instead of blocking.
+
+    'handlers': {
+        'console': {...},
+        'file': {...},
+        'queue': {
+            'class': 'ai_cooking_project.log.QueueListenerHandler',
+            'handlers': ['console', 'file'],
+            'queue': {'()': 'queue.Queue', 'maxsize': 10000},
+            'respect_handler_level': True,
+        },
+    },
+
+This is the queue handler configuration of dictConfig on Python 3.12+: it builds the queue and
+a QueueListener for the listed handlers, and the handler starts the listener it is given.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from .metrics import LOG_RECORDS_DROPPED
+
+# Attributes every LogRecord has; anything else was passed in `extra` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed in `extra` alongside the standard ones."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Queues records for the background QueueListener that dictConfig attaches as `listener`,
+    starting it when attached and stopping it at exit.
+    Unlike the standard QueueHandler it does not format records in the calling thread.
+    """
+
+    def __init__(self, queue):
+        self._listener = None
+        super().__init__(queue)
+        atexit.register(self._stop)
+        # A forked worker inherits the queue but not the listener thread
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart)
+
+    @property
+    def listener(self) -> Optional[QueueListener]:
+        return self._listener
+
+    @listener.setter
+    def listener(self, listener: Optional[QueueListener]):
+        self._stop()
+        self._listener = listener
+        if listener is not None:
+            listener.start()
+
+    def _stop(self):
+        if self._listener is not None:
+            # Processes the records still queued before returning
+            self._listener.stop()
+            self._listener = None
+
+    def _restart(self):
+        listener = self._listener
+        if listener is None:
+            return
+        # The parent's listener thread does not exist here and its queue may hold a lock
+        self._listener = None
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.listener = QueueListener(
+            self.queue, *listener.handlers, respect_handler_level=listener.respect_handler_level
+        )
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener formats the message, arguments and traceback; nothing crosses a process
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(record.levelname).inc()
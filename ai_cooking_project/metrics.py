@@ -0,0 +1,118 @@
+"""
+Prometheus metrics of the application, served in the text format at /metrics.
+
+A single process keeps its samples in memory. With several worker processes (gunicorn),
+set PROMETHEUS_MULTIPROC_DIR to an empty directory that every worker can write to, before
+the workers start. Each process then writes its samples there and /metrics aggregates all
+of them; gunicorn.conf.py clears the directory on startup.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# From 5 ms for SQL and local embeddings up to two minutes for GPT-4o and DALL-E calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = Histogram(
+    'ai_cooking_stage_seconds',
+    "Duration of one stage of a pipeline (search, ingest, generate, openai, http)",
+    ['pipeline', 'stage'],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    'ai_cooking_stage_errors',
+    "Stages that raised an exception",
+    ['pipeline', 'stage'],
+)
+OPENAI_REQUESTS = Counter(
+    'ai_cooking_openai_requests',
+    "OpenAI API requests by outcome: ok, retried or failed",
+    ['model', 'outcome'],
+)
+OPENAI_TOKENS = Counter(
+    'ai_cooking_openai_tokens',
+    "Tokens reported by OpenAI, by kind: prompt or completion",
+    ['model', 'kind'],
+)
+CHUNKS_STORED = Counter(
+    'ai_cooking_chunks_stored',
+    "Document chunks embedded and stored",
+    ['provider'],
+)
+CACHE_LOOKUPS = Counter(
+    'ai_cooking_cache_lookups',
+    "Lookups of work that may already be done, e.g. unchanged pages and already ingested files",
+    ['cache', 'result'],
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    'ai_cooking_log_records_dropped',
+    "Log records dropped because the logging queue was full",
+    ['level'],
+)
+
+_current_stage = ContextVar('metrics_stage', default=None)
+
+
+@contextmanager
+def stage(pipeline: str, name: str):
+    """Time a block into STAGE_SECONDS; exceptions are counted in STAGE_ERRORS and re-raised."""
+    started = time.perf_counter()
+    token = _current_stage.set((pipeline, name))
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(pipeline, name).inc()
+        raise
+    finally:
+        _current_stage.reset(token)
+        STAGE_SECONDS.labels(pipeline, name).observe(time.perf_counter() - started)
+
+
+def current_stage():
+    """(pipeline, stage) of the innermost stage() block of the calling thread, or None."""
+    return _current_stage.get()
+
+
+def record_cache_lookup(cache: str, hit: bool, count: int = 1):
+    if count:
+        CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc(count)
+
+
+class MetricsMiddleware:
+    """Records the duration of every request per URL route, e.g. `api/recipes/search/`."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        # Unmatched paths share one label so scanners cannot create unbounded series
+        route = match.route if match is not None else 'unmatched'
+        STAGE_SECONDS.labels('http', route).observe(time.perf_counter() - started)
+        if response.status_code >= 500:
+            STAGE_ERRORS.labels('http', route).inc()
+        return response
+
+
+def metrics_view(request):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
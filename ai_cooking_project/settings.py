@@ -22,6 +22,8 @@ class SettingsFromEnvironment(BaseSettings):
     DEBUG: bool = False
 
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_SIZE: int = 10000
 
     POSTGRES_DB: str | None
     POSTGRES_USER: str | None
@@ -42,8 +44,32 @@ class SettingsFromEnvironment(BaseSettings):
     SECRET_KEY: str = ""
 
     OPENAI_API_KEY: str = ""
+    OPENAI_BASE_URL: str | None = None
+    OPENAI_EMBEDDING_TOKENS_PER_MINUTE: int = 1_000_000
+    OPENAI_EMBEDDING_REQUESTS_PER_MINUTE: int = 3000
+    OPENAI_CHAT_TOKENS_PER_MINUTE: int = 30_000
+    OPENAI_CHAT_REQUESTS_PER_MINUTE: int = 500
+    OPENAI_IMAGE_REQUESTS_PER_MINUTE: int = 5
+    OPENAI_BULK_RESERVE: float = 0.2
+    OPENAI_MAX_CONCURRENCY: int = 8
+    OPENAI_MAX_RETRIES: int = 5
+    OPENAI_BATCH_MAX_REQUESTS: int = 10_000
+    EMBEDDING_PROVIDER: str = "openai"
+    EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "onnx"
+    EMBEDDING_DIMENSIONS: int | None = None
+    EMBEDDING_BATCH_SIZE: int = 64
+    SEARCH_TITLE_MATCH_THRESHOLD: float = 0.7
+    SEARCH_MMR_LAMBDA: float = 0.7
+    SEARCH_MMR_CANDIDATES: int = 4
+    RELATED_RECIPES_PER_RECIPE: int = 10
+    SUGGEST_REFRESH_SECONDS: float = 30.0
     GOOGLE_SERVICE_ACCOUNT_FILE: str = "service-account.json"
+    GOOGLE_DRIVE_MAX_WORKERS: int = 4
+    GOOGLE_DRIVE_REQUESTS_PER_SECOND: float = 10.0
+    GOOGLE_DRIVE_CHUNK_SIZE: int = 5 * 1024 * 1024
     DOCUMENTS_DIR: str = "documents"
+    INGESTION_WORKERS: int = 2
 
     class Config:
         env_file = ".env"
@@ -80,6 +106,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party apps
     'rest_framework',
@@ -98,6 +125,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Request duration per route, exposed at /metrics
+    'ai_cooking_project.metrics.MetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'ai_cooking_project.urls'
@@ -180,10 +209,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Logging
 
+# Loggers hand records to a queue; a background thread formats them as JSON lines and
+# writes them to the console and the log file (see ai_cooking_project/log.py)
+LOG_FORMAT = config.LOG_FORMAT
+LOG_QUEUE_SIZE = config.LOG_QUEUE_SIZE
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
+        'json': {
+            '()': 'ai_cooking_project.log.JsonFormatter',
+        },
         'verbose': {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
@@ -193,20 +229,32 @@ LOGGING = {
         'console': {
             'level': 'DEBUG',
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': 'json' if LOG_FORMAT == 'json' else 'verbose',
         },
         'file': {
             'level': 'INFO',
             'class': 'logging.FileHandler',
             'filename': 'recipe_generator.log',
-            'formatter': 'verbose',
+            'formatter': 'json' if LOG_FORMAT == 'json' else 'verbose',
+        },
+        # Python 3.12+ queue handler: dictConfig attaches a listener feeding 'console' and 'file'
+        'queue': {
+            'class': 'ai_cooking_project.log.QueueListenerHandler',
+            'handlers': ['console', 'file'],
+            'queue': {'()': 'queue.Queue', 'maxsize': LOG_QUEUE_SIZE},
+            'respect_handler_level': True,
         },
     },
     'loggers': {
-        'recipes.services.recipe_generator_service': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
-            'propagate': True,
+        'recipes': {
+            'handlers': ['queue'],
+            'level': config.LOG_LEVEL,
+            'propagate': False,
+        },
+        'documents_processor': {
+            'handlers': ['queue'],
+            'level': config.LOG_LEVEL,
+            'propagate': False,
         },
     },
 }
@@ -248,12 +296,80 @@ LOGGING = {
 
 DOCUMENTS_DIR = BASE_DIR / 'documents'
 DOCUMENTS_DIR.mkdir(exist_ok=True)  # Create the directory if it doesn't exist
+# Background threads processing uploaded documents
+INGESTION_WORKERS = config.INGESTION_WORKERS
 
 # Google Drive API Settings
 GOOGLE_SERVICE_ACCOUNT_FILE = BASE_DIR / 'service-account.json'
+# Page batches converted concurrently by the batched Drive path
+GOOGLE_DRIVE_MAX_WORKERS = config.GOOGLE_DRIVE_MAX_WORKERS
+# Drive API calls per second shared by all conversion threads (stay below the project quota)
+GOOGLE_DRIVE_REQUESTS_PER_SECOND = config.GOOGLE_DRIVE_REQUESTS_PER_SECOND
+# Bytes per resumable upload / streamed download request (Drive requires a multiple of 256 KiB)
+GOOGLE_DRIVE_CHUNK_SIZE = config.GOOGLE_DRIVE_CHUNK_SIZE
 
 # OpenAI Settings
 OPENAI_API_KEY = config.OPENAI_API_KEY
+# Alternative API endpoint, e.g. the local fake in documents_processor/fakes/openai_server.py
+OPENAI_BASE_URL = config.OPENAI_BASE_URL
+# Embedding tokens per minute shared by the workers of a bulk ingestion (text-embedding-3-small quota)
+OPENAI_EMBEDDING_TOKENS_PER_MINUTE = config.OPENAI_EMBEDDING_TOKENS_PER_MINUTE
+# Quotas enforced by the shared OpenAI scheduler, per model; models not listed are not throttled
+OPENAI_RATE_LIMITS = {
+    'text-embedding-3-small': {
+        'requests_per_minute': config.OPENAI_EMBEDDING_REQUESTS_PER_MINUTE,
+        'tokens_per_minute': config.OPENAI_EMBEDDING_TOKENS_PER_MINUTE,
+    },
+    'gpt-4o': {
+        'requests_per_minute': config.OPENAI_CHAT_REQUESTS_PER_MINUTE,
+        'tokens_per_minute': config.OPENAI_CHAT_TOKENS_PER_MINUTE,
+    },
+    'dall-e-3': {
+        'requests_per_minute': config.OPENAI_IMAGE_REQUESTS_PER_MINUTE,
+    },
+}
+# Share of every quota bulk work (ingestion) leaves free for interactive calls (search, generation)
+OPENAI_BULK_RESERVE = config.OPENAI_BULK_RESERVE
+# Starting and maximum concurrent OpenAI calls per process, lowered when close to the limits
+OPENAI_MAX_CONCURRENCY = config.OPENAI_MAX_CONCURRENCY
+# Retries of 429, 5xx and connection errors, with jittered exponential backoff
+OPENAI_MAX_RETRIES = config.OPENAI_MAX_RETRIES
+# USD per million input/output tokens, or per image, for the usage accounting (OpenAIUsage)
+OPENAI_PRICES = {
+    'text-embedding-3-small': {'input': 0.02},
+    'gpt-4o': {'input': 2.50, 'output': 10.00},
+    'dall-e-3': {'image': 0.040},
+}
+# Batch API calls are billed at this share of the regular price
+OPENAI_BATCH_DISCOUNT = 0.5
+# Embedding requests per Batch API file (OpenAI accepts up to 50,000); results are imported per batch
+OPENAI_BATCH_MAX_REQUESTS = config.OPENAI_BATCH_MAX_REQUESTS
+
+# Embedding Settings
+# 'openai', or a local CPU backend: 'sentence-transformers' (optional extra) or 'hashing' (tests)
+EMBEDDING_PROVIDER = config.EMBEDDING_PROVIDER
+# Model and inference backend ('onnx', 'torch' or 'openvino') of the sentence-transformers provider
+EMBEDDING_MODEL = config.EMBEDDING_MODEL
+EMBEDDING_BACKEND = config.EMBEDDING_BACKEND
+# Vector size of local providers (truncated for sentence-transformers); stored zero-padded to 1536
+EMBEDDING_DIMENSIONS = config.EMBEDDING_DIMENSIONS
+# Texts per inference batch, or per OpenAI embeddings request
+EMBEDDING_BATCH_SIZE = config.EMBEDDING_BATCH_SIZE
+
+# Search Settings
+# Queries matching a whole chunk heading (recipe title) with at least this pg_trgm similarity are
+# answered from the trigram index, without embedding the query. Headings containing the query with
+# this word_similarity join the hybrid search's candidates instead. 0 disables both
+SEARCH_TITLE_MATCH_THRESHOLD = config.SEARCH_TITLE_MATCH_THRESHOLD
+# Maximal marginal relevance: lambda used for recipe generation examples (1 ranks by relevance
+# alone, lower values prefer variety), and candidates fetched per diversified result
+SEARCH_MMR_LAMBDA = config.SEARCH_MMR_LAMBDA
+SEARCH_MMR_CANDIDATES = config.SEARCH_MMR_CANDIDATES
+# Neighbours stored per recipe in the related-recipes graph
+RELATED_RECIPES_PER_RECIPE = config.RELATED_RECIPES_PER_RECIPE
+# Writes in this process refresh the suggest index at once; writes by other processes
+# (management commands, other workers) are picked up within this many seconds
+SUGGEST_REFRESH_SECONDS = config.SUGGEST_REFRESH_SECONDS
 
 # REST Framework Settings
 REST_FRAMEWORK = {
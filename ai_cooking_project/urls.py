@@ -19,10 +19,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('recipes.urls')),
     path('api/', include('documents_processor.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Dodaj to na końcu pliku:
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_cooking_project.settings')
 
 application = get_wsgi_application()
+
+# Imported once the apps are loaded
+from recipes.services.suggest_service import start_suggest_index  # noqa: E402
+
+start_suggest_index()
@@ -0,0 +1,198 @@
+"""
+In-memory fake of the Google Drive v3 API, for exercising GoogleDriveService and the
+batched Drive ingestion path without network access or credentials:
+
+    drive = FakeDriveService(latency=0.2)
+    service = GoogleDriveService(service_factory=lambda: drive)
+    FileProcessorService(google_drive_service=service)
+"""
+import itertools
+import threading
+import time
+from collections import Counter
+from io import BytesIO
+
+import PyPDF2
+from googleapiclient.http import MediaUploadProgress
+
+GOOGLE_DOC_MIME_TYPE = 'application/vnd.google-apps.document'
+
+
+class FakeDriveError(Exception):
+    pass
+
+
+class _FakeRequest:
+    def __init__(self, drive, method, handler):
+        self._drive = drive
+        self._method = method
+        self._handler = handler
+
+    def execute(self):
+        return self._drive._call(self._method, self._handler)
+
+
+class _FakeUploadRequest:
+    """files().create(); resumable media is sent with next_chunk() like the real HttpRequest."""
+
+    def __init__(self, drive, body, media_body):
+        self._drive = drive
+        self._name = (body or {}).get('name', 'untitled')
+        self._media = media_body
+        self._received = BytesIO()
+
+    def execute(self):
+        def handler():
+            data = self._media.getbytes(0, self._media.size()) if self._media is not None else b''
+            return self._store(data)
+        return self._drive._call('create', handler)
+
+    def next_chunk(self):
+        offset = self._received.tell()
+
+        def handler():
+            chunk = self._media.getbytes(offset, self._media.chunksize())
+            self._received.write(chunk)
+            with self._drive._lock:
+                self._drive.max_chunk_bytes = max(self._drive.max_chunk_bytes, len(chunk))
+            if self._received.tell() < self._media.size():
+                return MediaUploadProgress(self._received.tell(), self._media.size()), None
+            return None, self._store(self._received.getvalue())
+        return self._drive._call('create' if offset == 0 else 'upload_chunk', handler)
+
+    def _store(self, data):
+        mime_type = self._media.mimetype() if self._media is not None else None
+        return self._drive._store(self._name, mime_type, data)
+
+
+class _FakeResponse(dict):
+    def __init__(self, status, headers):
+        super().__init__(headers)
+        self.status = status
+
+
+class _FakeHttp:
+    """Answers the ranged GETs MediaIoBaseDownload sends for a get_media request."""
+
+    def __init__(self, drive, file_id):
+        self._drive = drive
+        self._file_id = file_id
+
+    def request(self, uri, method='GET', headers=None, **kwargs):
+        def handler():
+            data = self._drive._get(self._file_id)['data']
+            first, last = (headers or {})['range'].removeprefix('bytes=').split('-')
+            content = data[int(first):int(last) + 1]
+            with self._drive._lock:
+                self._drive.max_chunk_bytes = max(self._drive.max_chunk_bytes, len(content))
+            content_range = f"bytes {first}-{int(first) + len(content) - 1}/{len(data)}"
+            return _FakeResponse(206, {'content-range': content_range}), content
+        return self._drive._call('get_media', handler)
+
+
+class _FakeMediaRequest(_FakeRequest):
+    def __init__(self, drive, file_id):
+        super().__init__(drive, 'get_media', lambda: drive._get(file_id)['data'])
+        self.uri = f"https://drive.example/files/{file_id}?alt=media"
+        self.headers = {}
+        self.http = _FakeHttp(drive, file_id)
+
+
+class _FakeFiles:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def create(self, body=None, media_body=None, fields=None):
+        return _FakeUploadRequest(self._drive, body, media_body)
+
+    def copy(self, fileId=None, body=None):
+        def handler():
+            source = self._drive._get(fileId)
+            target_type = (body or {}).get('mimeType', source['mimeType'])
+            copied = self._drive._store(source['name'], target_type, source['data'])
+            if target_type == GOOGLE_DOC_MIME_TYPE:
+                self._drive.files_by_id[copied['id']]['text'] = self._drive.extract_text(source['data'])
+            return copied
+        return _FakeRequest(self._drive, 'copy', handler)
+
+    def export(self, fileId=None, mimeType=None):
+        def handler():
+            return self._drive._get(fileId).get('text', '').encode('utf-8')
+        return _FakeRequest(self._drive, 'export', handler)
+
+    def delete(self, fileId=None):
+        def handler():
+            with self._drive._lock:
+                if self._drive.files_by_id.pop(fileId, None) is None:
+                    raise FakeDriveError(f"File not found: {fileId}")
+            return ''
+        return _FakeRequest(self._drive, 'delete', handler)
+
+    def get_media(self, fileId=None):
+        return _FakeMediaRequest(self._drive, fileId)
+
+
+class FakeDriveService:
+    """
+    Stand-in for the resource returned by `build('drive', 'v3')`.
+
+    It is thread-safe, so one instance can back every worker thread. Each call sleeps
+    `latency` seconds to mimic a round-trip, and `fail_every=n` makes every n-th call
+    raise. Resumable uploads and media downloads are served chunk by chunk.
+    `calls`, `max_concurrency`, `max_chunk_bytes` and `files_by_id` can be inspected
+    afterwards, e.g. to check that no file was left behind.
+    """
+
+    def __init__(self, latency: float = 0.0, fail_every: int = 0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.files_by_id = {}
+        self.calls = Counter()
+        self.max_concurrency = 0
+        self.max_chunk_bytes = 0
+        self._active = 0
+        self._call_count = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def files(self):
+        return _FakeFiles(self)
+
+    def add_file(self, name: str, data: bytes, mime_type: str = 'application/pdf') -> str:
+        """Put a file into the fake Drive, e.g. for process_drive_document, and return its id."""
+        return self._store(name, mime_type, data)['id']
+
+    @staticmethod
+    def extract_text(pdf_bytes: bytes) -> str:
+        reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+        return "\n".join(page.extract_text() or '' for page in reader.pages)
+
+    def _call(self, method, handler):
+        with self._lock:
+            self.calls[method] += 1
+            self._call_count += 1
+            self._active += 1
+            self.max_concurrency = max(self.max_concurrency, self._active)
+            should_fail = self.fail_every and self._call_count % self.fail_every == 0
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if should_fail:
+                raise FakeDriveError(f"Injected failure in {method}")
+            return handler()
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _store(self, name, mime_type, data):
+        with self._lock:
+            file_id = f"fake-{next(self._ids)}"
+            self.files_by_id[file_id] = {'name': name, 'mimeType': mime_type, 'data': data}
+        return {'id': file_id, 'name': name, 'webViewLink': f"https://drive.example/{file_id}"}
+
+    def _get(self, file_id):
+        with self._lock:
+            try:
+                return self.files_by_id[file_id]
+            except KeyError:
+                raise FakeDriveError(f"File not found: {file_id}")
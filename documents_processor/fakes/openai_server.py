@@ -0,0 +1,315 @@
+"""
+Local HTTP fake of the OpenAI endpoints used by document ingestion: embeddings, files and
+batches. Embeddings are deterministic pseudo-random unit vectors derived from the input
+text, so identical texts always get identical vectors.
+
+Run it standalone and point the application at it:
+
+    python -m documents_processor.fakes.openai_server --port 8765 --batch-delay 5
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python manage.py collect_embedding_batches --wait
+
+or in-process, e.g. from a benchmark:
+
+    with FakeOpenAIServer(latency=0.05, requests_per_minute=3000) as server:
+        client = OpenAI(api_key='fake', base_url=server.base_url)
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DIMENSIONS = 1536
+
+
+def fake_embedding(text: str, dimensions: int = DIMENSIONS) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token, close enough for usage accounting in tests
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAIServer:
+    """
+    Threaded fake of the OpenAI API.
+
+    Args:
+        latency: Seconds every request takes
+        error_rate: Share of requests answered with a 500
+        requests_per_minute: If set, requests beyond this rate get a 429 with Retry-After
+        batch_delay: Seconds a batch stays in progress before it is completed
+        batch_error_rate: Share of batch requests that fail individually
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+                 requests_per_minute: int = None, batch_delay: float = 0.0, batch_error_rate: float = 0.0,
+                 seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.batch_delay = batch_delay
+        self.batch_error_rate = batch_error_rate
+        self.files = {}
+        self.batches = {}
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._allowance = float(requests_per_minute or 0)
+        self._allowance_at = time.monotonic()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'FakeOpenAIServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}-{next(self._ids)}"
+
+    def _throttle(self):
+        """Returns the rate-limit headers and, when over the limit, the seconds to wait."""
+        if not self.requests_per_minute:
+            return {}, 0.0
+        with self._lock:
+            now = time.monotonic()
+            rate = self.requests_per_minute / 60
+            self._allowance = min(self.requests_per_minute, self._allowance + (now - self._allowance_at) * rate)
+            self._allowance_at = now
+            headers = {
+                'x-ratelimit-limit-requests': str(self.requests_per_minute),
+                'x-ratelimit-remaining-requests': str(max(0, int(self._allowance) - 1)),
+            }
+            if self._allowance < 1:
+                return headers, (1 - self._allowance) / rate
+            self._allowance -= 1
+            return headers, 0.0
+
+    # Endpoint implementations, each returning (status, JSON-serializable body or bytes)
+
+    def embeddings(self, body):
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(text)
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii')
+            else:
+                embedding = vector.tolist()
+            data.append({'object': 'embedding', 'index': index, 'embedding': embedding})
+        tokens = sum(estimate_tokens(text) for text in inputs)
+        return 200, {
+            'object': 'list',
+            'data': data,
+            'model': body['model'],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        }
+
+    def create_file(self, content_type: str, payload: bytes):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + payload
+        )
+        fields, data, filename = {}, b'', 'upload'
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'file':
+                data = part.get_payload(decode=True)
+                filename = part.get_filename() or filename
+            else:
+                fields[name] = part.get_content()
+        return 200, self._store_file(filename, data, fields.get('purpose', 'batch'))
+
+    def _store_file(self, filename: str, data: bytes, purpose: str):
+        file_object = {
+            'id': self._next_id('file'), 'object': 'file', 'bytes': len(data), 'created_at': int(time.time()),
+            'filename': filename, 'purpose': purpose, 'status': 'processed',
+        }
+        with self._lock:
+            self.files[file_object['id']] = (file_object, data)
+        return file_object
+
+    def create_batch(self, body):
+        if body['input_file_id'] not in self.files:
+            return 404, {'error': {'message': f"No such file: {body['input_file_id']}", 'type': 'invalid_request_error'}}
+        batch = {
+            'id': self._next_id('batch'), 'object': 'batch', 'endpoint': body['endpoint'],
+            'input_file_id': body['input_file_id'], 'completion_window': body['completion_window'],
+            'status': 'validating', 'created_at': int(time.time()), 'output_file_id': None, 'error_file_id': None,
+            'errors': None, 'metadata': body.get('metadata'),
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+        }
+        with self._lock:
+            self.batches[batch['id']] = (batch, time.monotonic())
+        return 200, batch
+
+    def retrieve_batch(self, batch_id: str):
+        with self._lock:
+            if batch_id not in self.batches:
+                return 404, {'error': {'message': f"No such batch: {batch_id}", 'type': 'invalid_request_error'}}
+            batch, submitted_at = self.batches[batch_id]
+        if batch['status'] in ('validating', 'in_progress'):
+            if time.monotonic() - submitted_at >= self.batch_delay:
+                self._run_batch(batch)
+            else:
+                batch['status'] = 'in_progress'
+        return 200, batch
+
+    def _run_batch(self, batch):
+        _, input_data = self.files[batch['input_file_id']]
+        output_lines, error_lines = [], []
+        for line in input_data.decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            line_id = self._next_id('batch_req')
+            if self._random.random() < self.batch_error_rate:
+                error_lines.append({
+                    'id': line_id, 'custom_id': request['custom_id'],
+                    'response': {'status_code': 500, 'body': {'error': {'message': 'Injected failure', 'type': 'server_error'}}},
+                    'error': None,
+                })
+                continue
+            status, body = self.embeddings(request['body'])
+            output_lines.append({
+                'id': line_id, 'custom_id': request['custom_id'],
+                'response': {'status_code': status, 'request_id': line_id, 'body': body},
+                'error': None,
+            })
+
+        def to_file(lines, suffix):
+            if not lines:
+                return None
+            data = ''.join(json.dumps(line) + '\n' for line in lines).encode('utf-8')
+            return self._store_file(f"{batch['id']}_{suffix}.jsonl", data, 'batch_output')['id']
+
+        batch['output_file_id'] = to_file(output_lines, 'output')
+        batch['error_file_id'] = to_file(error_lines, 'error')
+        batch['request_counts'] = {
+            'total': len(output_lines) + len(error_lines), 'completed': len(output_lines), 'failed': len(error_lines),
+        }
+        batch['completed_at'] = int(time.time())
+        batch['status'] = 'completed'
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def _dispatch(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = self.rfile.read(length) if length else b''
+                path = self.path.split('?')[0]
+                route = re.sub(r'/(file|batch)-\d+', r'/{\1}', path)
+                server.calls[f"{method} {route}"] += 1
+
+                if server.latency:
+                    time.sleep(server.latency)
+                headers, wait = server._throttle()
+                if wait:
+                    headers['retry-after-ms'] = str(int(wait * 1000) + 1)
+                    return self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}}, headers)
+                if server.error_rate and server._random.random() < server.error_rate:
+                    return self._send(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}}, headers)
+
+                try:
+                    if method == 'POST' and path == '/v1/embeddings':
+                        status, body = server.embeddings(json.loads(payload))
+                    elif method == 'POST' and path == '/v1/files':
+                        status, body = server.create_file(self.headers['Content-Type'], payload)
+                    elif method == 'POST' and path == '/v1/batches':
+                        status, body = server.create_batch(json.loads(payload))
+                    elif method == 'GET' and (match := re.fullmatch(r'/v1/batches/([\w-]+)', path)):
+                        status, body = server.retrieve_batch(match.group(1))
+                    elif method == 'GET' and (match := re.fullmatch(r'/v1/files/([\w-]+)/content', path)):
+                        status, body = 200, server.files[match.group(1)][1]
+                    elif method == 'GET' and (match := re.fullmatch(r'/v1/files/([\w-]+)', path)):
+                        status, body = 200, server.files[match.group(1)][0]
+                    else:
+                        status, body = 404, {'error': {'message': f"Unknown route {method} {path}", 'type': 'invalid_request_error'}}
+                except KeyError as e:
+                    status, body = 404, {'error': {'message': f"Not found: {e}", 'type': 'invalid_request_error'}}
+                self._send(status, body, headers)
+
+            def _send(self, status, body, headers):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/octet-stream' if isinstance(body, bytes) else 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--requests-per-minute', type=int)
+    parser.add_argument('--batch-delay', type=float, default=0.0)
+    parser.add_argument('--batch-error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        host=args.host, port=args.port, latency=args.latency, error_rate=args.error_rate,
+        requests_per_minute=args.requests_per_minute, batch_delay=args.batch_delay,
+        batch_error_rate=args.batch_error_rate,
+    )
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
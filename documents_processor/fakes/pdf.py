@@ -0,0 +1,110 @@
+"""
+Synthetic multi-page cookbook PDFs for ingestion benchmarks, written without any PDF
+library: one recipe per page, with a title, ingredients and numbered steps.
+
+    data = cookbook_pdf(pages=200, seed=7)
+
+The same (pages, seed) always gives the same bytes, and different seeds give different
+files, so every generated cookbook is ingested instead of being skipped as a duplicate.
+The standard Helvetica font has no glyphs for most Polish letters, so the text is written
+with them folded to ASCII (ą -> a, ł -> l); PyPDF2 extracts it back as written.
+"""
+import random
+import unicodedata
+from typing import List
+
+DISHES = [
+    "Barszcz czerwony", "Żurek na zakwasie", "Rosół z kury", "Bigos myśliwski", "Pierogi ruskie",
+    "Gołąbki w sosie pomidorowym", "Placki ziemniaczane", "Kopytka", "Naleśniki z twarogiem", "Sernik krakowski",
+    "Szarlotka", "Makowiec", "Kotlet schabowy", "Zrazy wołowe", "Fasolka po bretońsku",
+    "Zupa ogórkowa", "Kapuśniak", "Racuchy z jabłkami", "Leniwe", "Kluski śląskie",
+]
+STYLES = ["babci", "wegański", "szybki", "świąteczny", "domowy", "na ostro", "bez glutenu", "z pieca"]
+INGREDIENTS = [
+    "mąka pszenna", "cukier", "masło", "jajka", "sól", "pieprz", "cebula", "czosnek", "ziemniaki", "kapusta",
+    "śmietana 18%", "twaróg", "marchew", "buraki", "koperek", "natka pietruszki", "grzyby suszone", "boczek",
+    "kiełbasa", "wołowina", "łopatka wieprzowa", "udka z kurczaka", "ogórki kiszone", "pomidory", "jabłka",
+    "śliwki", "miód", "mleko", "drożdże", "olej rzepakowy", "liść laurowy", "ziele angielskie", "majeranek",
+]
+UNITS = ["g", "kg", "ml", "szklanki", "łyżki", "łyżeczki", "szt."]
+STEPS = [
+    "{a} pokroić w kostkę i podsmażyć na {b} przez {n} minut.",
+    "Dodać {a} i {b}, wymieszać i gotować pod przykryciem około {n} minut.",
+    "Piekarnik nagrzać do {t} stopni, piec {n} minut do zrumienienia.",
+    "{a} zetrzeć na tarce, odcisnąć i połączyć z {b}.",
+    "Doprawić solą, pieprzem i odrobiną {a}, odstawić na {n} minut.",
+    "Ciasto rozwałkować, wykrawać krążki i nakładać farsz z {a}.",
+    "Podawać z {a} i posypać {b}.",
+]
+LINES_PER_PAGE = 52
+
+
+def fold(text: str) -> str:
+    """Polish text folded to the characters of the standard PDF fonts."""
+    text = unicodedata.normalize('NFKD', text.replace('ł', 'l').replace('Ł', 'L'))
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def recipe_lines(rng: random.Random, number: int) -> List[str]:
+    lines = [f"{number}. {rng.choice(DISHES)} ({rng.choice(STYLES)})", ""]
+    lines.append(f"Porcje: {rng.randint(2, 8)}, czas przygotowania: {rng.randint(2, 24) * 5} minut")
+    lines.append("")
+    lines.append("Składniki:")
+    for ingredient in rng.sample(INGREDIENTS, rng.randint(8, 14)):
+        lines.append(f"- {ingredient}: {rng.randint(1, 50) * 10} {rng.choice(UNITS)}")
+    lines.append("")
+    lines.append("Przygotowanie:")
+    step = 1
+    while len(lines) < LINES_PER_PAGE - 2:
+        template = rng.choice(STEPS)
+        lines.append(f"{step}. " + template.format(
+            a=rng.choice(INGREDIENTS), b=rng.choice(INGREDIENTS), n=rng.randint(2, 60), t=rng.choice([160, 180, 200]),
+        ))
+        step += 1
+    lines.append("")
+    lines.append(f"Wskazówka: {rng.choice(STEPS).format(a=rng.choice(INGREDIENTS), b=rng.choice(INGREDIENTS), n=5, t=180)}")
+    return lines
+
+
+def cookbook_pdf(pages: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    return write_pdf([recipe_lines(rng, number) for number in range(1, pages + 1)])
+
+
+def _escape(line: str) -> bytes:
+    text = fold(line).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('latin-1', 'replace')
+
+
+def write_pdf(pages: List[List[str]]) -> bytes:
+    """A minimal PDF 1.4 file with one page of Helvetica text lines per list of lines."""
+    objects = [
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"",  # Page tree, written once the page objects are numbered
+    ]
+    font_id, pages_id = 1, 2
+    kids = []
+    for lines in pages:
+        content = b"BT /F1 10 Tf 50 800 Td 14 TL " + b" ".join(b"(" + _escape(line) + b") '" for line in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, len(objects), font_id)
+        )
+        kids.append(len(objects))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    catalog_id = len(objects)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref)
+    return bytes(output)
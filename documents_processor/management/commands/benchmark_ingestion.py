@@ -0,0 +1,59 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents_processor.services.ingestion_benchmark_service import INGESTION_MODES, IngestionBenchmark
+
+
+class Command(BaseCommand):
+    """Benchmark document ingestion against local fakes of OpenAI and Google Drive"""
+
+    help = (
+        "Ingest synthetic cookbook PDFs with the PyPDF2 and batched Google Drive paths, with OpenAI "
+        "and Drive replaced by local fakes, and report pages/s, peak RSS and time per stage "
+        "including database time. Benchmark documents are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(INGESTION_MODES),
+                            help="Comma-separated ingestion paths: pypdf2, google_drive_batched (default: both)")
+        parser.add_argument('--documents', type=int, default=5, help="PDFs ingested per mode")
+        parser.add_argument('--pages', type=int, default=50, help="Pages per PDF")
+        parser.add_argument('--drive-batch-size', type=int, default=20, help="Pages per Google Drive batch")
+        parser.add_argument('--openai-latency', type=float, default=0.05, help="Seconds per fake OpenAI request")
+        parser.add_argument('--openai-rpm', type=int, help="Requests per minute before the fake OpenAI answers 429")
+        parser.add_argument('--openai-error-rate', type=float, default=0.0,
+                            help="Share of fake OpenAI requests answered with a 500")
+        parser.add_argument('--drive-latency', type=float, default=0.2, help="Seconds per fake Drive call")
+        parser.add_argument('--drive-fail-every', type=int, default=0, help="Make every n-th fake Drive call fail")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the generated PDFs")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',')]
+        unknown = set(modes) - set(INGESTION_MODES)
+        if unknown:
+            raise CommandError(f"Unknown ingestion mode(s): {', '.join(sorted(unknown))}")
+
+        benchmark = IngestionBenchmark(
+            modes=modes,
+            documents=options['documents'],
+            pages=options['pages'],
+            drive_batch_size=options['drive_batch_size'],
+            openai_latency=options['openai_latency'],
+            openai_requests_per_minute=options['openai_rpm'],
+            openai_error_rate=options['openai_error_rate'],
+            drive_latency=options['drive_latency'],
+            drive_fail_every=options['drive_fail_every'],
+            seed=options['seed'],
+            progress=lambda message: self.stderr.write(message),
+        )
+        report = benchmark.run()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output)
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
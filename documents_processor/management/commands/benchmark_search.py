@@ -0,0 +1,73 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents_processor.services.search_benchmark_service import INDEX_TYPES, IndexConfig, SearchBenchmark
+
+
+class Command(BaseCommand):
+    """Benchmark vector, hybrid and batch search latency on synthetic corpora"""
+
+    help = (
+        "Load synthetic chunk corpora of several sizes and report p50/p95/p99 latency of vector-only, "
+        "hybrid and batch search under each vector index configuration. Runs in a transaction that is "
+        "rolled back, but locks the chunk table meanwhile: use a development database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help="Comma-separated corpus sizes in chunks (default: 10000,100000,1000000)")
+        parser.add_argument('--indexes', default=','.join(INDEX_TYPES),
+                            help="Comma-separated index configurations: exact, ivfflat, hnsw (default: all)")
+        parser.add_argument('--queries', type=int, default=100, help="Timed queries per search mode")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed queries run first")
+        parser.add_argument('--limit', type=int, default=5, help="Results per query")
+        parser.add_argument('--batch-size', type=int, default=16, help="Queries per batch search call")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic corpus and queries")
+        parser.add_argument('--ivfflat-lists', type=int, default=0,
+                            help="IVFFlat lists; 0 sizes them from the corpus (rows / 1000, sqrt(rows) above 1M)")
+        parser.add_argument('--ivfflat-probes', type=int, default=0, help="IVFFlat probes; 0 uses sqrt(lists)")
+        parser.add_argument('--hnsw-m', type=int, default=16)
+        parser.add_argument('--hnsw-ef-construction', type=int, default=64)
+        parser.add_argument('--hnsw-ef-search', type=int, default=40)
+        parser.add_argument('--maintenance-work-mem', default='1GB', help="Memory for index builds")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        kinds = [kind.strip() for kind in options['indexes'].split(',')]
+        unknown = set(kinds) - set(INDEX_TYPES)
+        if unknown:
+            raise CommandError(f"Unknown index configuration(s): {', '.join(sorted(unknown))}")
+
+        parameters = {
+            'exact': ({}, {}),
+            'ivfflat': ({'lists': options['ivfflat_lists']}, {'probes': options['ivfflat_probes']}),
+            'hnsw': (
+                {'m': options['hnsw_m'], 'ef_construction': options['hnsw_ef_construction']},
+                {'ef_search': options['hnsw_ef_search']},
+            ),
+        }
+        benchmark = SearchBenchmark(
+            sizes=sizes,
+            index_configs=[IndexConfig(kind, *parameters[kind]) for kind in kinds],
+            queries=options['queries'],
+            warmup=options['warmup'],
+            limit=options['limit'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            maintenance_work_mem=options['maintenance_work_mem'],
+            progress=lambda message: self.stderr.write(message),
+        )
+        report = benchmark.run()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output)
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
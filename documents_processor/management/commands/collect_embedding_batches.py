@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents_processor.services.file_processor_service import FileProcessorService
+
+
+class Command(BaseCommand):
+    """Import the results of finished OpenAI Batch API embedding jobs"""
+
+    help = (
+        "Poll the embedding batches submitted by the Batch API ingestion mode and store the chunks "
+        "of finished ones. Failed or expired requests are embedded synchronously."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document', help="Only collect the batches of this document id")
+        parser.add_argument('--wait', action='store_true', help="Keep polling until no batch is pending")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between polls with --wait")
+
+    def handle(self, *args, **options):
+        processor = FileProcessorService()
+        while True:
+            summary = processor.collect_embedding_batches(document_id=options['document'])
+            self.stdout.write(
+                f"{summary['imported']} batches imported ({summary['chunks']} chunks, "
+                f"{summary['fallback_chunks']} embedded synchronously), {summary['pending']} pending, "
+                f"{summary['errors']} failed"
+            )
+            # Batches that failed to import are retried by the next run, not in a tight loop
+            if not options['wait'] or not summary['pending']:
+                break
+            time.sleep(options['interval'])
+
+        if summary['errors']:
+            self.stdout.write(self.style.WARNING("Some batches could not be imported, they will be retried"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents_processor.services.retrieval_eval_service import (
+    PROVIDER_KINDS, QUERY_SOURCES, RetrievalEvaluation, load_queries, resolve_provider,
+)
+from documents_processor.services.search_benchmark_service import INDEX_TYPES, IndexConfig
+
+
+class Command(BaseCommand):
+    """Evaluate recall@k and MRR of approximate vector search against exact search"""
+
+    help = (
+        "Search a query set exactly and through each vector index configuration, for each embedding "
+        "provider, and report recall@k, MRR and latency. Exits with an error when the recall of any "
+        "configuration is below --min-recall. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', default='titles',
+                            help="Query set: 'titles' (recipe titles), 'synthetic' (with --synthetic-size) "
+                                 "or a file with one query per line (default: titles)")
+        parser.add_argument('--max-queries', type=int, default=200, help="Queries evaluated at most")
+        parser.add_argument('--providers', default='configured',
+                            help=f"Comma-separated embedding providers: {', '.join(PROVIDER_KINDS)} (default: configured)")
+        parser.add_argument('--indexes', default='ivfflat,hnsw',
+                            help="Comma-separated index configurations: exact, ivfflat, hnsw (default: ivfflat,hnsw)")
+        parser.add_argument('--k', type=int, default=10, help="Neighbours compared per query")
+        parser.add_argument('--min-recall', type=float, default=0.9, help="Lowest acceptable recall@k")
+        parser.add_argument('--synthetic-size', type=int, default=0,
+                            help="Evaluate a synthetic corpus of this many chunks instead of the stored chunks")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic corpus and queries")
+        parser.add_argument('--ivfflat-lists', type=int, default=0,
+                            help="IVFFlat lists; 0 sizes them from the corpus (rows / 1000, sqrt(rows) above 1M)")
+        parser.add_argument('--ivfflat-probes', type=int, default=0, help="IVFFlat probes; 0 uses sqrt(lists)")
+        parser.add_argument('--hnsw-m', type=int, default=16)
+        parser.add_argument('--hnsw-ef-construction', type=int, default=64)
+        parser.add_argument('--hnsw-ef-search', type=int, default=40)
+        parser.add_argument('--maintenance-work-mem', default='1GB', help="Memory for index builds")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        kinds = [kind.strip() for kind in options['indexes'].split(',')]
+        unknown = set(kinds) - set(INDEX_TYPES)
+        if unknown:
+            raise CommandError(f"Unknown index configuration(s): {', '.join(sorted(unknown))}")
+        parameters = {
+            'exact': ({}, {}),
+            'ivfflat': ({'lists': options['ivfflat_lists']}, {'probes': options['ivfflat_probes']}),
+            'hnsw': (
+                {'m': options['hnsw_m'], 'ef_construction': options['hnsw_ef_construction']},
+                {'ef_search': options['hnsw_ef_search']},
+            ),
+        }
+
+        synthetic_size = options['synthetic_size']
+        source = options['queries']
+        if source == 'synthetic' and not synthetic_size:
+            raise CommandError("--queries synthetic needs --synthetic-size")
+        if source not in QUERY_SOURCES and not Path(source).is_file():
+            raise CommandError(f"Query file {source} not found")
+
+        providers = None
+        if not synthetic_size:
+            try:
+                providers = [resolve_provider(kind.strip()) for kind in options['providers'].split(',')]
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        queries = None
+        if source != 'synthetic':
+            queries = load_queries(source, options['max_queries'])
+            if not queries:
+                raise CommandError("The query set is empty")
+
+        evaluation = RetrievalEvaluation(
+            index_configs=[IndexConfig(kind, *parameters[kind]) for kind in kinds],
+            queries=queries,
+            providers=providers,
+            k=options['k'],
+            min_recall=options['min_recall'],
+            synthetic_size=synthetic_size,
+            synthetic_queries=options['max_queries'],
+            seed=options['seed'],
+            maintenance_work_mem=options['maintenance_work_mem'],
+            progress=lambda message: self.stderr.write(message),
+        )
+        report = evaluation.run()
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output)
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if not report['passed']:
+            failed = [f"{result['provider']}/{result['index']}" for result in report['results']
+                      if not result.get('passed', True)]
+            raise CommandError(f"Recall@{options['k']} below {options['min_recall']} for {', '.join(failed)}")
@@ -0,0 +1,21 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from documents_processor.services.corpus_snapshot_service import CorpusSnapshotService
+
+
+class Command(BaseCommand):
+    """Export documents, pages and chunks as a snapshot directory for import_corpus"""
+
+    help = "Export the document corpus as JSONL metadata plus a float32 embedding matrix"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Snapshot directory to write")
+
+    def handle(self, *args, **options):
+        manifest = CorpusSnapshotService().export_corpus(Path(options['directory']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {manifest['documents']} documents, {manifest['pages']} pages and "
+            f"{manifest['chunks']} chunks to {options['directory']}"
+        ))
@@ -0,0 +1,160 @@
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from documents_processor.services.file_processor_service import FileProcessorService
+from documents_processor.services.openai_scheduler import BULK
+from documents_processor.services.openai_service import OpenAIService
+from documents_processor.services.rate_limiter import SharedTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Processor of the current worker process, created by the pool initializer
+_processor = None
+
+
+def _init_worker(rate_limiter: SharedTokenBucket):
+    global _processor
+    _processor = FileProcessorService(openai_service=OpenAIService(rate_limiter=rate_limiter, priority=BULK))
+
+
+def _ingest_file(file_path: str, use_google_drive: bool, batch_api: bool = False) -> dict:
+    """Register and process one file in a worker process; never raises, failures are reported."""
+    started = time.monotonic()
+    result = {'file': file_path, 'pages': 0, 'chunks': 0, 'tokens': 0}
+    try:
+        path = Path(file_path)
+        document, needs_processing = _processor.register_document(path, path.name)
+        result['document_id'] = str(document.id)
+        if not needs_processing:
+            result['status'] = 'skipped'
+        elif batch_api:
+            submitted = _processor.process_document_with_batch_api(str(document.id))
+            result['pages'] = submitted['pages']
+            document.refresh_from_db()
+            result['status'] = 'submitted' if submitted['batches'] else document.status
+        else:
+            result.update(_processor.process_document(str(document.id), use_google_drive=use_google_drive))
+            document.refresh_from_db()
+            result['status'] = document.status
+    except Exception as e:
+        logger.error(f"Error ingesting {file_path}: {e}")
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['seconds'] = round(time.monotonic() - started, 2)
+    return result
+
+
+class Command(BaseCommand):
+    """Ingest every PDF in a directory using a pool of worker processes"""
+
+    help = (
+        "Ingest all PDFs under a directory (DOCUMENTS_DIR by default). Files that were already "
+        "ingested are skipped; all workers share one embedding token budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Directory to scan, defaults to DOCUMENTS_DIR")
+        parser.add_argument('--workers', type=int, default=4, help="Number of worker processes")
+        parser.add_argument(
+            '--tokens-per-minute', type=int, default=settings.OPENAI_EMBEDDING_TOKENS_PER_MINUTE,
+            help="Embedding tokens per minute shared by all workers"
+        )
+        parser.add_argument('--use-google-drive', action='store_true', help="Extract text with Google Drive")
+        parser.add_argument(
+            '--batch-api', action='store_true',
+            help="Submit the embeddings to the OpenAI Batch API; import them later with collect_embedding_batches"
+        )
+        parser.add_argument('--report', help="Write the summary report as JSON to this file")
+
+    def handle(self, *args, **options):
+        directory = Path(options['path'] or settings.DOCUMENTS_DIR)
+        if not directory.is_dir():
+            raise CommandError(f"{directory} is not a directory")
+
+        files = sorted(
+            path for path in directory.rglob('*')
+            if path.suffix.lower() == '.pdf' and path.is_file() and not path.name.startswith('.')
+        )
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Found {len(files)} PDF files in {directory}, ingesting with {workers} workers")
+        if not files:
+            return
+        if options['batch_api'] and options['use_google_drive']:
+            raise CommandError("--batch-api extracts text with PyPDF2 and cannot be combined with --use-google-drive")
+
+        # Workers are forked; they must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        rate_limiter = SharedTokenBucket(rate=options['tokens_per_minute'] / 60, context=context)
+
+        results = []
+        totals = {'pages': 0, 'chunks': 0, 'tokens': 0}
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(rate_limiter,)) as executor:
+            futures = [executor.submit(_ingest_file, str(path), options['use_google_drive'], options['batch_api']) for path in files]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                for key in totals:
+                    totals[key] += result[key]
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"[{len(results)}/{len(files)}] {result['status']:<9} {result['file']} "
+                    f"({result['pages']} pages, {result['chunks']} chunks, {result['seconds']}s) | "
+                    f"{totals['pages'] / elapsed:.1f} pages/s, {totals['chunks'] / elapsed:.1f} chunks/s, "
+                    f"{totals['tokens'] / elapsed:.0f} tokens/s"
+                )
+
+        elapsed = time.monotonic() - started
+        report = self._summary(results, totals, elapsed, workers)
+        self._print_summary(report)
+        if options['report']:
+            Path(options['report']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Report written to {options['report']}")
+
+    @staticmethod
+    def _summary(results, totals, elapsed, workers) -> dict:
+        by_status = {}
+        for result in results:
+            by_status[result['status']] = by_status.get(result['status'], 0) + 1
+        return {
+            'files': len(results),
+            'by_status': by_status,
+            'workers': workers,
+            'seconds': round(elapsed, 2),
+            **totals,
+            'pages_per_second': round(totals['pages'] / elapsed, 2),
+            'chunks_per_second': round(totals['chunks'] / elapsed, 2),
+            'tokens_per_second': round(totals['tokens'] / elapsed, 2),
+            'errors': [
+                {'file': result['file'], 'error': result.get('error', 'no chunks stored')}
+                for result in results if result['status'] == 'error'
+            ],
+            'results': sorted(results, key=lambda result: result['file']),
+        }
+
+    def _print_summary(self, report):
+        self.stdout.write("")
+        self.stdout.write(f"Ingested {report['files']} files in {report['seconds']}s: " + ", ".join(
+            f"{count} {status}" for status, count in sorted(report['by_status'].items())
+        ))
+        self.stdout.write(
+            f"{report['pages']} pages, {report['chunks']} chunks, {report['tokens']} tokens | "
+            f"{report['pages_per_second']} pages/s, {report['chunks_per_second']} chunks/s, "
+            f"{report['tokens_per_second']} tokens/s"
+        )
+        for error in report['errors']:
+            self.stdout.write(self.style.ERROR(f"  {error['file']}: {error['error']}"))
+        if report['errors']:
+            self.stdout.write(self.style.WARNING(f"{len(report['errors'])} files failed"))
+        else:
+            self.stdout.write(self.style.SUCCESS("All files ingested"))
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents_processor", "0004_add_content_tsv_trigger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storeddocument",
+            name="file_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="page_number",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="DocumentPage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("page_number", models.PositiveIntegerField()),
+                ("text_hash", models.CharField(max_length=64)),
+                ("chunk_count", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pages",
+                        to="documents_processor.storeddocument",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["page_number"],
+                "unique_together": {("document", "page_number")},
+            },
+        ),
+    ]
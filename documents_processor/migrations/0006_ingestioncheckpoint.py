@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2026-10-19 10:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents_processor", "0005_document_hashes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestionCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "mode",
+                    models.CharField(
+                        choices=[
+                            ("pypdf2", "PyPDF2"),
+                            ("google_drive", "Google Drive"),
+                            ("google_drive_batched", "Google Drive (batched)"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("batch_size", models.PositiveIntegerField(blank=True, null=True)),
+                ("last_completed_page", models.PositiveIntegerField(default=0)),
+                ("next_chunk_index", models.PositiveIntegerField(default=0)),
+                ("current_page", models.PositiveIntegerField(blank=True, null=True)),
+                ("current_page_hash", models.CharField(blank=True, default="", max_length=64)),
+                ("current_page_chunks", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "document",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="checkpoint",
+                        to="documents_processor.storeddocument",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.6 on 2026-10-19 11:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents_processor", "0007_ratelimitbucket"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmbeddingBatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("batch_id", models.CharField(max_length=64, unique=True)),
+                ("input_file_id", models.CharField(max_length=64)),
+                ("input_path", models.CharField(max_length=512)),
+                ("output_file_id", models.CharField(blank=True, default="", max_length=64)),
+                ("error_file_id", models.CharField(blank=True, default="", max_length=64)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("validating", "Validating"),
+                            ("in_progress", "In progress"),
+                            ("finalizing", "Finalizing"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                            ("expired", "Expired"),
+                            ("cancelling", "Cancelling"),
+                            ("cancelled", "Cancelled"),
+                            ("imported", "Imported"),
+                        ],
+                        default="validating",
+                        max_length=20,
+                    ),
+                ),
+                ("pages", models.JSONField(default=dict)),
+                ("total_pages", models.PositiveIntegerField()),
+                ("request_count", models.PositiveIntegerField(default=0)),
+                ("failed_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="embedding_batches",
+                        to="documents_processor.storeddocument",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents_processor", "0008_embeddingbatch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentchunk",
+            name="embedding_provider",
+            field=models.CharField(
+                db_index=True, default="openai:text-embedding-3-small", max_length=128
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents_processor", "0009_documentchunk_embedding_provider"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OpenAIUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model", models.CharField(max_length=64)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("embedding", "Embedding"),
+                            ("batch_embedding", "Batch API embedding"),
+                            ("chat", "Chat completion"),
+                            ("image", "Image generation"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("operation", models.CharField(blank=True, default="", max_length=32)),
+                ("prompt_tokens", models.PositiveIntegerField(default=0)),
+                ("completion_tokens", models.PositiveIntegerField(default=0)),
+                ("images", models.PositiveSmallIntegerField(default=0)),
+                ("latency_ms", models.PositiveIntegerField(default=0)),
+                ("cost", models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ("document_id", models.UUIDField(blank=True, db_index=True, null=True)),
+                ("recipe_id", models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
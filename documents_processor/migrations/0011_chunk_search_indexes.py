@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-19 20:10
+
+from django.db import migrations, models
+
+DEFAULT_PROVIDER = "openai:text-embedding-3-small"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents_processor", "0010_openaiusage"),
+    ]
+
+    operations = [
+        # Every search filters on its embedding provider. An index over all providers loses
+        # the other providers' chunks to that filter after the scan; a partial index holds
+        # only the chunks a search can return. Chunks of other providers are searched exactly.
+        migrations.RunSQL(
+            "DROP INDEX IF EXISTS document_chunk_embedding_ivfflat_idx;",
+            """
+            CREATE INDEX document_chunk_embedding_ivfflat_idx
+            ON documents_processor_documentchunk
+            USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+            """,
+        ),
+        migrations.RunSQL(
+            f"""
+            CREATE INDEX document_chunk_openai_embedding_ivfflat_idx
+            ON documents_processor_documentchunk
+            USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)
+            WHERE embedding_provider = '{DEFAULT_PROVIDER}';
+            """,
+            "DROP INDEX IF EXISTS document_chunk_openai_embedding_ivfflat_idx;",
+        ),
+        migrations.AddIndex(
+            model_name="documentchunk",
+            index=models.Index(
+                fields=["embedding_provider", "created_at"], name="chunk_provider_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-19 21:05
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents_processor", "0011_chunk_search_indexes"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="heading",
+            field=models.CharField(blank=True, db_default="", default="", max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="documentchunk",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["heading"], name="chunk_heading_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+        migrations.AddField(
+            model_name="embeddingbatch",
+            name="headings",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
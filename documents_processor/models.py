@@ -1,8 +1,12 @@
 from django.db import models
 import uuid
 from pgvector.django import VectorField
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 
+HEADING_MAX_LENGTH = 255
+
+
 class StoredDocument(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -16,6 +20,8 @@ class StoredDocument(models.Model):
     title = models.CharField(max_length=256)
     description = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # SHA-256 of the source file, used to skip re-ingesting an unchanged file
+    file_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -25,14 +31,155 @@ class StoredDocument(models.Model):
 class DocumentChunk(models.Model):
     document = models.ForeignKey(StoredDocument, on_delete=models.CASCADE, related_name='chunks')
     chunk_index = models.PositiveIntegerField()
+    # Page (or first page of a Google Drive batch) the chunk was extracted from
+    page_number = models.PositiveIntegerField(blank=True, null=True)
     content = models.TextField()
+    # Recipe title detected by the splitter, empty when none was; matched by trigram search
+    heading = models.CharField(max_length=HEADING_MAX_LENGTH, blank=True, default='', db_default='')
     embedding = VectorField(dimensions=1536)
+    # Embedding provider (vector space) of `embedding`; searches only compare chunks of one provider
+    embedding_provider = models.CharField(max_length=128, default='openai:text-embedding-3-small', db_index=True)
     content_tsv = SearchVectorField(null=True, db_default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('document', 'chunk_index')
         ordering = ['chunk_index']
+        indexes = [
+            # Pre-filters searches scoped to a creation date range
+            models.Index(fields=['embedding_provider', 'created_at'], name='chunk_provider_created_idx'),
+            GinIndex(fields=['heading'], name='chunk_heading_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f"{self.document} - Chunk {self.chunk_index}"
+
+
+class DocumentPage(models.Model):
+    """
+    Fingerprint of the text extracted from one page and of the chunks starting on it, so
+    unchanged pages are not re-embedded.
+    """
+    document = models.ForeignKey(StoredDocument, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.PositiveIntegerField()
+    text_hash = models.CharField(max_length=64)
+    chunk_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('document', 'page_number')
+        ordering = ['page_number']
+
+    def __str__(self):
+        return f"{self.document} - Page {self.page_number}"
+
+
+class IngestionCheckpoint(models.Model):
+    """
+    Progress of the latest ingestion run of a document, committed together with the chunks
+    it describes, so a failed run can be resumed without redoing or duplicating work.
+    """
+    MODE_CHOICES = [
+        ('pypdf2', 'PyPDF2'),
+        ('google_drive', 'Google Drive'),
+        ('google_drive_batched', 'Google Drive (batched)'),
+    ]
+
+    document = models.OneToOneField(StoredDocument, on_delete=models.CASCADE, related_name='checkpoint')
+    mode = models.CharField(max_length=32, choices=MODE_CHOICES)
+    batch_size = models.PositiveIntegerField(blank=True, null=True)
+    last_completed_page = models.PositiveIntegerField(default=0)
+    next_chunk_index = models.PositiveIntegerField(default=0)
+    # Page being written when the run stopped and how many of its chunks are already stored
+    current_page = models.PositiveIntegerField(blank=True, null=True)
+    current_page_hash = models.CharField(max_length=64, blank=True, default='')
+    current_page_chunks = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.document} - after page {self.last_completed_page}"
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket for one OpenAI quota (e.g. tokens per minute of a model), shared by every
+    worker process. It is refilled lazily and consumed with a single atomic UPDATE.
+    """
+    name = models.CharField(max_length=128, unique=True)
+    capacity = models.FloatField()
+    # Refill speed in units per second
+    rate = models.FloatField()
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} ({self.tokens:.0f}/{self.capacity:.0f})"
+
+
+class EmbeddingBatch(models.Model):
+    """
+    One OpenAI Batch API job embedding chunks of a document. The requests are kept in a local
+    JSONL file, and in the uploaded input file should that be gone; custom_id
+    "<page_number>-<offset within the page>" maps every result back to its chunk.
+    """
+    STATUS_CHOICES = [
+        ('validating', 'Validating'),
+        ('in_progress', 'In progress'),
+        ('finalizing', 'Finalizing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+        ('cancelling', 'Cancelling'),
+        ('cancelled', 'Cancelled'),
+        ('imported', 'Imported'),
+    ]
+
+    document = models.ForeignKey(StoredDocument, on_delete=models.CASCADE, related_name='embedding_batches')
+    batch_id = models.CharField(max_length=64, unique=True)
+    input_file_id = models.CharField(max_length=64)
+    input_path = models.CharField(max_length=512)
+    output_file_id = models.CharField(max_length=64, blank=True, default='')
+    error_file_id = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='validating')
+    # Text hash of every page embedded by this batch, and the page count of the document
+    pages = models.JSONField(default=dict)
+    # Recipe title of every request that has one, by custom_id
+    headings = models.JSONField(default=dict, blank=True)
+    total_pages = models.PositiveIntegerField()
+    request_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.document} - {self.batch_id} ({self.status})"
+
+
+class OpenAIUsage(models.Model):
+    """
+    One OpenAI API call: tokens, latency and cost, attributed to the document or recipe it
+    was made for (see services/usage_service.py). Ids are plain columns, not foreign keys,
+    so the accounting outlives deleted documents and recipes.
+    """
+    KIND_CHOICES = [
+        ('embedding', 'Embedding'),
+        ('batch_embedding', 'Batch API embedding'),
+        ('chat', 'Chat completion'),
+        ('image', 'Image generation'),
+    ]
+
+    model = models.CharField(max_length=64)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # Pipeline that made the call, e.g. ingest, search or generate
+    operation = models.CharField(max_length=32, blank=True, default='')
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    images = models.PositiveSmallIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    document_id = models.UUIDField(blank=True, null=True, db_index=True)
+    recipe_id = models.BigIntegerField(blank=True, null=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.model} ({self.prompt_tokens + self.completion_tokens} tokens)"
@@ -4,11 +4,12 @@ from .models import StoredDocument, DocumentChunk
 class DocumentChunkSerializer(serializers.ModelSerializer):
     class Meta:
         model = DocumentChunk
-        fields = ['id', 'chunk_index', 'content', 'created_at']
+        fields = ['id', 'chunk_index', 'page_number', 'content', 'created_at']
 
 class StoredDocumentSerializer(serializers.ModelSerializer):
     chunks = DocumentChunkSerializer(many=True, read_only=True)
 
     class Meta:
         model = StoredDocument
-        fields = ['id', 'file_path', 'title', 'description', 'status', 'created_at', 'updated_at', 'chunks'] 
\ No newline at end of file
+        fields = ['id', 'file_path', 'title', 'description', 'status', 'file_hash', 'created_at', 'updated_at', 'chunks']
+        read_only_fields = ['file_hash'] 
\ No newline at end of file
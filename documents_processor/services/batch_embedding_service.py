@@ -0,0 +1,131 @@
+from django.conf import settings
+import base64
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_providers import OPENAI_EMBEDDING_MODEL
+from .openai_service import OpenAIService
+
+logger = logging.getLogger(__name__)
+
+# Batch statuses after which OpenAI will not produce any more results
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchEmbeddingService:
+    """
+    Embeds chunks through the OpenAI Batch API: half the price of synchronous calls and
+    a separate quota, at the cost of results arriving within hours instead of seconds.
+
+    Every request carries a custom_id "<page_number>-<offset>" that keys its result back
+    to the chunk. The request file is kept on disk, so the chunk texts can be read back
+    when the results are imported; without it they are read from the copy uploaded to OpenAI.
+    """
+
+    def __init__(self, openai_service: OpenAIService = None):
+        openai_service = openai_service or OpenAIService()
+        # Batch management calls are cheap and outside the embedding quota, so the client
+        # retries them itself instead of going through the scheduler
+        self.client = openai_service.client.with_options(max_retries=settings.OPENAI_MAX_RETRIES)
+
+    @staticmethod
+    def custom_id(page_number: int, offset: int) -> str:
+        return f"{page_number}-{offset}"
+
+    @staticmethod
+    def parse_custom_id(custom_id: str) -> Tuple[int, int]:
+        page_number, offset = custom_id.split('-')
+        return int(page_number), int(offset)
+
+    def write_requests(self, path: Path, pages_chunks: Iterable[Tuple[int, List[str]]]) -> int:
+        """Write one embeddings request per chunk of every (page_number, chunk texts) pair; returns the count."""
+        count = 0
+        with open(path, 'w', encoding='utf-8') as file:
+            for page_number, texts in pages_chunks:
+                for offset, text in enumerate(texts):
+                    file.write(json.dumps({
+                        "custom_id": self.custom_id(page_number, offset),
+                        "method": "POST",
+                        "url": "/v1/embeddings",
+                        # base64 is a quarter of the size of a JSON float list
+                        "body": {"model": OPENAI_EMBEDDING_MODEL, "input": text, "encoding_format": "base64"},
+                    }) + "\n")
+                    count += 1
+        return count
+
+    def submit(self, path: Path, metadata: Dict[str, str] = None):
+        """Upload a request file and start a batch for it."""
+        try:
+            with open(path, 'rb') as file:
+                input_file = self.client.files.create(file=file, purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/embeddings",
+                completion_window="24h",
+                metadata=metadata,
+            )
+            logger.info(f"Submitted batch {batch.id} with requests from {path}")
+            return batch
+        except Exception as e:
+            logger.error(f"Error submitting embedding batch {path}: {e}")
+            raise
+
+    def retrieve(self, batch_id: str):
+        try:
+            return self.client.batches.retrieve(batch_id)
+        except Exception as e:
+            logger.error(f"Error retrieving embedding batch {batch_id}: {e}")
+            raise
+
+    def read_requests(self, path: Path, input_file_id: str = None) -> Iterator[Tuple[str, str]]:
+        """
+        Yield (custom_id, text) from a request file. When the local file is gone (e.g. collected
+        on another host) the copy uploaded to OpenAI as `input_file_id` is streamed instead.
+        """
+        if not path.exists() and input_file_id:
+            logger.warning(f"Request file {path} is missing, reading batch input file {input_file_id}")
+            with self.client.files.with_streaming_response.content(input_file_id) as response:
+                yield from self.parse_requests(response.iter_lines())
+            return
+        with open(path, encoding='utf-8') as file:
+            yield from self.parse_requests(file)
+
+    @staticmethod
+    def parse_requests(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        for line in lines:
+            if line.strip():
+                request = json.loads(line)
+                yield request['custom_id'], request['body']['input']
+
+    def iter_results(self, file_id: str) -> Iterator[Tuple[str, np.ndarray, int]]:
+        """
+        Stream a batch output file and yield (custom_id, embedding, tokens) for every
+        successful request, without holding the whole file in memory.
+        """
+        with self.client.files.with_streaming_response.content(file_id) as response:
+            for line in response.iter_lines():
+                if line.strip():
+                    parsed = self.parse_result(line)
+                    if parsed is not None:
+                        yield parsed
+
+    @staticmethod
+    def parse_result(line: str) -> Optional[Tuple[str, np.ndarray, int]]:
+        """(custom_id, embedding, tokens) of one output file line, or None for a failed request."""
+        result = json.loads(line)
+        response = result.get('response') or {}
+        response_body = response.get('body') or {}
+        if result.get('error') or response.get('status_code') != 200:
+            logger.warning(f"Batch request {result['custom_id']} failed: {result.get('error') or response_body}")
+            return None
+        embedding = response_body['data'][0]['embedding']
+        if isinstance(embedding, str):
+            embedding = np.frombuffer(base64.b64decode(embedding), dtype='<f4')
+        else:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        tokens = (response_body.get('usage') or {}).get('prompt_tokens', 0)
+        return result['custom_id'], embedding, tokens
@@ -0,0 +1,355 @@
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from pathlib import Path
+from datetime import datetime, timezone as dt_timezone
+from struct import pack
+from typing import Any, Dict, Iterable, Iterator, List
+import json
+import logging
+import time
+import uuid
+
+import numpy as np
+
+from .embedding_providers import OPENAI_PROVIDER_NAME
+from ..models import StoredDocument, DocumentChunk, DocumentPage, IngestionCheckpoint, EmbeddingBatch
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+# Version 1 snapshots predate embedding providers, all their chunks were embedded by OpenAI
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+
+PGCOPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+# Columns written by COPY, with their binary COPY type
+DOCUMENT_COLUMNS = [
+    ('id', 'uuid'), ('file_path', 'text'), ('title', 'text'), ('description', 'text'), ('status', 'text'),
+    ('file_hash', 'text'), ('created_at', 'timestamptz'), ('updated_at', 'timestamptz'),
+]
+PAGE_COLUMNS = [
+    ('document_id', 'uuid'), ('page_number', 'int4'), ('text_hash', 'text'), ('chunk_count', 'int4'),
+    ('updated_at', 'timestamptz'),
+]
+CHUNK_COLUMNS = [
+    ('document_id', 'uuid'), ('chunk_index', 'int4'), ('page_number', 'int4'), ('content', 'text'),
+    ('embedding', 'vector'), ('embedding_provider', 'text'), ('created_at', 'timestamptz'),
+]
+SNAPSHOT_CHUNK_COLUMNS = CHUNK_COLUMNS + [('heading', 'text')]
+
+TSVECTOR_TRIGGER = 'document_chunk_tsvector_update'
+
+
+def _encode_field(value: Any, field_type: str) -> bytes:
+    """One field of a binary COPY tuple: its length followed by its value in network byte order."""
+    if value is None:
+        return pack('>i', -1)
+    if field_type == 'uuid':
+        data = uuid.UUID(str(value)).bytes
+    elif field_type == 'int4':
+        data = pack('>i', value)
+    elif field_type == 'text':
+        data = value.encode('utf-8')
+    elif field_type == 'timestamptz':
+        moment = datetime.fromisoformat(value) if isinstance(value, str) else value
+        delta = moment - PG_EPOCH
+        data = pack('>q', (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+    elif field_type == 'vector':
+        values = np.asarray(value, dtype='>f4')
+        data = pack('>HH', values.shape[0], 0) + values.tobytes()
+    else:
+        raise ValueError(f"Unsupported COPY field type: {field_type}")
+    return pack('>i', len(data)) + data
+
+
+def _copy_tuples(rows: Iterable[List[Any]], columns: List[tuple]) -> Iterator[bytes]:
+    """Encode rows in PostgreSQL's binary COPY format."""
+    types = [field_type for _, field_type in columns]
+    yield PGCOPY_SIGNATURE + pack('>ii', 0, 0)
+    for row in rows:
+        yield pack('>h', len(types)) + b''.join(
+            _encode_field(value, field_type) for value, field_type in zip(row, types)
+        )
+    yield pack('>h', -1)
+
+
+class _CopyStream:
+    """File-like reader over a generator of bytes, for cursor.copy_expert."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def copy_rows(cursor, table: str, columns: List[tuple], rows: Iterable[List[Any]]):
+    """Load rows into `table` with binary COPY; `columns` are (name, COPY type) pairs."""
+    column_names = ', '.join(column for column, _ in columns)
+    cursor.copy_expert(
+        f"COPY {table} ({column_names}) FROM STDIN WITH (FORMAT binary)",
+        _CopyStream(_copy_tuples(rows, columns))
+    )
+
+
+def droppable_indexes(cursor, table: str) -> List[tuple]:
+    """(name, definition) of the indexes of `table` that do not back a constraint."""
+    cursor.execute(
+        """
+        SELECT index_class.relname, pg_get_indexdef(index.indexrelid)
+        FROM pg_index AS index
+        JOIN pg_class AS index_class ON index_class.oid = index.indexrelid
+        WHERE index.indrelid = %s::regclass
+        AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = index.indexrelid)
+        """,
+        [table]
+    )
+    return cursor.fetchall()
+
+
+class _EmbeddingMatrixWriter:
+    """
+    File-like writer receiving `COPY (SELECT embedding ...) TO STDOUT (FORMAT binary)`.
+
+    Every tuple has the same size, so complete tuples are decoded in bulk with a
+    structured dtype and written straight into the (memory-mapped) matrix.
+    """
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+        self.rows = 0
+        dimensions = matrix.shape[1]
+        self._tuple = np.dtype([
+            ('fields', '>i2'), ('length', '>i4'), ('dim', '>u2'), ('unused', '>u2'), ('values', '>f4', (dimensions,)),
+        ])
+        self._header_done = False
+        self._buffer = bytearray()
+
+    def write(self, data: bytes):
+        self._buffer += data
+        if not self._header_done:
+            if len(self._buffer) < 19:
+                return
+            extension_length = int.from_bytes(self._buffer[15:19], 'big')
+            del self._buffer[:19 + extension_length]
+            self._header_done = True
+
+        count = len(self._buffer) // self._tuple.itemsize
+        if count:
+            size = count * self._tuple.itemsize
+            tuples = np.frombuffer(bytes(self._buffer[:size]), dtype=self._tuple)
+            del self._buffer[:size]
+            if (tuples['dim'] != self.matrix.shape[1]).any():
+                raise ValueError(f"Expected embeddings of {self.matrix.shape[1]} dimensions")
+            self.matrix[self.rows:self.rows + count] = tuples['values']
+            self.rows += count
+
+
+class CorpusSnapshotService:
+    """
+    Exports and imports the document corpus as a compact snapshot directory:
+
+    - `manifest.json`: format version, embedding dimensions, row counts and chunks per embedding provider
+    - `documents.jsonl`, `pages.jsonl`, `chunks.jsonl`: one row per line, without embeddings
+    - `embeddings.npy`: float32 matrix, row i is the embedding of line i of `chunks.jsonl`
+
+    Imports load everything with binary COPY in a single transaction and build the
+    chunk indexes and full-text vectors once, after the load.
+    """
+
+    def __init__(self, dimensions: int = 1536):
+        self.dimensions = dimensions
+
+    def export_corpus(self, directory: Path) -> Dict[str, Any]:
+        started = time.monotonic()
+        directory.mkdir(parents=True, exist_ok=True)
+        chunk_table = DocumentChunk._meta.db_table
+
+        with transaction.atomic():
+            # Metadata and embeddings are read by separate queries; they must see the same rows
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+            documents = self._write_jsonl(directory / 'documents.jsonl', (
+                {
+                    'id': str(document.id),
+                    'file_path': document.file_path,
+                    'title': document.title,
+                    'description': document.description,
+                    'status': document.status,
+                    'file_hash': document.file_hash,
+                    'created_at': document.created_at.isoformat(),
+                    'updated_at': document.updated_at.isoformat(),
+                }
+                for document in StoredDocument.objects.order_by('created_at', 'id').iterator()
+            ))
+
+            pages = self._write_jsonl(directory / 'pages.jsonl', (
+                {
+                    'document': str(document_id),
+                    'page_number': page_number,
+                    'text_hash': text_hash,
+                    'chunk_count': chunk_count,
+                    'updated_at': updated_at.isoformat(),
+                }
+                for document_id, page_number, text_hash, chunk_count, updated_at in DocumentPage.objects.order_by(
+                    'document_id', 'page_number'
+                ).values_list('document_id', 'page_number', 'text_hash', 'chunk_count', 'updated_at').iterator()
+            ))
+
+            chunks = self._write_jsonl(directory / 'chunks.jsonl', (
+                {
+                    'document': str(document_id),
+                    'chunk_index': chunk_index,
+                    'page_number': page_number,
+                    'content': content,
+                    'heading': heading,
+                    'embedding_provider': embedding_provider,
+                    'created_at': created_at.isoformat(),
+                }
+                for document_id, chunk_index, page_number, content, heading, embedding_provider, created_at
+                in DocumentChunk.objects.order_by('document_id', 'chunk_index').values_list(
+                    'document_id', 'chunk_index', 'page_number', 'content', 'heading', 'embedding_provider',
+                    'created_at'
+                ).iterator(chunk_size=5000)
+            ))
+
+            providers = dict(
+                DocumentChunk.objects.order_by().values_list('embedding_provider').annotate(count=Count('id'))
+            )
+
+            # Embeddings are copied in binary form, which avoids parsing their text representation
+            matrix = np.lib.format.open_memmap(
+                directory / 'embeddings.npy', mode='w+', dtype=np.float32, shape=(chunks, self.dimensions)
+            )
+            writer = _EmbeddingMatrixWriter(matrix)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY (SELECT embedding FROM {chunk_table} ORDER BY document_id, chunk_index) "
+                    f"TO STDOUT WITH (FORMAT binary)",
+                    writer
+                )
+            matrix.flush()
+            if writer.rows != chunks:
+                raise ValueError(f"Exported {chunks} chunks but {writer.rows} embeddings")
+
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'dimensions': self.dimensions,
+            'documents': documents,
+            'pages': pages,
+            'chunks': chunks,
+            'embedding_providers': providers,
+            'exported_at': timezone.now().isoformat(),
+        }
+        (directory / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+        logger.info(f"Exported {documents} documents and {chunks} chunks in {time.monotonic() - started:.1f}s")
+        return manifest
+
+    def import_corpus(self, directory: Path, replace: bool = False) -> Dict[str, Any]:
+        started = time.monotonic()
+        manifest = json.loads((directory / 'manifest.json').read_text())
+        if manifest['format_version'] not in SUPPORTED_FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported snapshot format version {manifest['format_version']}")
+        if manifest['dimensions'] != self.dimensions:
+            raise ValueError(f"Snapshot has {manifest['dimensions']} dimensions, expected {self.dimensions}")
+
+        embeddings = np.load(directory / 'embeddings.npy', mmap_mode='r')
+        if embeddings.shape != (manifest['chunks'], self.dimensions):
+            raise ValueError(f"Embedding matrix has shape {embeddings.shape}, manifest expects "
+                             f"({manifest['chunks']}, {self.dimensions})")
+
+        document_table = StoredDocument._meta.db_table
+        page_table = DocumentPage._meta.db_table
+        chunk_table = DocumentChunk._meta.db_table
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if replace:
+                cursor.execute(
+                    f"TRUNCATE {chunk_table}, {page_table}, {IngestionCheckpoint._meta.db_table}, "
+                    f"{EmbeddingBatch._meta.db_table}, {document_table}"
+                )
+            else:
+                document_ids = [row['id'] for row in self._read_jsonl(directory / 'documents.jsonl')]
+                if StoredDocument.objects.filter(id__in=document_ids).exists():
+                    raise ValueError("Some snapshot documents already exist, import with replace to overwrite the corpus")
+
+            copy_rows(cursor, document_table, DOCUMENT_COLUMNS, (
+                [row[column] for column, _ in DOCUMENT_COLUMNS]
+                for row in self._read_jsonl(directory / 'documents.jsonl')
+            ))
+            copy_rows(cursor, page_table, PAGE_COLUMNS, (
+                [row['document'], row['page_number'], row['text_hash'], row['chunk_count'], row['updated_at']]
+                for row in self._read_jsonl(directory / 'pages.jsonl')
+            ))
+
+            # Indexes are rebuilt once after the load instead of being maintained row by row;
+            # indexes backing constraints stay so the load is still validated
+            indexes = droppable_indexes(cursor, chunk_table)
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX "{name}"')
+
+            # Load into a staging table, then compute every tsvector in one set-based INSERT
+            # instead of firing the per-row trigger
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE corpus_import_chunk "
+                f"(document_id uuid, chunk_index integer, page_number integer, content text, "
+                f"embedding vector({self.dimensions}), embedding_provider text, created_at timestamptz, "
+                f"heading text) ON COMMIT DROP"
+            )
+            copy_rows(cursor, 'corpus_import_chunk', SNAPSHOT_CHUNK_COLUMNS, (
+                [
+                    row['document'], row['chunk_index'], row['page_number'], row['content'], embedding,
+                    row.get('embedding_provider', OPENAI_PROVIDER_NAME), row['created_at'],
+                    # Snapshots exported before chunks had headings have no recipe titles
+                    row.get('heading', ''),
+                ]
+                for row, embedding in zip(self._read_jsonl(directory / 'chunks.jsonl'), embeddings)
+            ))
+            cursor.execute(f"ALTER TABLE {chunk_table} DISABLE TRIGGER {TSVECTOR_TRIGGER}")
+            cursor.execute(
+                f"INSERT INTO {chunk_table} "
+                f"(document_id, chunk_index, page_number, content, embedding, embedding_provider, created_at, "
+                f"heading, content_tsv) "
+                f"SELECT document_id, chunk_index, page_number, content, embedding, embedding_provider, created_at, "
+                f"heading, to_tsvector('simple', coalesce(content, '')) FROM corpus_import_chunk"
+            )
+            # Run the deferred foreign key checks now, ALTER TABLE refuses pending trigger events
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(f"ALTER TABLE {chunk_table} ENABLE TRIGGER {TSVECTOR_TRIGGER}")
+
+            for name, definition in indexes:
+                logger.info(f"Building index {name}")
+                cursor.execute(definition)
+            cursor.execute(f"ANALYZE {chunk_table}")
+
+        logger.info(f"Imported {manifest['documents']} documents and {manifest['chunks']} chunks "
+                    f"in {time.monotonic() - started:.1f}s")
+        return manifest
+
+    @staticmethod
+    def _write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> int:
+        count = 0
+        with open(path, 'w', encoding='utf-8') as file:
+            for row in rows:
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                count += 1
+        return count
+
+    @staticmethod
+    def _read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                yield json.loads(line)
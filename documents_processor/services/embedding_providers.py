@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import logging
+import re
+import threading
+import unicodedata
+import zlib
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Width of DocumentChunk.embedding. Smaller vectors are zero-padded to it, which leaves
+# their cosine distances unchanged.
+STORAGE_DIMENSIONS = 1536
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+OPENAI_PROVIDER_NAME = f"openai:{OPENAI_EMBEDDING_MODEL}"
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class EmbeddingProvider:
+    """
+    Turns texts into embedding vectors.
+
+    `name` identifies the vector space. It is stored with every chunk, and searches only
+    compare vectors of the same provider, so switching providers never mixes spaces.
+    """
+    name: str
+    dimensions: int
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts into a (len(texts), dimensions) float32 matrix."""
+        raise NotImplementedError
+
+    def embed_for_storage(self, texts: List[str]) -> np.ndarray:
+        """Like embed(), padded to STORAGE_DIMENSIONS columns."""
+        vectors = self.embed(texts)
+        if vectors.shape[1] == STORAGE_DIMENSIONS:
+            return vectors
+        padded = np.zeros((len(vectors), STORAGE_DIMENSIONS), dtype=np.float32)
+        padded[:, :vectors.shape[1]] = vectors
+        return padded
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_for_storage([text])[0]
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """text-embedding-3-small through the OpenAI API, one request per batch."""
+
+    name = OPENAI_PROVIDER_NAME
+    dimensions = 1536
+
+    def __init__(self, openai_service=None, batch_size: int = None):
+        from .openai_service import OpenAIService
+        self.openai_service = openai_service or OpenAIService()
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.openai_service.create_embeddings(texts[start:start + self.batch_size]))
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimensions)
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic feature-hashing embedder: words and word bigrams, with case and Polish
+    diacritics folded, are hashed into signed buckets. It needs no model or network and
+    embeds a query in microseconds. Its vectors only capture word overlap, so it is meant
+    for tests, benchmarks and offline development.
+    """
+
+    def __init__(self, dimensions: int = None):
+        self.dimensions = dimensions or 1024
+        if self.dimensions > STORAGE_DIMENSIONS:
+            raise ImproperlyConfigured(f"EMBEDDING_DIMENSIONS can be at most {STORAGE_DIMENSIONS}")
+        self.name = f"hashing:{self.dimensions}"
+
+    @staticmethod
+    def features(text: str) -> List[str]:
+        text = unicodedata.normalize("NFKD", text.lower().replace("ł", "l"))
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        words = WORD_PATTERN.findall(text)
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter(
+                (zlib.crc32(feature.encode("utf-8")) for feature in self.features(text)), dtype=np.uint32
+            )
+            if not len(hashes):
+                continue
+            # The top bit picks the sign so colliding features tend to cancel out
+            signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], hashes % self.dimensions, signs)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """
+    Local sentence-transformers model on the CPU. It runs on the ONNX backend by default, where
+    a small model such as all-MiniLM-L6-v2 embeds a query in a few milliseconds.
+    It needs the optional `local-embeddings` extra.
+    """
+
+    def __init__(self, model_name: str = None, dimensions: int = None, backend: str = None, batch_size: int = None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "EMBEDDING_PROVIDER 'sentence-transformers' needs the optional dependency, "
+                "install it with `poetry install --extras local-embeddings`"
+            ) from e
+
+        model_name = model_name or settings.EMBEDDING_MODEL
+        backend = backend or settings.EMBEDDING_BACKEND
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        logger.info(f"Loading embedding model {model_name} ({backend})")
+        self.model = SentenceTransformer(model_name, device="cpu", backend=backend, truncate_dim=dimensions)
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+        if self.dimensions > STORAGE_DIMENSIONS:
+            raise ImproperlyConfigured(
+                f"{model_name} has {self.dimensions} dimensions, set EMBEDDING_DIMENSIONS to at most {STORAGE_DIMENSIONS}"
+            )
+        self.name = f"sentence-transformers:{model_name}:{self.dimensions}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+        )
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimensions)
+
+
+_local_provider = None
+_local_provider_lock = threading.Lock()
+
+
+def get_embedding_provider(openai_service=None) -> EmbeddingProvider:
+    """
+    The provider configured by EMBEDDING_PROVIDER. The OpenAI provider wraps the given
+    service, which carries its priority and rate limiter. Local models are loaded once
+    per process.
+    """
+    global _local_provider
+    kind = settings.EMBEDDING_PROVIDER
+    if kind == "openai":
+        return OpenAIEmbeddingProvider(openai_service)
+    with _local_provider_lock:
+        if _local_provider is None:
+            if kind == "hashing":
+                _local_provider = HashingEmbeddingProvider(settings.EMBEDDING_DIMENSIONS)
+            elif kind == "sentence-transformers":
+                _local_provider = SentenceTransformerProvider(dimensions=settings.EMBEDDING_DIMENSIONS)
+            else:
+                raise ImproperlyConfigured(
+                    f"Unknown EMBEDDING_PROVIDER {kind!r}, use 'openai', 'sentence-transformers' or 'hashing'"
+                )
+        return _local_provider
@@ -1,167 +1,713 @@
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
 from pathlib import Path
+import hashlib
+from io import BytesIO
 import logging
-from typing import List
+from typing import List, Dict, Tuple, Iterator
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 import PyPDF2
 
+from ai_cooking_project.metrics import record_cache_lookup, stage
 from .openai_service import OpenAIService
+from .openai_scheduler import BULK
+from .batch_embedding_service import BatchEmbeddingService, TERMINAL_STATUSES
+from .embedding_providers import OPENAI_EMBEDDING_MODEL, OPENAI_PROVIDER_NAME, OpenAIEmbeddingProvider
+from .usage_service import attribute_usage, attributed_to_document, record_usage
 from .vector_service import VectorService
 from .google_drive_service import GoogleDriveService
-from .text_splitter_service import TextSplitterService
-from ..models import StoredDocument
+from .recipe_splitter_service import RecipeSplitterService
+from ..models import StoredDocument, DocumentChunk, DocumentPage, IngestionCheckpoint, EmbeddingBatch
 
 logger = logging.getLogger(__name__)
 
+# Chunks embedded and committed per checkpoint write
+CHECKPOINT_CHUNKS = 20
+
+
+class DocumentBusyError(ValueError):
+    """The document is already being processed."""
+
 class FileProcessorService:
-    def __init__(self):
-        self.openai_service = OpenAIService()
+    def __init__(self, google_drive_service: GoogleDriveService = None, openai_service: OpenAIService = None):
+        # Ingestion is bulk work, it must not starve searches and recipe generation
+        self.openai_service = openai_service or OpenAIService(priority=BULK)
         self.vector_service = VectorService(self.openai_service)
-        self.text_splitter = TextSplitterService()
-        self.google_drive_service = GoogleDriveService()
+        self.text_splitter = RecipeSplitterService()
+        self.google_drive_service = google_drive_service or GoogleDriveService()
+
+    @staticmethod
+    def compute_file_hash(file_path: Path) -> str:
+        """SHA-256 of a file, read in chunks so large PDFs are never loaded into memory."""
+        with open(file_path, 'rb') as file:
+            return hashlib.file_digest(file, 'sha256').hexdigest()
+
+    @staticmethod
+    def compute_text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def register_document(self, file_path: Path, title: str, file_hash: str = None) -> Tuple[StoredDocument, bool]:
+        """
+        Find or create the StoredDocument for a file on disk.
+
+        Returns the document and whether it still needs processing. An identical file
+        that was already processed (or is being processed) is returned as-is, unless it
+        was embedded by another provider; one still to be processed is pointed at `file_path`.
+        A changed file with the same path reuses its document so only the changed pages are
+        re-embedded. `file_hash` skips re-reading a file whose hash is already known, e.g.
+        one computed while it was uploaded.
+        """
+        if file_hash is None:
+            file_hash = self.compute_file_hash(file_path)
+
+        existing = StoredDocument.objects.filter(file_hash=file_hash).order_by('-created_at').first()
+        record_cache_lookup('file_hash', existing is not None)
+        if existing is not None:
+            needs_processing = existing.status not in ('processed', 'processing') or (
+                # Switching EMBEDDING_PROVIDER re-embeds documents that were already processed
+                existing.status == 'processed'
+                and existing.chunks.exclude(embedding_provider=self.vector_service.provider.name).exists()
+            )
+            logger.info("File %s matches document %s (%s)", file_path, existing.id, existing.status)
+            if needs_processing and existing.file_path != str(file_path):
+                # The same contents stored under another name, e.g. uploaded again
+                existing.file_path = str(file_path)
+                existing.save(update_fields=['file_path', 'updated_at'])
+            return existing, needs_processing
+
+        document = StoredDocument.objects.filter(file_path=str(file_path)).order_by('-created_at').first()
+        if document is not None:
+            logger.info("File %s changed, updating document %s", file_path, document.id)
+            document.file_hash = file_hash
+            document.status = 'pending'
+            document.save()
+            return document, True
+
+        document = StoredDocument.objects.create(
+            file_path=str(file_path),
+            title=title,
+            file_hash=file_hash,
+            status='pending'
+        )
+        return document, True
+
+    @attributed_to_document('ingest')
+    def process_document(self, document_id: str, use_google_drive: bool = False, resume: bool = False) -> Dict[str, int]:
+        """
+        Extract, split, embed and store a document, skipping pages that did not change.
 
-    def process_document(self, document_id: str, use_google_drive: bool = False):
+        Returns the pages read and the chunks and tokens embedded by this run.
+        """
         try:
             document = StoredDocument.objects.get(id=document_id)
-            logger.info(f"Starting to process document {document_id}")
+            logger.info("%s to process document %s", 'Resuming' if resume else 'Starting', document_id)
             document.status = 'processing'
             document.save()
 
+            pages = self._load_pages(document)
+            mode = 'google_drive' if use_google_drive else 'pypdf2'
+            checkpoint = self._start_checkpoint(document, mode, resume=resume)
+            successful_chunks = 0
+            embedded_tokens = 0
+            changed_pages = 0
+
             if use_google_drive:
                 # Process with Google Drive
-                logger.info(f"Using Google Drive for enhanced text extraction")
+                logger.info("Using Google Drive for enhanced text extraction")
                 file_path = Path(document.file_path)
-                result = self.google_drive_service.process_pdf_with_drive(file_path)
-                
-                # Process the entire text from Google Drive
-                chunks = self.text_splitter.split_text(result)
-                logger.info(f"Document split into {len(chunks)} chunks")
-                
-                chunk_index = 0
-                successful_chunks = 0
-                
-                for chunk_num, chunk in enumerate(chunks):
-                    try:
-                        self.vector_service.store_chunk(
-                            document=document,
-                            chunk_text=chunk['text'],
-                            chunk_index=chunk_index
-                        )
-                        chunk_index += 1
-                        successful_chunks += 1
-                    except Exception as e:
-                        logger.error(f"Error processing chunk {chunk_num}: {e}")
-                        continue
+                with stage('ingest', 'extract'):
+                    result = self.google_drive_service.process_pdf_with_drive(file_path)
+
+                # The entire text from Google Drive is a single unit
+                page_texts = {1: result}
+                total_pages = 1
             else:
                 # Process with PyPDF2 (original method)
-                with open(document.file_path, 'rb') as file:
+                with stage('ingest', 'extract'), open(document.file_path, 'rb') as file:
                     pdf_reader = PyPDF2.PdfReader(file)
-                    logger.info(f"PDF loaded with {len(pdf_reader.pages)} pages")
-                    
-                    chunk_index = 0
-                    successful_chunks = 0
-                    
-                    for page_num, page in enumerate(pdf_reader.pages):
-                        logger.info(f"Processing page {page_num + 1}/{len(pdf_reader.pages)}")
+                    total_pages = len(pdf_reader.pages)
+                    logger.info("PDF loaded with %s pages", total_pages)
+
+                    page_texts = {}
+                    # Every page is extracted, even on resume, as recipes run over page breaks
+                    for page_num in range(1, total_pages + 1):
                         try:
-                            text = page.extract_text()
-                            chunks = self.text_splitter.split_text(text)
-                            logger.info(f"Page {page_num + 1} split into {len(chunks)} chunks")
-                            
-                            for chunk_num, chunk in enumerate(chunks):
-                                try:
-                                    self.vector_service.store_chunk(
-                                        document=document,
-                                        chunk_text=chunk['text'],
-                                        chunk_index=chunk_index
-                                    )
-                                    chunk_index += 1
-                                    successful_chunks += 1
-                                    logger.info(f"Successfully stored chunk {chunk_num + 1}/{len(chunks)} from page {page_num + 1}")
-                                except Exception as e:
-                                    logger.error(f"Error processing chunk {chunk_num + 1} in page {page_num + 1}: {e}")
-                                    continue
-                        
+                            page_texts[page_num] = pdf_reader.pages[page_num - 1].extract_text()
                         except Exception as e:
-                            logger.error(f"Error processing page {page_num + 1}: {e}")
-                            continue
+                            logger.error("Error extracting text from page %s: %s", page_num, e)
+
+            # The whole document is tokenized in one threaded batch
+            with stage('ingest', 'split'):
+                pages_chunks = self.text_splitter.split_pages(page_texts)
+
+            page_hashes = {
+                page_number: self._page_hash(text, pages_chunks[page_number])
+                for page_number, text in page_texts.items()
+            }
+            # Pages completed by an earlier run are skipped
+            pending = {page_number for page_number in page_texts if page_number > checkpoint.last_completed_page}
+            changed = [
+                page_number for page_number in sorted(pending)
+                if not self._is_unchanged(pages.get(page_number), page_hashes[page_number])
+            ]
+            logger.info("%s of %s pages unchanged, skipping them", len(pending) - len(changed), len(pending))
+            record_cache_lookup('page_fingerprint', True, len(pending) - len(changed))
+            record_cache_lookup('page_fingerprint', False, len(changed))
+
+            for page_number in changed:
+                chunks = pages_chunks[page_number]
+                logger.debug("Page %s split into %s chunks", page_number, len(chunks))
+                stored_chunks, stored_tokens = self._store_page(
+                    document, checkpoint, page_number, page_hashes[page_number], chunks
+                )
+                successful_chunks += stored_chunks
+                embedded_tokens += stored_tokens
+                changed_pages += 1
+
+            changed_pages += self._remove_missing_pages(document, pages, range(1, total_pages + 1))
+            self._finish(document, checkpoint, successful_chunks, renumber=changed_pages > 0 and bool(pages))
+            return {'pages': len(pending), 'chunks': successful_chunks, 'tokens': embedded_tokens}
 
-            final_status = 'processed' if successful_chunks > 0 else 'error'
-            logger.info(f"Document processing completed. Status: {final_status}, Successful chunks: {successful_chunks}")
-            document.status = final_status
-            document.save()
-        
         except Exception as e:
-            logger.error(f"Error processing document {document_id}: {e}")
+            logger.error("Error processing document %s: %s", document_id, e)
             document.status = 'error'
             document.save()
-            raise 
+            raise
+
+    @attributed_to_document('ingest')
+    def process_document_with_google_drive_in_batches(self, document_id: str, batch_size: int = 20,
+                                                      resume: bool = False) -> Dict[str, int]:
+        """
+        Process a large document by splitting it into smaller batches for Google Drive.
 
-    def process_document_with_google_drive_in_batches(self, document_id: str, batch_size: int = 20):
-        """Process a large document by splitting it into smaller batches for Google Drive"""
+        Returns the pages read and the chunks and tokens embedded by this run.
+        """
         try:
             document = StoredDocument.objects.get(id=document_id)
-            logger.info(f"Starting to process document {document_id} with Google Drive in batches")
+            logger.info("%s to process document %s with Google Drive in batches",
+                        'Resuming' if resume else 'Starting', document_id)
             document.status = 'processing'
             document.save()
-            
+
             file_path = Path(document.file_path)
-            
+            pages = self._load_pages(document)
+            checkpoint = self._start_checkpoint(document, 'google_drive_batched', batch_size=batch_size, resume=resume)
+            # A resumed run must cut the same batches as the run it continues
+            batch_size = checkpoint.batch_size
+            successful_chunks = 0
+            embedded_tokens = 0
+            changed_pages = 0
+
             # Split PDF into smaller PDFs (using PyPDF2 to split)
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
                 total_pages = len(pdf_reader.pages)
-                logger.info(f"PDF has {total_pages} pages, processing in batches")
-                
-                chunk_index = 0
-                successful_chunks = 0
-                
-                # Process PDF in batches
-                for batch_start in range(0, total_pages, batch_size):
-                    batch_end = min(batch_start + batch_size, total_pages)
-                    logger.info(f"Processing batch of pages {batch_start+1}-{batch_end}")
-                    
-                    # Create temporary PDF with this batch of pages
-                    pdf_writer = PyPDF2.PdfWriter()
-                    for page_num in range(batch_start, batch_end):
-                        pdf_writer.add_page(pdf_reader.pages[page_num])
-                    
-                    # Save temporary batch PDF
-                    temp_pdf_path = file_path.with_name(f"{file_path.stem}_batch_{batch_start}.pdf")
-                    with open(temp_pdf_path, 'wb') as temp_file:
-                        pdf_writer.write(temp_file)
-                    
-                    # Process this batch with Google Drive
+                logger.info("PDF has %s pages, processing in batches", total_pages)
+
+                # Batches completed by an earlier run are skipped
+                batches = [
+                    (batch_start, min(batch_start + batch_size, total_pages))
+                    for batch_start in range(0, total_pages, batch_size)
+                    if batch_start + 1 > checkpoint.last_completed_page
+                ]
+
+                # Batches are converted concurrently; their text is stored in page order as
+                # soon as the earliest outstanding batch is done. Failures stop the run so that
+                # resuming continues from the failed batch.
+                with closing(self._convert_batches(pdf_reader, file_path, batches)) as converted:
+                    for (batch_start, batch_end), batch_text in converted:
+                        page_number = batch_start + 1
+                        # Every batch is split on its own, so its chunks only depend on its text
+                        text_hash = self.compute_text_hash(batch_text)
+                        unchanged = self._is_unchanged(pages.get(page_number), text_hash)
+                        record_cache_lookup('page_fingerprint', unchanged)
+                        if not unchanged:
+                            with stage('ingest', 'split'):
+                                batch_chunks = self.text_splitter.split_text(batch_text)
+                            stored_chunks, stored_tokens = self._store_page(
+                                document, checkpoint, page_number, text_hash, batch_chunks
+                            )
+                            successful_chunks += stored_chunks
+                            embedded_tokens += stored_tokens
+                            changed_pages += 1
+
+                batch_pages = range(1, total_pages + 1, batch_size)
+                changed_pages += self._remove_missing_pages(document, pages, batch_pages)
+                self._finish(document, checkpoint, successful_chunks, renumber=changed_pages > 0 and bool(pages))
+                batched_pages = sum(batch_end - batch_start for batch_start, batch_end in batches)
+                return {'pages': batched_pages, 'chunks': successful_chunks, 'tokens': embedded_tokens}
+
+        except Exception as e:
+            logger.error("Error processing document %s with batched Google Drive: %s", document_id, e)
+            document.status = 'error'
+            document.save()
+            raise
+
+    def _convert_batches(self, pdf_reader: PyPDF2.PdfReader, file_path: Path,
+                         batches: List[Tuple[int, int]]) -> Iterator[Tuple[Tuple[int, int], str]]:
+        """
+        Convert page batches with Google Drive on a bounded thread pool.
+
+        Yields (batch, text) in page order. Batch PDFs only live in memory and at most
+        `max_workers * 2` batches are in flight, which bounds memory; the Drive quota is
+        enforced by the token bucket of the shared GoogleDriveService.
+        """
+        max_workers = max(1, settings.GOOGLE_DRIVE_MAX_WORKERS)
+        pending = deque()
+        remaining = iter(batches)
+
+        def submit_next(executor) -> bool:
+            batch = next(remaining, None)
+            if batch is None:
+                return False
+            batch_start, batch_end = batch
+            logger.info("Processing batch of pages %s-%s", batch_start+1, batch_end)
+
+            # PdfReader is not thread-safe, so batch PDFs are built here and only the
+            # Drive round-trips run on the pool
+            pdf_writer = PyPDF2.PdfWriter()
+            for page_num in range(batch_start, batch_end):
+                pdf_writer.add_page(pdf_reader.pages[page_num])
+
+            batch_pdf = BytesIO()
+            pdf_writer.write(batch_pdf)
+            batch_pdf.seek(0)
+
+            batch_name = f"{file_path.stem}_batch_{batch_start}.pdf"
+            pending.append((batch, executor.submit(
+                self.google_drive_service.process_pdf_stream_with_drive, batch_pdf, batch_name
+            )))
+            return True
+
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='drive-batch')
+        try:
+            while len(pending) < max_workers * 2 and submit_next(executor):
+                pass
+            while pending:
+                batch, future = pending.popleft()
+                batch_text = future.result()
+                submit_next(executor)
+                yield batch, batch_text
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def resume(self, document_id: str) -> Dict[str, int]:
+        """
+        Continue an interrupted or failed ingestion from its checkpoint.
+
+        Pages completed by the previous run are skipped without being extracted or
+        embedded again, and the page that was being written continues after its last
+        stored chunk. The document is claimed first, so a run that is still writing
+        chunks and checkpoints is never continued a second time.
+        """
+        checkpoint = IngestionCheckpoint.objects.filter(document_id=document_id).first()
+        if checkpoint is None:
+            raise ValueError(f"Document {document_id} has no ingestion checkpoint to resume from")
+        claimed = StoredDocument.objects.filter(id=document_id).exclude(status='processing').update(status='processing')
+        if not claimed:
+            raise DocumentBusyError(f"Document {document_id} is already being processed")
+
+        logger.info("Resuming document %s after page %s (%s)",
+                    document_id, checkpoint.last_completed_page, checkpoint.mode)
+        if checkpoint.mode == 'google_drive_batched':
+            return self.process_document_with_google_drive_in_batches(
+                document_id, batch_size=checkpoint.batch_size, resume=True
+            )
+        return self.process_document(
+            document_id, use_google_drive=checkpoint.mode == 'google_drive', resume=True
+        )
+
+    @attributed_to_document('ingest')
+    def process_document_with_batch_api(self, document_id: str) -> Dict[str, int]:
+        """
+        Extract and split a document now, and embed its changed pages through the OpenAI
+        Batch API. Pages are never split across batches, so every batch can be imported on
+        its own. The document stays 'processing' until `collect_embedding_batches` has
+        imported all of its batches.
+
+        Returns the pages read and the batches and embedding requests submitted.
+        """
+        try:
+            document = StoredDocument.objects.get(id=document_id)
+            if document.embedding_batches.exclude(status='imported').exists():
+                raise ValueError(f"Document {document_id} still has embedding batches in flight")
+            logger.info("Starting to process document %s with the Batch API", document_id)
+            document.status = 'processing'
+            document.save()
+
+            # The Batch API always embeds with OpenAI, whatever EMBEDDING_PROVIDER is
+            pages = self._load_pages(document, provider_name=OPENAI_PROVIDER_NAME)
+            with stage('ingest', 'extract'), open(document.file_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                total_pages = len(pdf_reader.pages)
+                logger.info("PDF loaded with %s pages", total_pages)
+
+                page_texts = {}
+                for page_num in range(1, total_pages + 1):
                     try:
-                        batch_text = self.google_drive_service.process_pdf_with_drive(temp_pdf_path)
-                        batch_chunks = self.text_splitter.split_text(batch_text)
-                        
-                        for chunk_num, chunk in enumerate(batch_chunks):
-                            try:
-                                self.vector_service.store_chunk(
-                                    document=document,
-                                    chunk_text=chunk['text'],
-                                    chunk_index=chunk_index
-                                )
-                                chunk_index += 1
-                                successful_chunks += 1
-                            except Exception as e:
-                                logger.error(f"Error processing chunk {chunk_num} in batch {batch_start}: {e}")
-                                continue
-                        
-                        # Clean up temporary file
-                        temp_pdf_path.unlink()
-                        
+                        page_texts[page_num] = pdf_reader.pages[page_num - 1].extract_text()
                     except Exception as e:
-                        logger.error(f"Error processing batch {batch_start}-{batch_end}: {e}")
-                        continue
-                
-                final_status = 'processed' if successful_chunks > 0 else 'error'
-                logger.info(f"Document processing completed. Status: {final_status}, Successful chunks: {successful_chunks}")
-                document.status = final_status
-                document.save()
-        
+                        logger.error("Error extracting text from page %s: %s", page_num, e)
+
+            with stage('ingest', 'split'):
+                pages_chunks = self.text_splitter.split_pages(page_texts)
+            page_hashes = {
+                page_number: self._page_hash(text, pages_chunks[page_number])
+                for page_number, text in page_texts.items()
+            }
+            changed = [
+                page_number for page_number in page_texts
+                if not self._is_unchanged(pages.get(page_number), page_hashes[page_number])
+            ]
+            logger.info("%s of %s pages unchanged, skipping them", len(page_texts) - len(changed), len(page_texts))
+            record_cache_lookup('page_fingerprint', True, len(page_texts) - len(changed))
+            record_cache_lookup('page_fingerprint', False, len(changed))
+
+            # Group pages into batches of at most OPENAI_BATCH_MAX_REQUESTS chunks; pages
+            # without chunks need no embeddings and are recorded right away
+            groups = [[]]
+            group_size = 0
+            for page_number in changed:
+                chunks = pages_chunks[page_number]
+                texts = [chunk['text'] for chunk in chunks]
+                if not texts:
+                    self._replace_page(document, page_number, page_hashes[page_number], [], [])
+                    continue
+                if groups[-1] and group_size + len(texts) > settings.OPENAI_BATCH_MAX_REQUESTS:
+                    groups.append([])
+                    group_size = 0
+                titles = [chunk.get('title') for chunk in chunks]
+                groups[-1].append((page_number, page_hashes[page_number], texts, titles))
+                group_size += len(texts)
+            groups = [group for group in groups if group]
+
+            batch_service = BatchEmbeddingService(self.openai_service)
+            batch_dir = Path(settings.DOCUMENTS_DIR) / '.batches'
+            batch_dir.mkdir(exist_ok=True)
+            requests = 0
+            for number, group in enumerate(groups, start=1):
+                input_path = batch_dir / f"{document.id}_{number}.jsonl"
+                request_count = batch_service.write_requests(
+                    input_path, [(page_number, texts) for page_number, _, texts, _ in group]
+                )
+                batch = batch_service.submit(input_path, metadata={'document_id': str(document.id)})
+                EmbeddingBatch.objects.create(
+                    document=document,
+                    batch_id=batch.id,
+                    input_file_id=batch.input_file_id,
+                    input_path=str(input_path),
+                    status=batch.status,
+                    pages={str(page_number): text_hash for page_number, text_hash, _, _ in group},
+                    headings={
+                        batch_service.custom_id(page_number, offset): title
+                        for page_number, _, _, titles in group
+                        for offset, title in enumerate(titles) if title
+                    },
+                    total_pages=total_pages,
+                    request_count=request_count,
+                )
+                requests += request_count
+
+            if not groups:
+                # Nothing to embed, the document can be completed immediately
+                self._finish_batched_document(document, total_pages)
+            logger.info("Submitted %s embedding requests in %s batches for document %s",
+                        requests, len(groups), document_id)
+            return {'pages': len(page_texts), 'batches': len(groups), 'requests': requests}
+
         except Exception as e:
-            logger.error(f"Error processing document {document_id} with batched Google Drive: {e}")
+            logger.error("Error submitting document %s to the Batch API: %s", document_id, e)
             document.status = 'error'
             document.save()
-            raise 
\ No newline at end of file
+            raise
+
+    def collect_embedding_batches(self, document_id: str = None) -> Dict[str, int]:
+        """
+        Poll the open embedding batches (of one document, or of all) and import the results
+        of finished ones. Requests that failed, or never ran because their batch expired or
+        was cancelled, are embedded synchronously instead. A document is completed once all
+        of its batches are imported.
+
+        Returns the number of batches imported and still pending, and the chunks stored.
+        """
+        batch_service = BatchEmbeddingService(self.openai_service)
+        open_batches = EmbeddingBatch.objects.exclude(status='imported').select_related('document')
+        if document_id is not None:
+            open_batches = open_batches.filter(document_id=document_id)
+
+        summary = {'imported': 0, 'pending': 0, 'errors': 0, 'chunks': 0, 'fallback_chunks': 0}
+        touched = {}
+        for embedding_batch in open_batches.order_by('created_at'):
+            document = embedding_batch.document
+            try:
+                batch = batch_service.retrieve(embedding_batch.batch_id)
+                embedding_batch.status = batch.status
+                embedding_batch.output_file_id = batch.output_file_id or ''
+                embedding_batch.error_file_id = batch.error_file_id or ''
+                embedding_batch.save()
+                if batch.status not in TERMINAL_STATUSES:
+                    summary['pending'] += 1
+                    continue
+
+                with stage('ingest', 'batch_import'), attribute_usage('ingest', document_id=document.id):
+                    chunks, fallback_chunks = self._import_embedding_batch(batch_service, embedding_batch)
+                summary['imported'] += 1
+                summary['chunks'] += chunks
+                summary['fallback_chunks'] += fallback_chunks
+                touched[document.id] = (document, embedding_batch.total_pages)
+            except Exception as e:
+                # The batch stays open, so the next collection retries it
+                logger.error("Error collecting embedding batch %s: %s", embedding_batch.batch_id, e)
+                summary['errors'] += 1
+                document.status = 'error'
+                document.save()
+
+        for document, total_pages in touched.values():
+            if not document.embedding_batches.exclude(status='imported').exists():
+                self._finish_batched_document(document, total_pages)
+        return summary
+
+    def _import_embedding_batch(self, batch_service: BatchEmbeddingService,
+                                embedding_batch: EmbeddingBatch) -> Tuple[int, int]:
+        """Store the chunks of every page of a finished batch; returns the chunks stored and embedded synchronously."""
+        texts = {}
+        for custom_id, text in batch_service.read_requests(
+                Path(embedding_batch.input_path), embedding_batch.input_file_id):
+            texts[custom_id] = text
+
+        embeddings = {}
+        batch_tokens = 0
+        if embedding_batch.output_file_id:
+            for custom_id, embedding, tokens in batch_service.iter_results(embedding_batch.output_file_id):
+                if custom_id in texts:
+                    embeddings[custom_id] = embedding
+                    batch_tokens += tokens
+
+        missing = [custom_id for custom_id in texts if custom_id not in embeddings]
+        if missing:
+            logger.warning(
+                "Batch %s (%s) has no result for %s of %s requests, embedding them synchronously",
+                embedding_batch.batch_id, embedding_batch.status, len(missing), len(texts)
+            )
+            # Embedded by OpenAI as well, so the page does not mix vector spaces
+            provider = OpenAIEmbeddingProvider(self.openai_service)
+            for group_start in range(0, len(missing), CHECKPOINT_CHUNKS):
+                group = missing[group_start:group_start + CHECKPOINT_CHUNKS]
+                embeddings.update(zip(group, provider.embed_for_storage([texts[custom_id] for custom_id in group])))
+
+        page_chunks = {}
+        for custom_id in texts:
+            page_number, offset = batch_service.parse_custom_id(custom_id)
+            page_chunks.setdefault(page_number, []).append((offset, custom_id))
+
+        document = embedding_batch.document
+        with transaction.atomic():
+            # Another collector may have imported the batch in the meantime
+            locked = EmbeddingBatch.objects.select_for_update().get(pk=embedding_batch.pk)
+            if locked.status == 'imported':
+                return 0, 0
+            for page_key, text_hash in embedding_batch.pages.items():
+                custom_ids = [custom_id for _, custom_id in sorted(page_chunks.get(int(page_key), []))]
+                self._replace_page(
+                    document, int(page_key), text_hash,
+                    [texts[custom_id] for custom_id in custom_ids],
+                    [embeddings[custom_id] for custom_id in custom_ids],
+                    provider_name=OPENAI_PROVIDER_NAME,
+                    headings=[embedding_batch.headings.get(custom_id) for custom_id in custom_ids],
+                )
+            embedding_batch.status = 'imported'
+            embedding_batch.failed_count = len(missing)
+            embedding_batch.save()
+            if embeddings:
+                record_usage(OPENAI_EMBEDDING_MODEL, 'batch_embedding', prompt_tokens=batch_tokens)
+
+        # The request file is only needed until its results are stored
+        Path(embedding_batch.input_path).unlink(missing_ok=True)
+        logger.info("Imported %s chunks of %s pages from batch %s",
+                    len(texts), len(embedding_batch.pages), embedding_batch.batch_id)
+        return len(texts), len(missing)
+
+    def _replace_page(self, document: StoredDocument, page_number: int, text_hash: str,
+                      chunk_texts: List[str], embeddings: List, provider_name: str = None,
+                      headings: List[str] = None) -> None:
+        """Swap the chunks of one page for already embedded ones and record its text hash."""
+        with transaction.atomic():
+            removed, _ = document.chunks.filter(page_number=page_number).delete()
+            if removed:
+                logger.debug("Page %s changed, removed %s old chunks", page_number, removed)
+            if chunk_texts:
+                self.vector_service.store_chunks(
+                    document, chunk_texts, embeddings, self._next_chunk_index(document), page_number=page_number,
+                    provider_name=provider_name, headings=headings
+                )
+            DocumentPage.objects.update_or_create(
+                document=document,
+                page_number=page_number,
+                defaults={'text_hash': text_hash, 'chunk_count': len(chunk_texts)}
+            )
+
+    def _finish_batched_document(self, document: StoredDocument, total_pages: int):
+        pages = {page.page_number: page for page in document.pages.all()}
+        self._remove_missing_pages(document, pages, range(1, total_pages + 1))
+        # New chunks were appended after the existing ones, make the indexes contiguous again
+        self._renumber_chunks(document)
+        final_status = 'processed' if document.chunks.exists() else 'error'
+        logger.info("Batch API processing of document %s completed. Status: %s", document.id, final_status)
+        document.status = final_status
+        document.save()
+
+    def _start_checkpoint(self, document: StoredDocument, mode: str, batch_size: int = None,
+                          resume: bool = False) -> IngestionCheckpoint:
+        checkpoint = IngestionCheckpoint.objects.filter(document=document).first()
+        if resume and checkpoint is not None and checkpoint.mode == mode:
+            return checkpoint
+
+        checkpoint, _ = IngestionCheckpoint.objects.update_or_create(
+            document=document,
+            defaults={
+                'mode': mode,
+                'batch_size': batch_size,
+                'last_completed_page': 0,
+                'next_chunk_index': self._next_chunk_index(document),
+                'current_page': None,
+                'current_page_hash': '',
+                'current_page_chunks': 0,
+            }
+        )
+        return checkpoint
+
+    def _load_pages(self, document: StoredDocument, provider_name: str = None) -> Dict[int, DocumentPage]:
+        pages = {page.page_number: page for page in document.pages.all()}
+        if document.chunks.filter(page_number__isnull=True).exists():
+            # Chunks stored before pages were fingerprinted cannot be matched to pages
+            logger.info("Document %s has no page fingerprints, re-ingesting it completely", document.id)
+            document.chunks.all().delete()
+            document.pages.all().delete()
+            return {}
+
+        # Pages embedded by another provider must be re-embedded even if their text is unchanged
+        provider_name = provider_name or self.vector_service.provider.name
+        stale = set(
+            document.chunks.exclude(embedding_provider=provider_name).values_list('page_number', flat=True).distinct()
+        )
+        if stale:
+            logger.info("%s pages of document %s were embedded by another provider", len(stale), document.id)
+            for page_number in stale & pages.keys():
+                pages[page_number].text_hash = ''
+        return pages
+
+    def _page_hash(self, text: str, chunks: List[Dict[str, str]]) -> str:
+        """
+        Fingerprint of a page split with the rest of its document: its own text and the
+        chunks it starts, which also change when a later page of their recipe does.
+        """
+        return self.compute_text_hash('\x00'.join([text, *(chunk['text'] for chunk in chunks)]))
+
+    @staticmethod
+    def _is_unchanged(page: DocumentPage, text_hash: str) -> bool:
+        return page is not None and page.text_hash == text_hash
+
+    def _store_page(self, document: StoredDocument, checkpoint: IngestionCheckpoint, page_number: int,
+                    text_hash: str, chunks: List[Dict[str, str]]) -> Tuple[int, int]:
+        """
+        Replace the chunks of one page, record its text hash and advance the checkpoint.
+
+        Chunks are embedded outside of any transaction and written in groups; every
+        group is committed together with the checkpoint, so a crash loses at most the
+        group in flight and never leaves rows the checkpoint does not know about.
+        Returns the number of chunks and tokens stored by this call.
+        """
+        resuming = checkpoint.current_page == page_number and checkpoint.current_page_hash == text_hash
+        done = checkpoint.current_page_chunks if resuming else 0
+        if done:
+            logger.info("Page %s already has %s of %s chunks stored, continuing", page_number, done, len(chunks))
+
+        for group_start in range(done, len(chunks), CHECKPOINT_CHUNKS):
+            group_chunks = chunks[group_start:group_start + CHECKPOINT_CHUNKS]
+            group = [chunk['text'] for chunk in group_chunks]
+            embeddings = self.vector_service.embed_texts(group)
+
+            with stage('ingest', 'store'), transaction.atomic():
+                if group_start == 0:
+                    removed, _ = document.chunks.filter(page_number=page_number).delete()
+                    if removed:
+                        logger.debug("Page %s changed, removed %s old chunks", page_number, removed)
+                self.vector_service.store_chunks(
+                    document, group, embeddings, checkpoint.next_chunk_index, page_number=page_number,
+                    headings=[chunk.get('title') for chunk in group_chunks]
+                )
+                checkpoint.next_chunk_index += len(group)
+                checkpoint.current_page = page_number
+                checkpoint.current_page_hash = text_hash
+                checkpoint.current_page_chunks = group_start + len(group)
+                checkpoint.save()
+
+        with transaction.atomic():
+            if not chunks:
+                document.chunks.filter(page_number=page_number).delete()
+            DocumentPage.objects.update_or_create(
+                document=document,
+                page_number=page_number,
+                defaults={'text_hash': text_hash, 'chunk_count': len(chunks)}
+            )
+            checkpoint.last_completed_page = page_number
+            checkpoint.current_page = None
+            checkpoint.current_page_hash = ''
+            checkpoint.current_page_chunks = 0
+            checkpoint.save()
+
+        return len(chunks) - done, sum(chunk['token_count'] for chunk in chunks[done:])
+
+    def _remove_missing_pages(self, document: StoredDocument, pages: Dict[int, DocumentPage],
+                              page_numbers: range) -> int:
+        """Drop chunks of pages that no longer exist in the new version of the file."""
+        missing = [page_number for page_number in pages if page_number not in page_numbers]
+        if missing:
+            document.chunks.filter(page_number__in=missing).delete()
+            document.pages.filter(page_number__in=missing).delete()
+            logger.info("Removed %s pages no longer present in the document", len(missing))
+        return len(missing)
+
+    @staticmethod
+    def _next_chunk_index(document: StoredDocument) -> int:
+        last_index = document.chunks.aggregate(last=Max('chunk_index'))['last']
+        return 0 if last_index is None else last_index + 1
+
+    @staticmethod
+    def _renumber_chunks(document: StoredDocument):
+        """Make chunk indexes contiguous again, in page order, after pages were replaced."""
+        table = DocumentChunk._meta.db_table
+        with connection.cursor() as cursor:
+            # Move out of the way first so the unique (document, chunk_index) pair never collides
+            cursor.execute(
+                f"UPDATE {table} SET chunk_index = chunk_index + 1000000000 WHERE document_id = %s",
+                [document.id]
+            )
+            cursor.execute(
+                f"""
+                UPDATE {table} AS chunk SET chunk_index = ordered.position - 1
+                FROM (
+                    SELECT id, row_number() OVER (ORDER BY page_number NULLS FIRST, chunk_index) AS position
+                    FROM {table} WHERE document_id = %s
+                ) AS ordered
+                WHERE chunk.id = ordered.id
+                """,
+                [document.id]
+            )
+
+    def _finish(self, document: StoredDocument, checkpoint: IngestionCheckpoint, successful_chunks: int,
+                renumber: bool = False):
+        if renumber:
+            self._renumber_chunks(document)
+            checkpoint.next_chunk_index = document.chunks.count()
+            checkpoint.save()
+
+        has_chunks = successful_chunks > 0 or document.chunks.exists()
+        final_status = 'processed' if has_chunks else 'error'
+        logger.info("Document %s processing completed. Status: %s, Successful chunks: %s",
+                    document.id, final_status, successful_chunks)
+        document.status = final_status
+        document.save()
@@ -1,21 +1,35 @@
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
 from django.conf import settings
 import logging
 from pathlib import Path
 import mimetypes
 from io import BytesIO
-from typing import Dict, Any
-import asyncio
+from typing import Dict, Any, Callable, BinaryIO
+import threading
+
+from ai_cooking_project.metrics import stage
+from .rate_limiter import TokenBucket
 
 logger = logging.getLogger(__name__)
 
 class GoogleDriveService:
-    def __init__(self):
-        self.credentials = self._get_credentials()
-        self.service = build('drive', 'v3', credentials=self.credentials)
-        
+    def __init__(self, service_factory: Callable[[], Any] = None, rate_limiter: TokenBucket = None):
+        """
+        Args:
+            service_factory: Builds a Drive API resource. Defaults to the real Drive v3 API;
+                tests and benchmarks pass a factory returning a local fake.
+            rate_limiter: Token bucket shared by all threads using this service, one token per API call
+        """
+        self.credentials = None if service_factory else self._get_credentials()
+        self._service_factory = service_factory or self._build_service
+        self._local = threading.local()
+        self.rate_limiter = rate_limiter or TokenBucket(
+            rate=settings.GOOGLE_DRIVE_REQUESTS_PER_SECOND,
+            capacity=settings.GOOGLE_DRIVE_REQUESTS_PER_SECOND,
+        )
+
         self.mime_types = {
             'doc': 'application/msword',
             'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
@@ -26,6 +40,42 @@ class GoogleDriveService:
             'googleSheet': 'application/vnd.google-apps.spreadsheet',
         }
 
+    @property
+    def service(self):
+        """Drive API resource of the calling thread; the underlying httplib2 client is not thread-safe."""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self._service_factory()
+            self._local.service = service
+        return service
+
+    def _build_service(self):
+        return build('drive', 'v3', credentials=self.credentials)
+
+    def _execute(self, request):
+        """Execute an API request within the Drive quota."""
+        self.rate_limiter.acquire()
+        return request.execute()
+
+    def _upload(self, stream: BinaryIO, name: str, mime_type: str) -> Dict[str, Any]:
+        """
+        Upload a stream with a resumable, chunked upload.
+
+        Only one chunk of `GOOGLE_DRIVE_CHUNK_SIZE` bytes is read into memory at a time,
+        and every chunk is a separate request within the Drive quota.
+        """
+        media = MediaIoBaseUpload(stream, mime_type, chunksize=settings.GOOGLE_DRIVE_CHUNK_SIZE, resumable=True)
+        request = self.service.files().create(
+            body={'name': name},
+            media_body=media,
+            fields='id,name,webViewLink'
+        )
+        response = None
+        while response is None:
+            self.rate_limiter.acquire()
+            _, response = request.next_chunk()
+        return response
+
     def _get_credentials(self):
         """Get Google Drive credentials using service account file"""
         try:
@@ -51,64 +101,54 @@ class GoogleDriveService:
         try:
             if mime_type is None:
                 mime_type = mimetypes.guess_type(str(file_path))[0]
-                
-            file_metadata = {'name': file_path.name}
+
             with open(file_path, 'rb') as f:
-                media = MediaIoBaseUpload(BytesIO(f.read()), mime_type)
-                file = self.service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id,name,webViewLink'
-                ).execute()
-            return file
+                return self._upload(f, file_path.name, mime_type)
         except Exception as e:
             logger.error(f"Error uploading file to Google Drive: {e}")
-            raise 
+            raise
 
     def upload_and_convert(self, file_path: Path) -> Dict[str, Any]:
         """Upload file to Google Drive and convert to Google Doc/Sheet if possible."""
+        mime_type = mimetypes.guess_type(str(file_path))[0]
+        with open(file_path, 'rb') as f:
+            return self.upload_and_convert_stream(f, file_path.name, mime_type)
+
+    def upload_and_convert_stream(self, stream: BinaryIO, name: str, mime_type: str) -> Dict[str, Any]:
+        """Upload a file-like object to Google Drive and convert to Google Doc/Sheet if possible."""
         try:
-            mime_type = mimetypes.guess_type(str(file_path))[0]
-            
             # Upload file
-            file_metadata = {'name': file_path.name}
-            with open(file_path, 'rb') as f:
-                media = MediaIoBaseUpload(BytesIO(f.read()), mime_type)
-                file = self.service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id,name,webViewLink'
-                ).execute()
-            
+            file = self._upload(stream, name, mime_type)
+
             # Convert to Google format if it's a document/spreadsheet
-            if mime_type in ['application/pdf', 'application/msword', 
+            if mime_type in ['application/pdf', 'application/msword',
                             'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
                 # Copy to Google Doc format
-                copied_file = self.service.files().copy(
+                copied_file = self._execute(self.service.files().copy(
                     fileId=file['id'],
                     body={'mimeType': 'application/vnd.google-apps.document'}
-                ).execute()
-                
+                ))
+
                 # Export as plain text
-                text_content = self.service.files().export(
+                text_content = self._execute(self.service.files().export(
                     fileId=copied_file['id'],
                     mimeType='text/plain'
-                ).execute()
-                
+                ))
+
                 # Clean up - delete the Google Doc copy (optional)
-                self.service.files().delete(fileId=copied_file['id']).execute()
-                
+                self._execute(self.service.files().delete(fileId=copied_file['id']))
+
                 return {
                     "id": file['id'],
                     "webViewLink": file['webViewLink'],
                     "text": text_content.decode('utf-8') if isinstance(text_content, bytes) else text_content
                 }
-            
+
             return {
                 "id": file['id'],
                 "webViewLink": file['webViewLink']
             }
-        
+
         except Exception as e:
             logger.error(f"Error in upload_and_convert: {e}")
             raise
@@ -116,22 +156,57 @@ class GoogleDriveService:
     def download_file(self, file_id: str) -> bytes:
         """Download a file from Google Drive by ID"""
         try:
-            request = self.service.files().get_media(fileId=file_id)
-            file_content = request.execute()
-            return file_content
+            buffer = BytesIO()
+            self._download(file_id, buffer)
+            return buffer.getvalue()
         except Exception as e:
             logger.error(f"Error downloading file from Google Drive: {e}")
             raise
 
+    def download_to_path(self, file_id: str, destination: Path) -> Path:
+        """
+        Stream a file from Google Drive to disk, one chunk at a time.
+
+        The data is written to a `.part` file that is renamed once complete, so an
+        interrupted download never leaves a truncated file at `destination`.
+        """
+        partial_path = destination.with_name(f"{destination.name}.part")
+        try:
+            with open(partial_path, 'wb') as f:
+                self._download(file_id, f)
+            partial_path.replace(destination)
+            return destination
+        except Exception as e:
+            logger.error(f"Error downloading file {file_id} from Google Drive: {e}")
+            partial_path.unlink(missing_ok=True)
+            raise
+
+    def _download(self, file_id: str, stream: BinaryIO):
+        downloader = MediaIoBaseDownload(
+            stream,
+            self.service.files().get_media(fileId=file_id),
+            chunksize=settings.GOOGLE_DRIVE_CHUNK_SIZE
+        )
+        done = False
+        while not done:
+            self.rate_limiter.acquire()
+            _, done = downloader.next_chunk()
+
     def process_pdf_with_drive(self, file_path: Path) -> str:
         """Process a PDF file using Google Drive for better text extraction"""
+        with open(file_path, 'rb') as f:
+            return self.process_pdf_stream_with_drive(f, file_path.name)
+
+    def process_pdf_stream_with_drive(self, stream: BinaryIO, name: str) -> str:
+        """Process an in-memory or on-disk PDF stream using Google Drive, without temporary files"""
         try:
-            result = self.upload_and_convert(file_path)
-            
-            # Delete the file from Drive after processing
-            self.service.files().delete(fileId=result['id']).execute()
-            
+            with stage('ingest', 'drive_convert'):
+                result = self.upload_and_convert_stream(stream, name, 'application/pdf')
+
+                # Delete the file from Drive after processing
+                self._execute(self.service.files().delete(fileId=result['id']))
+
             return result.get('text', '')
         except Exception as e:
             logger.error(f"Error processing PDF with Google Drive: {e}")
-            raise
\ No newline at end of file
+            raise
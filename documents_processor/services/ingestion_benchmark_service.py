@@ -0,0 +1,250 @@
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from collections import Counter, defaultdict
+from pathlib import Path
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from openai import OpenAI
+
+from ai_cooking_project.metrics import STAGE_SECONDS, current_stage
+from ..fakes.drive import FakeDriveService
+from ..fakes.openai_server import FakeOpenAIServer
+from ..fakes.pdf import cookbook_pdf
+from ..models import OpenAIUsage, StoredDocument
+from .file_processor_service import FileProcessorService
+from .google_drive_service import GoogleDriveService
+from .openai_scheduler import BULK, OpenAIScheduler
+from .openai_service import OpenAIService
+
+logger = logging.getLogger(__name__)
+
+INGESTION_MODES = ('pypdf2', 'google_drive_batched')
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'COPY')
+# Stage pipelines reported: ingestion stages and the time spent in OpenAI calls per model
+REPORTED_PIPELINES = ('ingest', 'openai')
+
+
+class _QueryTimer:
+    """Execute wrapper summing query time per current metrics stage, split into reads and writes."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.queries = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            pipeline_stage = current_stage()
+            name = pipeline_stage[1] if pipeline_stage else 'other'
+            kind = 'write' if sql.lstrip()[:6].upper() in WRITE_STATEMENTS else 'read'
+            with self._lock:
+                self.seconds[(name, kind)] += elapsed
+                self.queries[name] += 1
+
+
+class _PeakRss:
+    """Samples the resident set size of the process in a background thread while active."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.start = self.peak = self._rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='peak-rss', daemon=True)
+
+    @staticmethod
+    def _rss() -> int:
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            # Without procfs only the lifetime peak is known (kilobytes on Linux)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+class IngestionBenchmark:
+    """
+    Ingests synthetic cookbook PDFs through FileProcessorService with OpenAI and Google
+    Drive replaced by local fakes, and reports throughput, peak RSS and the time spent
+    in every ingestion stage, in its database queries and in each OpenAI model.
+
+    The fakes add configurable latency, rate limits and errors, so runs cost nothing
+    and depend on the network only as much as configured. Client-side quotas are left
+    out (the fake server enforces its own rate limit), so the shared quota buckets of
+    real traffic are not touched. Benchmark documents are deleted afterwards.
+    """
+
+    def __init__(self, modes: List[str], documents: int = 5, pages: int = 50, drive_batch_size: int = 20,
+                 openai_latency: float = 0.05, openai_requests_per_minute: int = None, openai_error_rate: float = 0.0,
+                 drive_latency: float = 0.2, drive_fail_every: int = 0, seed: int = 0,
+                 progress: Callable[[str], None] = None):
+        self.modes = modes
+        self.documents = documents
+        self.pages = pages
+        self.drive_batch_size = drive_batch_size
+        self.openai_latency = openai_latency
+        self.openai_requests_per_minute = openai_requests_per_minute
+        self.openai_error_rate = openai_error_rate
+        self.drive_latency = drive_latency
+        self.drive_fail_every = drive_fail_every
+        self.seed = seed
+        self.progress = progress or logger.info
+
+    def run(self) -> Dict[str, Any]:
+        started_at = timezone.now()
+        server = FakeOpenAIServer(
+            latency=self.openai_latency,
+            error_rate=self.openai_error_rate,
+            requests_per_minute=self.openai_requests_per_minute,
+            seed=self.seed,
+        ).start()
+        try:
+            client = OpenAI(api_key='fake', base_url=server.base_url, max_retries=0)
+            scheduler = OpenAIScheduler(rate_limits={})
+            results = [self._run_mode(mode, client, scheduler, server) for mode in self.modes]
+        finally:
+            server.stop()
+
+        return {
+            'started_at': started_at.isoformat(),
+            'parameters': {
+                'documents': self.documents,
+                'pages': self.pages,
+                'drive_batch_size': self.drive_batch_size,
+                'openai_latency': self.openai_latency,
+                'openai_requests_per_minute': self.openai_requests_per_minute,
+                'openai_error_rate': self.openai_error_rate,
+                'drive_latency': self.drive_latency,
+                'drive_fail_every': self.drive_fail_every,
+                'seed': self.seed,
+            },
+            'results': results,
+        }
+
+    def _run_mode(self, mode: str, client: OpenAI, scheduler: OpenAIScheduler,
+                  server: FakeOpenAIServer) -> Dict[str, Any]:
+        drive = FakeDriveService(latency=self.drive_latency, fail_every=self.drive_fail_every)
+        processor = FileProcessorService(
+            google_drive_service=GoogleDriveService(service_factory=lambda: drive),
+            openai_service=OpenAIService(priority=BULK, client=client, scheduler=scheduler),
+        )
+        openai_calls_before = Counter(server.calls)
+        stages_before = self._stage_seconds()
+        timer = _QueryTimer()
+        wrapped = [connection]
+        connection.execute_wrappers.append(timer)
+
+        def wrap_new_connection(sender, connection, **kwargs):
+            connection.execute_wrappers.append(timer)
+            wrapped.append(connection)
+
+        connection_created.connect(wrap_new_connection)
+        document_ids = []
+        totals = Counter()
+        try:
+            with tempfile.TemporaryDirectory(prefix='ingestion-benchmark-') as directory:
+                paths = []
+                for number in range(self.documents):
+                    path = Path(directory) / f"{mode}-{number}.pdf"
+                    # Seeded per mode and document so no file is skipped as already ingested
+                    path.write_bytes(cookbook_pdf(self.pages, seed=f"{self.seed}-{mode}-{number}"))
+                    paths.append(path)
+
+                self.progress(f"{mode}: ingesting {self.documents} documents of {self.pages} pages")
+                with _PeakRss() as rss:
+                    started = time.perf_counter()
+                    for path in paths:
+                        document, _ = processor.register_document(path, path.name)
+                        # Only documents created for this run are cleaned up afterwards
+                        if document.file_path == str(path):
+                            document_ids.append(document.id)
+                        if mode == 'pypdf2':
+                            result = processor.process_document(str(document.id))
+                        else:
+                            result = processor.process_document_with_google_drive_in_batches(
+                                str(document.id), batch_size=self.drive_batch_size
+                            )
+                        totals.update(result)
+                    seconds = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(wrap_new_connection)
+            for wrapped_connection in wrapped:
+                wrapped_connection.execute_wrappers.remove(timer)
+            OpenAIUsage.objects.filter(document_id__in=document_ids).delete()
+            StoredDocument.objects.filter(id__in=document_ids).delete()
+
+        stages_after = self._stage_seconds()
+        stages = {}
+        for key in sorted(stages_after):
+            pipeline, name = key
+            elapsed = stages_after[key] - stages_before.get(key, 0.0)
+            if elapsed <= 0:
+                continue
+            stage_report = {'seconds': round(elapsed, 3)}
+            if pipeline == 'ingest':
+                stage_report.update({
+                    'db_write_seconds': round(timer.seconds[(name, 'write')], 3),
+                    'db_read_seconds': round(timer.seconds[(name, 'read')], 3),
+                    'db_queries': timer.queries[name],
+                })
+            stages[f"{pipeline}/{name}"] = stage_report
+        stages['other'] = {
+            'db_write_seconds': round(timer.seconds[('other', 'write')], 3),
+            'db_read_seconds': round(timer.seconds[('other', 'read')], 3),
+            'db_queries': timer.queries['other'],
+        }
+
+        report = {
+            'mode': mode,
+            'embedding_provider': processor.vector_service.provider.name,
+            'documents': self.documents,
+            'pages': totals['pages'],
+            'chunks': totals['chunks'],
+            'tokens': totals['tokens'],
+            'seconds': round(seconds, 3),
+            'pages_per_second': round(totals['pages'] / seconds, 2),
+            'chunks_per_second': round(totals['chunks'] / seconds, 2),
+            'peak_rss_mb': round(rss.peak / 2 ** 20, 1),
+            'rss_growth_mb': round((rss.peak - rss.start) / 2 ** 20, 1),
+            'stages': stages,
+            'openai_requests': dict(Counter(server.calls) - openai_calls_before),
+            'drive_calls': dict(drive.calls),
+        }
+        self.progress(
+            f"{mode}: {report['pages_per_second']} pages/s, {report['chunks_per_second']} chunks/s, "
+            f"peak RSS {report['peak_rss_mb']} MB"
+        )
+        return report
+
+    @staticmethod
+    def _stage_seconds() -> Dict[tuple, float]:
+        """Total seconds recorded so far per (pipeline, stage), from the STAGE_SECONDS histogram."""
+        seconds = {}
+        for metric in STAGE_SECONDS.collect():
+            for sample in metric.samples:
+                if sample.name.endswith('_sum') and sample.labels['pipeline'] in REPORTED_PIPELINES:
+                    seconds[(sample.labels['pipeline'], sample.labels['stage'])] = sample.value
+        return seconds
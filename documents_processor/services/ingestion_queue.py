@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import connection
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .file_processor_service import FileProcessorService
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Process-wide pool of `INGESTION_WORKERS` background ingestion threads, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.INGESTION_WORKERS),
+                thread_name_prefix='ingestion'
+            )
+        return _executor
+
+
+def enqueue_document(document_id: str, use_google_drive: bool = False) -> Future:
+    """
+    Queue a registered document for processing in the background.
+
+    Jobs run in this process, so a restart drops queued jobs; documents caught mid-way
+    keep their checkpoint and can be continued with the resume endpoint.
+    """
+    logger.info("Queueing document %s for processing", document_id)
+    return get_executor().submit(_process_document, document_id, use_google_drive)
+
+
+def _process_document(document_id: str, use_google_drive: bool):
+    try:
+        FileProcessorService().process_document(document_id, use_google_drive=use_google_drive)
+    except Exception as e:
+        # The processor already marked the document as 'error'
+        logger.error("Background processing of document %s failed: %s", document_id, e)
+    finally:
+        # Every worker thread has its own database connection
+        connection.close()
@@ -0,0 +1,50 @@
+"""
+Maximal marginal relevance (Carbonell & Goldstein, 1998) for diversifying search results.
+
+Results are picked one at a time, each maximising
+
+    lambda * relevance - (1 - lambda) * (highest cosine similarity to an already picked result)
+
+so near-copies of a picked chunk (overlapping token windows, the same recipe in two ebooks)
+fall back behind different chunks that are almost as relevant. lambda = 1 keeps the ranking
+by relevance, lower values trade relevance for variety.
+"""
+from typing import List, Sequence
+
+import numpy as np
+
+
+def maximal_marginal_relevance(relevance: Sequence[float], embeddings, k: int,
+                               lambda_mult: float = 0.7) -> List[int]:
+    """
+    Indexes of `k` candidates in the order MMR picks them. `relevance` holds one score per
+    candidate, e.g. its cosine similarity to the query, and `embeddings` one row per candidate.
+
+    The candidate similarities come from a single matrix product; every pick then costs
+    one vectorized update of each candidate's redundancy, so a few dozen candidates of
+    1536 dimensions take well under a millisecond.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    k = min(k, len(relevance))
+    if k <= 0:
+        return []
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    similarity = vectors @ vectors.T
+
+    first = int(np.argmax(relevance))
+    picked = np.zeros(len(relevance), dtype=bool)
+    picked[first] = True
+    order = [first]
+    # Highest similarity of every candidate to the picked ones
+    redundancy = similarity[first].copy()
+    while len(order) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[picked] = -np.inf
+        index = int(np.argmax(scores))
+        picked[index] = True
+        order.append(index)
+        np.maximum(redundancy, similarity[index], out=redundancy)
+    return order
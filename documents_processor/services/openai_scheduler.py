@@ -0,0 +1,317 @@
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import openai
+
+from ai_cooking_project.metrics import OPENAI_REQUESTS, OPENAI_TOKENS, STAGE_ERRORS, STAGE_SECONDS
+from ..models import RateLimitBucket
+from .usage_service import record_usage
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+# Longest single backoff sleep, in seconds
+MAX_BACKOFF = 60.0
+BASE_BACKOFF = 0.5
+# Below this share of the remaining quota reported by OpenAI, concurrency is halved
+LOW_REMAINING = 0.1
+# Below this share, the shared buckets are lowered to the remaining quota OpenAI reports
+SYNC_REMAINING = 0.5
+
+# Takes the cost from every bucket of a call, or from none of them (also when a bucket row is
+# missing). The buckets are refilled lazily from the time elapsed since their last update, and
+# bulk callers must leave the reserve untouched.
+ACQUIRE_SQL = f"""
+WITH wanted(name, cost, reserve) AS (VALUES {{values}}),
+current AS (
+    SELECT bucket.id, bucket.name, wanted.cost, wanted.reserve, bucket.rate,
+           LEAST(bucket.capacity, bucket.tokens
+                 + EXTRACT(EPOCH FROM clock_timestamp() - bucket.updated_at) * bucket.rate) AS available
+    FROM {RateLimitBucket._meta.db_table} AS bucket
+    JOIN wanted ON wanted.name = bucket.name
+    ORDER BY bucket.id
+    FOR UPDATE OF bucket
+),
+decision AS (
+    SELECT bool_and(available - cost >= reserve) AND count(*) = (SELECT count(*) FROM wanted) AS granted
+    FROM current
+),
+taken AS (
+    UPDATE {RateLimitBucket._meta.db_table} AS bucket
+    SET tokens = current.available - current.cost, updated_at = clock_timestamp()
+    FROM current, decision
+    WHERE bucket.id = current.id AND decision.granted
+    RETURNING bucket.id
+)
+SELECT current.name, current.available, current.cost, current.reserve, current.rate, decision.granted
+FROM current, decision
+"""
+
+# Lower a bucket to what OpenAI reports as remaining, e.g. when other clients share the API key
+LOWER_SQL = f"""
+UPDATE {RateLimitBucket._meta.db_table}
+SET tokens = LEAST(LEAST(capacity, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * rate), %s),
+    updated_at = clock_timestamp()
+WHERE name = %s
+"""
+
+# Charge (or refund) the difference between the estimated and the actual usage
+SETTLE_SQL = f"""
+UPDATE {RateLimitBucket._meta.db_table} SET tokens = LEAST(capacity, tokens - %s) WHERE name = %s
+"""
+
+
+class AdaptiveConcurrency:
+    """
+    Per-process limit on concurrent OpenAI calls, adapted with AIMD: it grows by one slot
+    per window of successful calls and halves on a 429 or when OpenAI reports that little
+    quota is left. Waiting interactive calls are admitted before waiting bulk ones.
+    """
+
+    def __init__(self, initial: int, maximum: int):
+        self.maximum = maximum
+        self.limit = float(initial)
+        self.active = 0
+        self._interactive_waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, priority: str):
+        with self._condition:
+            if priority == INTERACTIVE:
+                self._interactive_waiting += 1
+                try:
+                    self._condition.wait_for(lambda: self.active < int(self.limit))
+                finally:
+                    self._interactive_waiting -= 1
+            else:
+                self._condition.wait_for(
+                    lambda: self.active < int(self.limit) and not self._interactive_waiting
+                )
+            self.active += 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def increase(self):
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def decrease(self):
+        with self._condition:
+            self.limit = max(1.0, self.limit / 2)
+
+
+class OpenAIScheduler:
+    """
+    Admission control in front of every OpenAI call of this process.
+
+    - Requests and tokens per minute are drawn from `RateLimitBucket` rows, so all web and
+      ingestion workers share the quotas configured in `OPENAI_RATE_LIMITS`.
+    - Bulk calls leave `OPENAI_BULK_RESERVE` of every bucket to interactive ones and yield
+      to them for concurrency slots.
+    - 429, 5xx and connection errors are retried with jittered exponential backoff,
+      honouring `Retry-After`.
+    - Concurrency follows the `x-ratelimit-*` headers of the responses.
+
+    Bucket queries run in autocommit; calls should be made outside of transactions so the
+    bucket rows are not locked for longer than one statement.
+    """
+
+    def __init__(self, rate_limits: Dict[str, Dict[str, int]] = None, bulk_reserve: float = None,
+                 max_concurrency: int = None, max_retries: int = None):
+        self.rate_limits = settings.OPENAI_RATE_LIMITS if rate_limits is None else rate_limits
+        self.bulk_reserve = settings.OPENAI_BULK_RESERVE if bulk_reserve is None else bulk_reserve
+        self.max_retries = settings.OPENAI_MAX_RETRIES if max_retries is None else max_retries
+        max_concurrency = max_concurrency or settings.OPENAI_MAX_CONCURRENCY
+        self.concurrency = AdaptiveConcurrency(initial=max_concurrency, maximum=max_concurrency)
+        self._ensured = set()
+        self._lock = threading.Lock()
+
+    def call(self, request: Callable[[], Any], model: str, tokens: int = 0, priority: str = INTERACTIVE,
+             usage_tokens: Callable[[Any], Optional[int]] = None, kind: str = None) -> Any:
+        """
+        Run `request`, which must return a raw response (`client.<api>.with_raw_response.create(...)`),
+        within the quotas of `model`, and return the parsed response.
+
+        `tokens` is the estimated token cost; `usage_tokens` extracts the actual one from the
+        parsed response so the token bucket can be corrected. Successful calls are recorded
+        in the usage table as `kind` ('embedding', 'chat' or 'image').
+        """
+        for attempt in range(self.max_retries + 1):
+            # Waiting for quota does not hold a concurrency slot
+            buckets = self._acquire(model, tokens, priority)
+            self.concurrency.acquire(priority)
+            started = time.perf_counter()
+            try:
+                raw_response = request()
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                if isinstance(e, openai.RateLimitError):
+                    self.concurrency.decrease()
+                if attempt == self.max_retries:
+                    logger.error("OpenAI call to %s failed after %s attempts: %s", model, attempt + 1, e)
+                    OPENAI_REQUESTS.labels(model, 'failed').inc()
+                    raise
+                delay = self._backoff(attempt, getattr(e, 'response', None))
+                logger.warning("OpenAI call to %s failed (%s), retrying in %.1fs", model, e.__class__.__name__, delay)
+                OPENAI_REQUESTS.labels(model, 'retried').inc()
+                raw_response = None
+            except Exception:
+                OPENAI_REQUESTS.labels(model, 'failed').inc()
+                STAGE_ERRORS.labels('openai', model).inc()
+                raise
+            finally:
+                self.concurrency.release()
+                # Time spent in the API only, without waiting for quota or backoff
+                latency = time.perf_counter() - started
+                STAGE_SECONDS.labels('openai', model).observe(latency)
+
+            if raw_response is None:
+                time.sleep(delay)
+                continue
+
+            self._adapt(model, raw_response.headers)
+            response = raw_response.parse()
+            OPENAI_REQUESTS.labels(model, 'ok').inc()
+            usage = getattr(response, 'usage', None)
+            for token_kind in ('prompt', 'completion'):
+                used = getattr(usage, f'{token_kind}_tokens', None)
+                if used:
+                    OPENAI_TOKENS.labels(model, token_kind).inc(used)
+            if kind is not None:
+                record_usage(
+                    model, kind,
+                    prompt_tokens=getattr(usage, 'prompt_tokens', None) or 0,
+                    completion_tokens=getattr(usage, 'completion_tokens', None) or 0,
+                    images=len(response.data) if kind == 'image' else 0,
+                    latency=latency,
+                )
+            if usage_tokens is not None and tokens_bucket_name(model) in buckets:
+                actual = usage_tokens(response)
+                if actual is not None and actual != tokens:
+                    with connection.cursor() as cursor:
+                        cursor.execute(SETTLE_SQL, [actual - tokens, tokens_bucket_name(model)])
+            return response
+
+    def _acquire(self, model: str, tokens: int, priority: str) -> List[str]:
+        """Block until the request and token buckets of `model` grant the call; returns their names."""
+        limits = self.rate_limits.get(model)
+        if not limits:
+            return []
+        self._ensure_buckets(model, limits)
+
+        wanted = [(requests_bucket_name(model), 1, limits['requests_per_minute'])]
+        if limits.get('tokens_per_minute') and tokens:
+            wanted.append((tokens_bucket_name(model), tokens, limits['tokens_per_minute']))
+
+        reserve_share = self.bulk_reserve if priority == BULK else 0.0
+        params = []
+        for name, cost, capacity in wanted:
+            reserve = capacity * reserve_share
+            # A call larger than the bucket could never be granted, let it empty the bucket instead
+            params += [name, min(cost, capacity - reserve), reserve]
+        values = ', '.join(['(%s, %s::float, %s::float)'] * len(wanted))
+
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(ACQUIRE_SQL.format(values=values), params)
+                rows = cursor.fetchall()
+            if rows and rows[0][5]:
+                return [name for name, _, _ in wanted]
+            if len(rows) < len(wanted):
+                # The rows were deleted (e.g. the table was flushed) after this process created them
+                logger.warning("Rate limit buckets of %s are missing, creating them again", model)
+                self._ensured.discard(model)
+                self._ensure_buckets(model, limits)
+                continue
+            wait = max((cost + reserve - available) / rate for _, available, cost, reserve, rate, _ in rows)
+            logger.debug("Waiting %.2fs for the %s quota (%s)", wait, model, priority)
+            time.sleep(min(max(wait, 0.01), MAX_BACKOFF))
+
+    def _ensure_buckets(self, model: str, limits: Dict[str, int]):
+        if model in self._ensured:
+            return
+        with self._lock:
+            for name, per_minute in [
+                (requests_bucket_name(model), limits.get('requests_per_minute')),
+                (tokens_bucket_name(model), limits.get('tokens_per_minute')),
+            ]:
+                if not per_minute:
+                    continue
+                RateLimitBucket.objects.update_or_create(
+                    name=name,
+                    defaults={'capacity': per_minute, 'rate': per_minute / 60},
+                    create_defaults={
+                        'capacity': per_minute, 'rate': per_minute / 60,
+                        'tokens': per_minute, 'updated_at': timezone.now(),
+                    },
+                )
+            self._ensured.add(model)
+
+    def _adapt(self, model: str, headers):
+        """AIMD on the remaining quota OpenAI reports, and keep the shared buckets honest."""
+        running_low = False
+        for kind, bucket_name in [('requests', requests_bucket_name(model)), ('tokens', tokens_bucket_name(model))]:
+            remaining = _header_number(headers, f'x-ratelimit-remaining-{kind}')
+            limit = _header_number(headers, f'x-ratelimit-limit-{kind}')
+            if remaining is None or not limit:
+                continue
+            running_low = running_low or remaining / limit < LOW_REMAINING
+            if model in self._ensured and remaining / limit < SYNC_REMAINING:
+                with connection.cursor() as cursor:
+                    cursor.execute(LOWER_SQL, [remaining, bucket_name])
+        if running_low:
+            self.concurrency.decrease()
+        else:
+            self.concurrency.increase()
+
+    @staticmethod
+    def _backoff(attempt: int, response) -> float:
+        """Full-jitter exponential backoff, but never sooner than the server asked for."""
+        delay = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+        if response is not None:
+            retry_after = _header_number(response.headers, 'retry-after-ms')
+            if retry_after is not None:
+                return max(delay, retry_after / 1000)
+            retry_after = _header_number(response.headers, 'retry-after')
+            if retry_after is not None:
+                return max(delay, min(retry_after, MAX_BACKOFF))
+        return delay
+
+
+def requests_bucket_name(model: str) -> str:
+    return f"openai:{model}:requests"
+
+
+def tokens_bucket_name(model: str) -> str:
+    return f"openai:{model}:tokens"
+
+
+def _header_number(headers, name: str) -> Optional[float]:
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> OpenAIScheduler:
+    """The scheduler of this process, shared by every OpenAIService instance."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OpenAIScheduler()
+        return _scheduler
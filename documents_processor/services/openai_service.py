@@ -1,23 +1,59 @@
 from openai import OpenAI
 import logging
 from ai_cooking_project import settings
+from recipes.models.chat_models import ChatResponse, TokenUsage
+
+from .openai_scheduler import INTERACTIVE, OpenAIScheduler, get_scheduler
+from .rate_limiter import TokenBucket
+from .text_splitter_service import get_encoding
 
 logger = logging.getLogger(__name__)
 
 class OpenAIService:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, rate_limiter: TokenBucket = None, priority: str = INTERACTIVE, client: OpenAI = None,
+                 scheduler: OpenAIScheduler = None):
+        """
+        Args:
+            rate_limiter: Optional embedding budget, one token per input token, e.g. a
+                SharedTokenBucket shared by the processes of a bulk ingestion
+            priority: 'interactive' for user-facing calls, 'bulk' for ingestion; bulk calls
+                leave part of every quota to interactive ones (see OpenAIScheduler)
+            client: OpenAI client to use instead of the configured one, e.g. one pointing at
+                a local fake server; it should not retry by itself
+            scheduler: Scheduler to use instead of the process-wide one, e.g. without the
+                shared quotas for calls that do not go to OpenAI
+        """
+        # Retries are done by the scheduler, which also knows about the shared quotas
+        self.client = client or OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL, max_retries=0)
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+        self.scheduler = scheduler or get_scheduler()
 
     def create_embedding(self, text: str) -> list[float]:
+        return self.create_embeddings([text])[0]
+
+    def create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Embed several texts with a single request, in input order."""
         try:
-            response = self.client.embeddings.create(
+            encoding = get_encoding()
+            tokens = sum(len(encoding.encode_ordinary(text)) for text in texts)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(tokens)
+            response = self.scheduler.call(
+                lambda: self.client.embeddings.with_raw_response.create(
+                    model="text-embedding-3-small",
+                    input=texts
+                ),
                 model="text-embedding-3-small",
-                input=text
+                tokens=tokens,
+                priority=self.priority,
+                usage_tokens=lambda response: response.usage.total_tokens,
+                kind="embedding",
             )
-            return response.data[0].embedding
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
         except Exception as e:
-            logger.error(f"Error creating embedding: {e}")
-            raise 
+            logger.error(f"Error creating embeddings: {e}")
+            raise
 
     def create_completion(self, request):
         """
@@ -36,21 +72,38 @@ class OpenAIService:
             # Determine if JSON mode should be used
             response_format = {"type": "json_object"} if request.json_mode else None
             
+            # Prompt plus the completion budget, which is what counts towards the TPM quota
+            encoding = get_encoding()
+            tokens = sum(len(encoding.encode_ordinary(message["content"])) + 4 for message in messages)
+            tokens += request.max_tokens or 0
+
             # Call the OpenAI API synchronously
-            response = self.client.chat.completions.create(
+            response = self.scheduler.call(
+                lambda: self.client.chat.completions.with_raw_response.create(
+                    model=request.model,
+                    messages=messages,
+                    response_format=response_format,
+                    max_tokens=request.max_tokens
+                ),
                 model=request.model,
-                messages=messages,
-                response_format=response_format,
-                max_tokens=request.max_tokens
+                tokens=tokens,
+                priority=self.priority,
+                usage_tokens=lambda response: response.usage.total_tokens if response.usage else None,
+                kind="chat",
+            )
+
+            choice = response.choices[0]
+            return ChatResponse(
+                content=choice.message.content or "",
+                model=response.model,
+                provider="openai",
+                token_usage=TokenUsage(
+                    prompt_tokens=response.usage.prompt_tokens,
+                    completion_tokens=response.usage.completion_tokens,
+                    total_tokens=response.usage.total_tokens,
+                ) if response.usage else None,
+                finish_reason=choice.finish_reason,
             )
-            
-            # Create a simple response object
-            class SimpleResponse:
-                def __init__(self, content):
-                    self.content = content
-            
-            # Return a simple response object with the content
-            return SimpleResponse(response.choices[0].message.content)
             
         except Exception as e:
             logger.error(f"Error in OpenAI completion: {e}")
@@ -77,12 +130,17 @@ class OpenAIService:
         """
         try:
             logger.info(f"Generating image with prompt: '{prompt[:50]}...' using model {model}")
-            response = self.client.images.generate(
+            response = self.scheduler.call(
+                lambda: self.client.images.with_raw_response.generate(
+                    model=model,
+                    prompt=prompt,
+                    size=size,
+                    quality=quality,
+                    n=1,
+                ),
                 model=model,
-                prompt=prompt,
-                size=size,
-                quality=quality,
-                n=1,
+                priority=self.priority,
+                kind="image",
             )
             image_url = response.data[0].url
             logger.info(f"Image generated successfully: {image_url}")
@@ -0,0 +1,75 @@
+import multiprocessing
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Holds up to `capacity` tokens and refills at `rate` tokens per second; `acquire`
+    blocks until enough tokens are available. Used to keep concurrent workers within
+    an API quota.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if available. Returns 0 on success, otherwise the seconds to wait."""
+        # A request larger than the bucket would never fit, let it drain the bucket instead
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in shared memory, so one budget can be shared by a
+    pool of worker processes. Create it in the parent and hand it to the workers when
+    they are started (e.g. as a pool initializer argument).
+    """
+
+    def __init__(self, rate: float, capacity: float = None, context=None):
+        super().__init__(rate, capacity)
+        context = context or multiprocessing.get_context()
+        self._shared_tokens = context.Value('d', self.capacity, lock=False)
+        self._shared_updated_at = context.Value('d', self._updated_at, lock=False)
+        self._lock = context.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._shared_updated_at.value
+        self._shared_tokens.value = min(self.capacity, self._shared_tokens.value + elapsed * self.rate)
+        self._shared_updated_at.value = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._shared_tokens.value >= tokens:
+                self._shared_tokens.value -= tokens
+                return 0.0
+            return (tokens - self._shared_tokens.value) / self.rate
@@ -0,0 +1,207 @@
+import re
+import unicodedata
+import logging
+from collections import Counter
+from itertools import groupby
+from typing import List, Dict, Optional, Sequence
+
+from .text_splitter_service import TextSplitterService
+
+logger = logging.getLogger(__name__)
+
+# "SKŁADNIKI", "Składniki:", "SAŁATKA Z BROKUŁA SKŁADNIKI" (title and heading on one line)
+INGREDIENTS_HEADING_RE = re.compile(r"(?:^|\s)(składniki|skladniki|ingredients)\s*:?\s*$", re.IGNORECASE)
+# Table of contents dot leaders: "........30", "Nocna owsianka .......... 8"
+TOC_LEADER_RE = re.compile(r"\.{5,}\s*\d+\s*$")
+PAGE_NUMBER_RE = re.compile(r"^\s*\d{1,4}\s*$")
+# Pages a line must repeat on to be taken for a running header or footer
+RUNNING_LINE_PAGES = 3
+# Upper-case lines that structure a recipe but never start one
+SECTION_KEYWORDS = (
+    "składniki", "skladniki", "czas przygotowania", "ilość porcji", "ilosc porcji",
+    "sposób przygotowania", "sposob przygotowania", "przygotowanie", "wykonanie",
+)
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip Polish diacritics and whitespace so titles can be compared across layouts."""
+    text = text.lower().replace("ł", "l")
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if c.isalnum())
+
+
+class RecipeSplitterService:
+    """
+    Structure-aware splitter that emits one chunk per recipe.
+
+    Recipes are anchored on their ingredients heading ("Składniki"). A recipe starts
+    at the first title line after the previous recipe's heading, so the intro page
+    of a cookbook recipe (title, photo caption, tips) stays with its ingredients and
+    steps. Titles are recognised as upper-case lines or as entries of the book's
+    table of contents. Text without recognisable recipes, and recipes longer than
+    `max_tokens`, fall back to the token-window splitter.
+    """
+
+    def __init__(self, max_tokens: int = 2000, text_splitter: Optional[TextSplitterService] = None):
+        self.max_tokens = max_tokens
+        self.text_splitter = text_splitter or TextSplitterService(chunk_size=max_tokens)
+
+    def split_text(self, text: str, token_limit: int = None) -> List[Dict[str, str]]:
+        return self.split_many([text], token_limit=token_limit)[0]
+
+    def split_many(self, texts: Sequence[str], token_limit: int = None) -> List[List[Dict[str, str]]]:
+        return self._split_sections([self.split_sections(text) for text in texts], token_limit)
+
+    def split_pages(self, pages: Dict[int, str], token_limit: int = None) -> Dict[int, List[Dict[str, str]]]:
+        """
+        Split the pages of one document together, so a recipe running over a page break is
+        still one chunk and the table of contents is known on every page.
+
+        Every recipe is returned under the page it starts on, so the pages it continues on
+        may have no chunks of their own. Text outside of recipes stays with its page.
+        """
+        page_numbers = sorted(pages)
+        lines = []
+        line_pages = []
+        for page_number in page_numbers:
+            for line in pages[page_number].splitlines():
+                if not TOC_LEADER_RE.search(line):
+                    lines.append(line)
+                    line_pages.append(page_number)
+
+        toc_titles = self._toc_titles("\n".join(pages[page_number] for page_number in page_numbers))
+        starts = self._recipe_starts(lines, toc_titles, self._running_lines(pages))
+        sections = {page_number: [] for page_number in page_numbers}
+
+        # Text before the first recipe (covers, introductions) is kept page by page
+        for page_number, numbers in groupby(range(starts[0] if starts else len(lines)), line_pages.__getitem__):
+            body = "\n".join(lines[i] for i in numbers).strip()
+            if body:
+                sections[page_number].append((None, body))
+
+        for position, start in enumerate(starts):
+            end = starts[position + 1] if position + 1 < len(starts) else len(lines)
+            body = "\n".join(lines[start:end]).strip()
+            if body:
+                sections[line_pages[start]].append((self._title_at(lines, start), body))
+
+        return dict(zip(page_numbers, self._split_sections([sections[n] for n in page_numbers], token_limit)))
+
+    def split_sections(self, text: str) -> List[tuple]:
+        """Return (title, text) pairs, one per recipe plus any text before the first recipe."""
+        lines = [line for line in text.splitlines() if not TOC_LEADER_RE.search(line)]
+        starts = self._recipe_starts(lines, self._toc_titles(text))
+        if not starts:
+            body = "\n".join(lines).strip()
+            return [(None, body)] if body else []
+
+        sections = []
+        preamble = "\n".join(lines[:starts[0]]).strip()
+        if preamble:
+            sections.append((None, preamble))
+
+        for position, start in enumerate(starts):
+            end = starts[position + 1] if position + 1 < len(starts) else len(lines)
+            body = "\n".join(lines[start:end]).strip()
+            if body:
+                sections.append((self._title_at(lines, start), body))
+        return sections
+
+    def _split_sections(self, sections_per_text: List[List[tuple]], token_limit: int = None) -> List[List[Dict[str, str]]]:
+        token_limit = token_limit or self.max_tokens
+
+        # Tokenize every section of every text in one threaded batch
+        flat = [section for sections in sections_per_text for section in sections]
+        flat_chunks = self.text_splitter.split_many([body for _, body in flat], token_limit=token_limit)
+
+        results = []
+        position = 0
+        for sections in sections_per_text:
+            chunks = []
+            for title, _ in sections:
+                for chunk in flat_chunks[position]:
+                    chunk["title"] = title
+                    chunks.append(chunk)
+                position += 1
+            results.append(chunks)
+        return results
+
+    def _recipe_starts(self, lines: List[str], toc_titles: set, running_lines: frozenset = frozenset()) -> List[int]:
+        """Line index where every recipe starts, one per ingredients heading not inside an earlier recipe."""
+        headings = [i for i, line in enumerate(lines) if INGREDIENTS_HEADING_RE.search(line.strip())]
+        starts = []
+        previous_heading = -1
+        for heading in headings:
+            start = self._recipe_start(lines, previous_heading + 1, heading, toc_titles, running_lines)
+            # Two headings inside one recipe (e.g. dough and filling) do not start a new one
+            if not starts or start > starts[-1]:
+                starts.append(start)
+            previous_heading = heading
+
+        logger.debug("Detected %d recipes in %d lines", len(starts), len(lines))
+        return starts
+
+    def _recipe_start(self, lines: List[str], lower: int, heading: int, toc_titles: set,
+                      running_lines: frozenset = frozenset()) -> int:
+        for i in range(lower, heading + 1):
+            if self._is_title(lines[i], toc_titles) and fold(lines[i]) not in running_lines:
+                return i
+
+        # No title found: the heading line itself, or the closest non-empty line above it
+        if INGREDIENTS_HEADING_RE.sub("", lines[heading]).strip():
+            return heading
+        for i in range(heading - 1, lower - 1, -1):
+            if lines[i].strip() and not PAGE_NUMBER_RE.match(lines[i]):
+                return i
+        return heading
+
+    @staticmethod
+    def _is_title(line: str, toc_titles: set) -> bool:
+        stripped = line.strip()
+        if not stripped or len(stripped) > 120 or PAGE_NUMBER_RE.match(stripped):
+            return False
+
+        folded = fold(stripped)
+        if not folded:
+            return False
+        if any(folded.startswith(fold(keyword)) for keyword in SECTION_KEYWORDS):
+            return False
+        if stripped[0].isupper() and any(folded.startswith(title) for title in toc_titles):
+            return True
+
+        # Cookbook titles lead with an upper-case word: "CAPRESE z żurawiną", "JAJKA PO TURECKU"
+        first_word = re.sub(r"[^\w]", "", stripped.split()[0])
+        return len(first_word) >= 3 and first_word.isalpha() and first_word.isupper()
+
+    @staticmethod
+    def _title_at(lines: List[str], start: int) -> str:
+        title = INGREDIENTS_HEADING_RE.sub("", lines[start]).strip()
+        return title[:255] or None
+
+    @staticmethod
+    def _running_lines(pages: Dict[int, str]) -> frozenset:
+        """Lines repeated on several pages (running headers and footers), which never start a recipe."""
+        counts = Counter()
+        for text in pages.values():
+            lines = text.splitlines()
+            # Table of contents pages repeat every title, they are not counted
+            if not any(TOC_LEADER_RE.search(line) for line in lines):
+                counts.update({fold(line) for line in lines} - {""})
+        return frozenset(folded for folded, count in counts.items() if count >= RUNNING_LINE_PAGES)
+
+    @staticmethod
+    def _toc_titles(text: str) -> set:
+        """Collect titles listed in a table of contents, i.e. the text in front of dot leaders."""
+        titles = set()
+        previous = ""
+        for line in text.splitlines():
+            match = TOC_LEADER_RE.search(line)
+            if match:
+                title = line[:match.start()].strip() or previous
+                folded = fold(title)
+                # Very short entries would match the start of almost any line
+                if len(folded) >= 6:
+                    titles.add(folded)
+            elif line.strip():
+                previous = line.strip()
+        return titles
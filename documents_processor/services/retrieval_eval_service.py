@@ -0,0 +1,285 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from pathlib import Path
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from .corpus_snapshot_service import copy_rows, droppable_indexes
+from .embedding_providers import (
+    EmbeddingProvider, HashingEmbeddingProvider, OpenAIEmbeddingProvider, SentenceTransformerProvider,
+    get_embedding_provider,
+)
+from .openai_scheduler import BULK
+from .openai_service import OpenAIService
+from .search_benchmark_service import (
+    BENCHMARK_INDEX, IndexConfig, SearchBenchmark, build_vector_index, git_commit, is_vector_index,
+    server_versions,
+)
+from .vector_service import VectorService
+from ..models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_KINDS = ('configured', 'openai', 'hashing', 'sentence-transformers')
+# Query sources besides a path to a file with one query per line
+QUERY_SOURCES = ('titles', 'synthetic')
+DEFAULT_QUERY_FILE = Path(__file__).resolve().parent.parent / 'fixtures' / 'retrieval_queries.txt'
+# Queries embedded and searched exactly per request / SQL round trip
+EXACT_BATCH_SIZE = 64
+REEMBED_BATCH_SIZE = 1000
+REEMBEDDED_COLUMNS = [('document_id', 'uuid'), ('chunk_index', 'int4'), ('embedding', 'vector')]
+
+
+def resolve_provider(kind: str) -> EmbeddingProvider:
+    """An embedding provider by kind; `configured` is the one set by EMBEDDING_PROVIDER."""
+    if kind == 'configured':
+        return get_embedding_provider(OpenAIService(priority=BULK))
+    if kind == 'openai':
+        return OpenAIEmbeddingProvider(OpenAIService(priority=BULK))
+    if kind == 'hashing':
+        return HashingEmbeddingProvider(settings.EMBEDDING_DIMENSIONS)
+    if kind == 'sentence-transformers':
+        return SentenceTransformerProvider(dimensions=settings.EMBEDDING_DIMENSIONS)
+    raise ValueError(f"Unknown embedding provider {kind!r}, use one of {', '.join(PROVIDER_KINDS)}")
+
+
+def load_queries(source: str, limit: int) -> List[str]:
+    """
+    Up to `limit` distinct queries: the titles of generated recipes (`titles`) or the lines of
+    a file, skipping blank lines and # comments. With no recipes yet, titles fall back to the
+    checked-in query file.
+    """
+    if source == 'titles':
+        from recipes.models import Recipe
+        titles = list(Recipe.objects.order_by('title').values_list('title', flat=True).distinct()[:limit])
+        if titles:
+            return titles
+        logger.info(f"No recipe titles to evaluate with, using {DEFAULT_QUERY_FILE}")
+        source = DEFAULT_QUERY_FILE
+
+    queries = []
+    with open(source, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith('#') and line not in queries:
+                queries.append(line)
+    return queries[:limit]
+
+
+def score_queries(exact: List[List[Dict[str, Any]]], found: List[List[Dict[str, Any]]]) -> Dict[str, float]:
+    """
+    Recall@k and MRR of approximate results against the exact nearest neighbours. A result as
+    similar as the k-th exact neighbour counts as a hit, so ties are not reported as misses.
+    MRR is the mean reciprocal rank of the exact nearest neighbour among the approximate results.
+    """
+    recalls, reciprocal_ranks = [], []
+    for truth, results in zip(exact, found):
+        if not truth:
+            continue
+        truth_ids = {result['chunk_id'] for result in truth}
+        kth_similarity = truth[-1]['vector_similarity']
+        hits = sum(1 for result in results
+                   if result['chunk_id'] in truth_ids or result['vector_similarity'] >= kth_similarity)
+        recalls.append(min(hits, len(truth)) / len(truth))
+
+        nearest = truth[0]
+        rank = next((position for position, result in enumerate(results, start=1)
+                     if result['chunk_id'] == nearest['chunk_id']
+                     or result['vector_similarity'] >= nearest['vector_similarity']), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    return {
+        'evaluated_queries': len(recalls),
+        'recall': float(np.mean(recalls)) if recalls else 0.0,
+        'mrr': float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+    }
+
+
+class RetrievalEvaluation:
+    """
+    Measures what approximate vector indexes lose against exact search: for every embedding
+    provider and index configuration it reports recall@k and MRR of the index's results
+    against the exact nearest neighbours, with the search latency.
+
+    The stored chunks are evaluated by default. Providers whose vectors are not stored are
+    evaluated on the stored chunk texts re-embedded locally; OpenAI embeddings are never
+    recomputed, as that would cost a full ingestion. With `synthetic_size` a synthetic corpus
+    is evaluated instead, by default with its own topic queries. Everything runs in a transaction that is rolled back, like the
+    search benchmark, so use a development database for large corpora.
+    """
+
+    def __init__(self, index_configs: List[IndexConfig], queries: List[str] = None,
+                 providers: List[EmbeddingProvider] = None, k: int = 10, min_recall: float = 0.9,
+                 synthetic_size: int = 0, synthetic_queries: int = 100, seed: int = 0,
+                 maintenance_work_mem: str = '1GB', progress: Callable[[str], None] = None):
+        self.index_configs = index_configs
+        self.k = k
+        self.min_recall = min_recall
+        self.synthetic_size = synthetic_size
+        self.maintenance_work_mem = maintenance_work_mem
+        self.progress = progress or logger.info
+        self.loader = None
+        if synthetic_size:
+            self.loader = SearchBenchmark(sizes=[synthetic_size], index_configs=[], seed=seed)
+            self.providers = [self.loader.provider]
+            self.queries = queries or self.loader.corpus.queries(synthetic_queries)
+        else:
+            self.providers = providers or [get_embedding_provider(OpenAIService(priority=BULK))]
+            self.queries = queries
+
+    def run(self) -> Dict[str, Any]:
+        started_at = timezone.now()
+        # Embedded before the transaction, so the usage of paid providers is recorded
+        query_embeddings = {}
+        for provider in self.providers:
+            self.progress(f"Embedding {len(self.queries)} queries with {provider.name}")
+            query_embeddings[provider.name] = provider.embed_for_storage(self.queries)
+
+        with transaction.atomic():
+            try:
+                results = self._run(query_embeddings)
+            finally:
+                transaction.set_rollback(True)
+
+        return {
+            'started_at': started_at.isoformat(),
+            'commit': git_commit(),
+            'postgres': server_versions(),
+            'parameters': {
+                'k': self.k,
+                'min_recall': self.min_recall,
+                'queries': len(self.queries),
+                'synthetic_size': self.synthetic_size,
+            },
+            'passed': all(result.get('passed', True) for result in results),
+            'results': results,
+        }
+
+    def _run(self, query_embeddings: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        chunk_table = DocumentChunk._meta.db_table
+        results = []
+        with connection.cursor() as cursor:
+            cursor.execute(f"SET LOCAL maintenance_work_mem = '{self.maintenance_work_mem}'")
+            if self.loader:
+                self.progress(f"Loading {self.synthetic_size} synthetic chunks")
+                indexes = self.loader.prepare_table(cursor)
+                self.loader.load(cursor, 0, self.synthetic_size)
+                for _, definition in indexes:
+                    if not is_vector_index(definition):
+                        cursor.execute(definition)
+            else:
+                # Exact search needs the table without a vector index; each configuration builds its own
+                for name, definition in droppable_indexes(cursor, chunk_table):
+                    if is_vector_index(definition):
+                        cursor.execute(f'DROP INDEX "{name}"')
+
+            for provider in self.providers:
+                # Re-embedded chunks are rolled back before the next provider
+                savepoint = transaction.savepoint()
+                try:
+                    results.extend(self._evaluate_provider(cursor, provider, query_embeddings[provider.name]))
+                finally:
+                    transaction.savepoint_rollback(savepoint)
+        return results
+
+    def _evaluate_provider(self, cursor, provider: EmbeddingProvider, embeddings: np.ndarray) -> List[Dict[str, Any]]:
+        chunks = self._prepare_chunks(cursor, provider)
+        if not chunks:
+            self.progress(f"{provider.name}: no stored chunks to evaluate, skipped")
+            return [{'provider': provider.name, 'chunks': 0, 'skipped': "no stored chunks of this provider"}]
+        cursor.execute(f"ANALYZE {DocumentChunk._meta.db_table}")
+
+        vector_service = VectorService(openai_service=None, provider=provider)
+        exact = []
+        for start in range(0, len(embeddings), EXACT_BATCH_SIZE):
+            exact.extend(vector_service.search_batch_by_embedding(embeddings[start:start + EXACT_BATCH_SIZE],
+                                                                  limit=self.k))
+
+        results = []
+        for config in self.index_configs:
+            build, search = config.resolve(chunks)
+            build_seconds, index_bytes = build_vector_index(cursor, config.kind, build)
+            for name, value in search.items():
+                cursor.execute(f"SET LOCAL {config.kind}.{name} = {int(value)}")
+
+            found, timings = [], []
+            for embedding in embeddings:
+                started = time.perf_counter()
+                found.append(vector_service.search_by_embedding(embedding, limit=self.k))
+                timings.append((time.perf_counter() - started) * 1000)
+            scores = score_queries(exact, found)
+            p50, p95 = np.percentile(timings, [50, 95])
+            result = {
+                'provider': provider.name,
+                'chunks': chunks,
+                'index': config.kind,
+                'build_parameters': build,
+                'search_parameters': search,
+                'build_seconds': round(build_seconds, 3),
+                'index_bytes': index_bytes,
+                'evaluated_queries': scores['evaluated_queries'],
+                f'recall@{self.k}': round(scores['recall'], 4),
+                'mrr': round(scores['mrr'], 4),
+                # Queries answered with fewer results than exact search, e.g. by too few ivfflat probes
+                'short_results': sum(1 for truth, results in zip(exact, found) if len(results) < len(truth)),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'passed': scores['recall'] >= self.min_recall,
+            }
+            results.append(result)
+            self.progress(
+                f"{provider.name}, {config.kind} {build} {search}: recall@{self.k} {scores['recall']:.3f}, "
+                f"MRR {scores['mrr']:.3f}, p50 {p50:.2f} ms" + ("" if result['passed'] else " BELOW THRESHOLD")
+            )
+
+            if config.kind != 'exact':
+                cursor.execute(f'DROP INDEX "{BENCHMARK_INDEX}"')
+            for name in search:
+                cursor.execute(f"RESET {config.kind}.{name}")
+        return results
+
+    def _prepare_chunks(self, cursor, provider: EmbeddingProvider) -> int:
+        """Number of chunks in the vector space of `provider`, re-embedding the stored texts if needed."""
+        stored = DocumentChunk.objects.filter(embedding_provider=provider.name).count()
+        if stored or isinstance(provider, OpenAIEmbeddingProvider):
+            return stored
+        total = DocumentChunk.objects.count()
+        if not total:
+            return 0
+
+        self.progress(f"{provider.name}: re-embedding {total} stored chunks")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS retrieval_eval_embedding "
+            "(document_id uuid, chunk_index integer, embedding vector) ON COMMIT DROP"
+        )
+        cursor.execute("TRUNCATE retrieval_eval_embedding")
+        # One COPY per batch: the server-side cursor cannot fetch while a COPY is in progress
+        rows = DocumentChunk.objects.order_by().values_list('document_id', 'chunk_index', 'content')
+        batch = []
+        for row in rows.iterator(chunk_size=REEMBED_BATCH_SIZE):
+            batch.append(row)
+            if len(batch) == REEMBED_BATCH_SIZE:
+                self._copy_embedded(cursor, provider, batch)
+                batch = []
+        if batch:
+            self._copy_embedded(cursor, provider, batch)
+
+        chunk_table = DocumentChunk._meta.db_table
+        cursor.execute(
+            f"UPDATE {chunk_table} AS chunk SET embedding = new.embedding, embedding_provider = %s "
+            f"FROM retrieval_eval_embedding AS new "
+            f"WHERE chunk.document_id = new.document_id AND chunk.chunk_index = new.chunk_index",
+            [provider.name]
+        )
+        return total
+
+    @staticmethod
+    def _copy_embedded(cursor, provider: EmbeddingProvider, rows: List[tuple]):
+        embeddings = provider.embed_for_storage([content for _, _, content in rows])
+        copy_rows(cursor, 'retrieval_eval_embedding', REEMBEDDED_COLUMNS, [
+            [document_id, chunk_index, embedding]
+            for (document_id, chunk_index, _), embedding in zip(rows, embeddings)
+        ])
@@ -0,0 +1,403 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from dataclasses import dataclass, field
+import logging
+import math
+import re
+import subprocess
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from .corpus_snapshot_service import CHUNK_COLUMNS, TSVECTOR_TRIGGER, copy_rows, droppable_indexes
+from .embedding_providers import EmbeddingProvider, STORAGE_DIMENSIONS
+from .vector_service import VectorService
+from ..models import DocumentChunk, StoredDocument
+
+logger = logging.getLogger(__name__)
+
+# Real words open the vocabulary so generated chunks read like a Polish cookbook
+POLISH_WORDS = [
+    "mąka", "cukier", "masło", "jajka", "sól", "pieprz", "cebula", "czosnek", "ziemniaki", "kapusta",
+    "śmietana", "twaróg", "marchew", "buraki", "koperek", "pietruszka", "grzyby", "boczek", "kiełbasa", "wołowina",
+    "wieprzowina", "kurczak", "ryba", "śledź", "ogórki", "pomidory", "jabłka", "śliwki", "wiśnie", "miód",
+    "barszcz", "żurek", "rosół", "bigos", "pierogi", "gołąbki", "placki", "kopytka", "naleśniki", "sernik",
+    "szarlotka", "makowiec", "kisiel", "kompot", "gotować", "smażyć", "dusić", "piec", "kroić", "mieszać",
+    "doprawić", "podawać", "minut", "godzinę", "łyżka", "łyżeczka", "szklanka", "gramów", "litr", "piekarnik",
+]
+SYLLABLES = [
+    "ba", "bie", "cho", "cze", "dro", "dzie", "ga", "gó", "ję", "ka", "kie", "kło", "la", "lę", "ło", "ma",
+    "mie", "na", "nią", "no", "pa", "pie", "po", "prze", "ra", "rze", "ry", "sa", "sko", "sła", "szcz", "ście",
+    "ta", "tro", "wa", "wie", "wy", "za", "zie", "żu", "źdź", "ść", "ci", "dą", "ki", "ny", "wę", "rą",
+]
+WORD_PATTERN = re.compile(r"\w+")
+
+SYNTHETIC_CHUNKS_PER_DOCUMENT = 500
+SEARCH_MODES = ('vector', 'hybrid', 'batch')
+INDEX_TYPES = ('exact', 'ivfflat', 'hnsw')
+BENCHMARK_INDEX = 'search_benchmark_embedding_idx'
+
+
+def build_vector_index(cursor, kind: str, build: Dict[str, int]) -> Tuple[float, int]:
+    """Build BENCHMARK_INDEX of `kind` on the chunk embeddings; returns build seconds and index bytes."""
+    if kind == 'exact':
+        return 0.0, 0
+    started = time.perf_counter()
+    parameters = ', '.join(f"{name} = {int(value)}" for name, value in build.items())
+    cursor.execute(
+        f'CREATE INDEX "{BENCHMARK_INDEX}" ON {DocumentChunk._meta.db_table} '
+        f'USING {kind} (embedding vector_cosine_ops)' + (f' WITH ({parameters})' if parameters else '')
+    )
+    build_seconds = time.perf_counter() - started
+    cursor.execute("SELECT pg_relation_size(%s::regclass)", [BENCHMARK_INDEX])
+    return build_seconds, cursor.fetchone()[0]
+
+
+def is_vector_index(definition: str) -> bool:
+    return ' USING ivfflat ' in definition or ' USING hnsw ' in definition
+
+
+def server_versions() -> Dict[str, str]:
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW server_version")
+        server = cursor.fetchone()[0]
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+    return {'server': server, 'pgvector': row[0] if row else None}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class SyntheticCorpus:
+    """
+    Deterministic Polish-like corpus for benchmarks.
+
+    Every vocabulary word has a fixed random vector pulled towards the centroid of its
+    topic, and a chunk embeds as the normalized mean of its word vectors. Chunks of one
+    topic therefore cluster like real recipes do, and a query made of topic words lands
+    near them. Chunk i is the same whatever the corpus size, so sizes are comparable.
+    """
+
+    def __init__(self, seed: int = 0, topics: int = 64, words_per_topic: int = 60, common_words: int = 400,
+                 words_per_chunk: int = 60, dimensions: int = STORAGE_DIMENSIONS):
+        self.seed = seed
+        self.words_per_chunk = words_per_chunk
+        self.dimensions = dimensions
+        rng = np.random.default_rng(seed)
+
+        words = list(POLISH_WORDS)
+        seen = set(words)
+        while len(words) < topics * words_per_topic + common_words:
+            word = ''.join(rng.choice(SYLLABLES, size=rng.integers(2, 5)))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        self.words = np.array(words)
+        self.word_ids = {word: index for index, word in enumerate(words)}
+
+        # Shared words (common_ids) carry no topic; every topic owns a block of the others
+        order = rng.permutation(len(words))
+        self.common_ids = order[:common_words]
+        self.topic_ids = order[common_words:].reshape(topics, words_per_topic)
+
+        centroids = self._normalize(rng.standard_normal((topics, dimensions), dtype=np.float32))
+        vectors = self._normalize(rng.standard_normal((len(words), dimensions), dtype=np.float32))
+        for topic in range(topics):
+            vectors[self.topic_ids[topic]] += 1.2 * centroids[topic]
+        self.word_vectors = self._normalize(vectors)
+
+        # Zipf-like word frequencies within a topic and among the shared words
+        self.topic_weights = self._zipf(words_per_topic)
+        self.common_weights = self._zipf(common_words)
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    @staticmethod
+    def _zipf(count: int) -> np.ndarray:
+        weights = 1.0 / np.arange(1, count + 1)
+        return weights / weights.sum()
+
+    def embed_ids(self, ids: np.ndarray) -> np.ndarray:
+        """Embed rows of word ids; -1 marks no word."""
+        embeddings = np.zeros((len(ids), self.dimensions), dtype=np.float32)
+        for column in range(ids.shape[1]):
+            present = ids[:, column] >= 0
+            embeddings[present] += self.word_vectors[ids[present, column]]
+        return self._normalize(embeddings)
+
+    def _sample_ids(self, rng: np.random.Generator, topics: np.ndarray, topic_words: int, common_words: int) -> np.ndarray:
+        ranks = rng.choice(self.topic_ids.shape[1], size=(len(topics), topic_words), p=self.topic_weights)
+        common = rng.choice(len(self.common_ids), size=(len(topics), common_words), p=self.common_weights)
+        ids = np.concatenate([self.topic_ids[topics[:, None], ranks], self.common_ids[common]], axis=1)
+        return rng.permuted(ids, axis=1)
+
+    def chunks(self, start: int, count: int) -> Tuple[List[str], np.ndarray]:
+        """Texts and embeddings of chunks start..start+count-1."""
+        # Seeded by position, so chunk i does not depend on how the corpus is generated in batches
+        rng = np.random.default_rng([self.seed, 0, start])
+        topics = rng.integers(len(self.topic_ids), size=count)
+        topic_words = round(self.words_per_chunk * 0.7)
+        ids = self._sample_ids(rng, topics, topic_words, self.words_per_chunk - topic_words)
+        texts = [' '.join(row).capitalize() + '.' for row in self.words[ids]]
+        return texts, self.embed_ids(ids)
+
+    def queries(self, count: int, words: int = 4) -> List[str]:
+        """Short queries made mostly of the words of one topic, like a dish name."""
+        rng = np.random.default_rng([self.seed, 1])
+        topics = rng.integers(len(self.topic_ids), size=count)
+        ids = self._sample_ids(rng, topics, words - 1, 1)
+        return [' '.join(row) for row in self.words[ids]]
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed arbitrary texts; words outside the vocabulary are ignored."""
+        token_ids = [[self.word_ids[word] for word in WORD_PATTERN.findall(text.lower()) if word in self.word_ids]
+                     for text in texts]
+        ids = np.full((len(texts), max((len(row) for row in token_ids), default=0) or 1), -1)
+        for row, word_ids in enumerate(token_ids):
+            ids[row, :len(word_ids)] = word_ids
+        return self.embed_ids(ids)
+
+
+class SyntheticEmbeddingProvider(EmbeddingProvider):
+    """Embeds texts into the vector space of a SyntheticCorpus, so searches run their usual code path."""
+
+    def __init__(self, corpus: SyntheticCorpus):
+        self.corpus = corpus
+        self.dimensions = corpus.dimensions
+        self.name = f"synthetic:{corpus.seed}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.corpus.embed_texts(texts)
+
+
+@dataclass
+class IndexConfig:
+    """A vector index to benchmark: `exact` (no index, sequential scan), `ivfflat` or `hnsw`."""
+    kind: str
+    # Build parameters (lists, m, ef_construction); ivfflat lists of 0 are sized from the corpus
+    build: Dict[str, int] = field(default_factory=dict)
+    # Query-time parameters (probes, ef_search); ivfflat probes of 0 are sized from the lists
+    search: Dict[str, int] = field(default_factory=dict)
+
+    def resolve(self, size: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Build and search parameters for a corpus of `size` chunks, following pgvector's guidance."""
+        build, search = dict(self.build), dict(self.search)
+        if self.kind == 'ivfflat':
+            if not build.get('lists'):
+                build['lists'] = max(10, size // 1000 if size <= 1_000_000 else int(math.sqrt(size)))
+            if not search.get('probes'):
+                search['probes'] = max(1, int(math.sqrt(build['lists'])))
+        return build, search
+
+
+class SearchBenchmark:
+    """
+    Measures VectorService search latency on synthetic corpora of growing size under
+    several vector index configurations.
+
+    Everything runs in one transaction that is rolled back: the chunk table is emptied,
+    its indexes dropped, the synthetic corpus loaded and each index built in turn. The
+    database is left as it was, but the chunk table is locked for the whole run, so run
+    it against a development database.
+    """
+
+    def __init__(self, sizes: List[int], index_configs: List[IndexConfig], queries: int = 100, warmup: int = 10,
+                 limit: int = 5, batch_size: int = 16, seed: int = 0, maintenance_work_mem: str = '1GB',
+                 progress: Callable[[str], None] = None):
+        self.sizes = sorted(sizes)
+        self.index_configs = index_configs
+        self.queries = queries
+        self.warmup = warmup
+        self.limit = limit
+        self.batch_size = batch_size
+        self.maintenance_work_mem = maintenance_work_mem
+        self.progress = progress or logger.info
+        self.corpus = SyntheticCorpus(seed=seed)
+        self.provider = SyntheticEmbeddingProvider(self.corpus)
+        self.vector_service = VectorService(openai_service=None, provider=self.provider)
+
+    def run(self) -> Dict[str, Any]:
+        started_at = timezone.now()
+        with transaction.atomic():
+            try:
+                results = self._run()
+            finally:
+                transaction.set_rollback(True)
+
+        return {
+            'started_at': started_at.isoformat(),
+            'commit': git_commit(),
+            'postgres': server_versions(),
+            'parameters': {
+                'sizes': self.sizes,
+                'queries': self.queries,
+                'warmup': self.warmup,
+                'limit': self.limit,
+                'batch_size': self.batch_size,
+                'seed': self.corpus.seed,
+                'dimensions': self.corpus.dimensions,
+            },
+            'results': results,
+        }
+
+    def _run(self) -> List[Dict[str, Any]]:
+        chunk_table = DocumentChunk._meta.db_table
+        query_texts = self.corpus.queries(self.warmup + self.queries)
+        query_embeddings = self.provider.embed_for_storage(query_texts)
+        results = []
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SET LOCAL maintenance_work_mem = '{self.maintenance_work_mem}'")
+            indexes = self.prepare_table(cursor)
+            other_indexes = [definition for _, definition in indexes if not is_vector_index(definition)]
+
+            loaded = 0
+            for size in self.sizes:
+                self.progress(f"Loading synthetic chunks {loaded}..{size}")
+                load_seconds = self.load(cursor, loaded, size)
+                loaded = size
+                for definition in other_indexes:
+                    cursor.execute(definition)
+                cursor.execute(f"ANALYZE {chunk_table}")
+
+                for config in self.index_configs:
+                    build, search = config.resolve(size)
+                    build_seconds, index_bytes = build_vector_index(cursor, config.kind, build)
+                    for name, value in search.items():
+                        cursor.execute(f"SET LOCAL {config.kind}.{name} = {int(value)}")
+                    self.progress(f"{size} chunks, {config.kind} {build} {search}: built in {build_seconds:.1f}s")
+
+                    for mode in SEARCH_MODES:
+                        timings, queries_per_call = self._measure(mode, query_texts, query_embeddings)
+                        p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+                        results.append({
+                            'size': size,
+                            'index': config.kind,
+                            'build_parameters': build,
+                            'search_parameters': search,
+                            'build_seconds': round(build_seconds, 3),
+                            'index_bytes': index_bytes,
+                            'load_seconds': round(load_seconds, 3),
+                            'mode': mode,
+                            'calls': len(timings),
+                            'queries_per_call': queries_per_call,
+                            'p50_ms': round(float(p50), 3),
+                            'p95_ms': round(float(p95), 3),
+                            'p99_ms': round(float(p99), 3),
+                            'mean_ms': round(float(np.mean(timings)), 3),
+                        })
+                        self.progress(f"  {mode}: p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms")
+
+                    if config.kind != 'exact':
+                        cursor.execute(f'DROP INDEX "{BENCHMARK_INDEX}"')
+                    for name in search:
+                        cursor.execute(f"RESET {config.kind}.{name}")
+
+                # Loading the next size is faster without secondary indexes
+                for name, definition in indexes:
+                    if definition in other_indexes:
+                        cursor.execute(f'DROP INDEX "{name}"')
+        return results
+
+    @staticmethod
+    def prepare_table(cursor) -> List[tuple]:
+        """
+        Empty the chunk table and drop its indexes and tsvector trigger, within the current
+        transaction. Returns the dropped (name, definition) pairs: the vector index is replaced
+        by each benchmarked configuration, the others are rebuilt after every load instead of
+        being maintained row by row.
+        """
+        chunk_table = DocumentChunk._meta.db_table
+        cursor.execute(f"TRUNCATE {chunk_table}")
+        indexes = droppable_indexes(cursor, chunk_table)
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX "{name}"')
+        cursor.execute(f"ALTER TABLE {chunk_table} DISABLE TRIGGER {TSVECTOR_TRIGGER}")
+        return indexes
+
+    def load(self, cursor, start: int, end: int, batch: int = 5000) -> float:
+        """Load synthetic chunks start..end-1 and their documents; returns the seconds it took."""
+        started = time.perf_counter()
+        chunk_table = DocumentChunk._meta.db_table
+        now = timezone.now()
+
+        first_document = start // SYNTHETIC_CHUNKS_PER_DOCUMENT
+        last_document = (end - 1) // SYNTHETIC_CHUNKS_PER_DOCUMENT
+        # A partly filled document from the previous size already exists
+        first_new = first_document + (1 if start % SYNTHETIC_CHUNKS_PER_DOCUMENT else 0)
+        StoredDocument.objects.bulk_create([
+            StoredDocument(id=self._document_id(number), file_path=f"synthetic/{number}.pdf",
+                           title=f"Synthetic cookbook {number}", status='processed')
+            for number in range(first_new, last_document + 1)
+        ], batch_size=1000)
+
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS search_benchmark_chunk "
+            f"(document_id uuid, chunk_index integer, page_number integer, content text, "
+            f"embedding vector({self.corpus.dimensions}), embedding_provider text, created_at timestamptz) "
+            f"ON COMMIT DROP"
+        )
+        copy_rows(cursor, 'search_benchmark_chunk', CHUNK_COLUMNS, self._chunk_rows(start, end, batch, now))
+        cursor.execute(
+            f"INSERT INTO {chunk_table} "
+            f"(document_id, chunk_index, page_number, content, embedding, embedding_provider, created_at, content_tsv) "
+            f"SELECT document_id, chunk_index, page_number, content, embedding, embedding_provider, created_at, "
+            f"to_tsvector('simple', content) FROM search_benchmark_chunk"
+        )
+        cursor.execute("TRUNCATE search_benchmark_chunk")
+        # Run the deferred foreign key checks now, index builds refuse pending trigger events
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        return time.perf_counter() - started
+
+    def _chunk_rows(self, start: int, end: int, batch: int, created_at) -> Iterator[List[Any]]:
+        for offset in range(start, end, batch):
+            texts, embeddings = self.corpus.chunks(offset, min(batch, end - offset))
+            for position, (text, embedding) in enumerate(zip(texts, embeddings), start=offset):
+                chunk_index = position % SYNTHETIC_CHUNKS_PER_DOCUMENT
+                yield [
+                    self._document_id(position // SYNTHETIC_CHUNKS_PER_DOCUMENT), chunk_index, chunk_index // 4 + 1,
+                    text, embedding, self.provider.name, created_at,
+                ]
+
+    def _document_id(self, number: int) -> uuid.UUID:
+        return uuid.uuid5(uuid.NAMESPACE_URL, f"synthetic-corpus/{self.corpus.seed}/{number}")
+
+    def _measure(self, mode: str, texts: List[str], embeddings: np.ndarray) -> Tuple[List[float], int]:
+        """Latencies in milliseconds of every timed call, after the warmup queries."""
+        if mode == 'batch':
+            calls = [
+                (lambda start=start: self.vector_service.search_batch_by_embedding(
+                    embeddings[start:start + self.batch_size], limit=self.limit))
+                for start in range(0, len(texts), self.batch_size)
+            ]
+            warmup_calls = math.ceil(self.warmup / self.batch_size)
+            queries_per_call = self.batch_size
+        else:
+            text_for = (lambda index: texts[index]) if mode == 'hybrid' else (lambda index: None)
+            calls = [
+                (lambda index=index: self.vector_service.search_by_embedding(
+                    embeddings[index], text=text_for(index), limit=self.limit))
+                for index in range(len(texts))
+            ]
+            warmup_calls = self.warmup
+            queries_per_call = 1
+
+        timings = []
+        for number, call in enumerate(calls):
+            started = time.perf_counter()
+            call()
+            if number >= warmup_calls:
+                timings.append((time.perf_counter() - started) * 1000)
+        return timings, queries_per_call
@@ -1,27 +1,100 @@
 import tiktoken
-from typing import List, Dict
+from itertools import accumulate
+from typing import List, Dict, Iterable, Sequence
+
+# Loading the BPE ranks is expensive, so every splitter shares one encoder per process
+ENCODING_NAME = "cl100k_base"
+_encoding = None
+
+
+def get_encoding() -> tiktoken.Encoding:
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(ENCODING_NAME)
+    return _encoding
+
 
 class TextSplitterService:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 2000, chunk_overlap: int = 200, num_threads: int = 8):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.num_threads = num_threads
+        self.tokenizer = get_encoding()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode_ordinary(text))
+
+    def split_text(self, text: str, token_limit: int = None) -> List[Dict[str, str]]:
+        """
+        Split text into overlapping windows of at most `token_limit` tokens.
+
+        The text is encoded once and each window is sliced out of the original
+        string through token-to-character offsets, so no window is ever decoded.
+        """
+        tokens = self.tokenizer.encode_ordinary(text)
+        return self._split_tokens(text, tokens, token_limit or self.chunk_size)
 
-    def split_text(self, text: str, token_limit: int = 2000) -> List[Dict[str, str]]:
-        tokens = self.tokenizer.encode(text)
-        chunks = []
+    def split_many(self, texts: Sequence[str], token_limit: int = None) -> List[List[Dict[str, str]]]:
+        """Split several texts at once, encoding them with tiktoken's threaded batch encoder."""
+        token_limit = token_limit or self.chunk_size
+        batches = self.tokenizer.encode_ordinary_batch(list(texts), num_threads=self.num_threads)
+        return [
+            self._split_tokens(text, tokens, token_limit)
+            for text, tokens in zip(texts, batches)
+        ]
+
+    def _split_tokens(self, text: str, tokens: List[int], token_limit: int) -> List[Dict[str, str]]:
+        if not tokens:
+            return []
+
+        if len(tokens) <= token_limit:
+            return [{"text": text, "token_count": len(tokens)}]
+
+        step = token_limit - self.chunk_overlap
+        windows = []
         start = 0
-        
-        while start < len(tokens):
-            end = start + token_limit
-            chunk_tokens = tokens[start:end]
-            chunk_text = self.tokenizer.decode(chunk_tokens)
-            
-            chunks.append({
-                "text": chunk_text,
-                "token_count": len(chunk_tokens)
-            })
-            
-            start = end - self.chunk_overlap
-
-        return chunks 
\ No newline at end of file
+        while True:
+            end = min(start + token_limit, len(tokens))
+            windows.append((start, end))
+            if end == len(tokens):
+                break
+            start += step
+
+        # Byte offset of every token boundary, then map only the window edges to characters
+        byte_offsets = [0, *accumulate(len(b) for b in self.tokenizer.decode_tokens_bytes(tokens))]
+        char_offsets = self._char_offsets(
+            text, byte_offsets, {edge for window in windows for edge in window}
+        )
+
+        return [
+            {
+                "text": text[char_offsets[start]:char_offsets[end]],
+                "token_count": end - start,
+            }
+            for start, end in windows
+        ]
+
+    @staticmethod
+    def _char_offsets(text: str, byte_offsets: List[int], token_edges: Iterable[int]) -> Dict[int, int]:
+        """
+        Translate token positions into character positions in `text`.
+
+        A token can end in the middle of a multi-byte character (common with Polish
+        diacritics), so such edges are moved back to the start of that character.
+        """
+        data = text.encode("utf-8")
+        offsets = {}
+        byte_pos = 0
+        char_pos = 0
+        for edge in sorted(token_edges):
+            target = byte_offsets[edge]
+            # Skip back over UTF-8 continuation bytes
+            while 0 < target < len(data) and (data[target] & 0xC0) == 0x80:
+                target -= 1
+            if target > byte_pos:
+                char_pos += len(data[byte_pos:target].decode("utf-8"))
+                byte_pos = target
+            offsets[edge] = char_pos
+        return offsets
@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db.models import Count, Sum
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import wraps
+import logging
+from typing import Any, Dict, List, Optional
+
+from ..models import OpenAIUsage
+
+logger = logging.getLogger(__name__)
+
+MILLION = Decimal(1_000_000)
+# Most rows a usage listing returns
+MAX_USAGE_ROWS = 1000
+
+
+@dataclass
+class Attribution:
+    """What the OpenAI calls of the current scope are made for."""
+    operation: str = ''
+    document_id: Any = None
+    recipe_id: Optional[int] = None
+    # Usage rows recorded in this scope and its nested scopes
+    usage_ids: List[int] = field(default_factory=list)
+
+    def set_recipe(self, recipe_id: int):
+        """Attribute the calls of this scope to a recipe, including the ones made before it existed."""
+        self.recipe_id = recipe_id
+        if self.usage_ids:
+            OpenAIUsage.objects.filter(id__in=self.usage_ids).update(recipe_id=recipe_id)
+
+
+_attribution: ContextVar[Optional[Attribution]] = ContextVar('openai_usage_attribution', default=None)
+
+
+@contextmanager
+def attribute_usage(operation: str = None, document_id=None, recipe_id: int = None):
+    """
+    Attribute every OpenAI call made inside the block. Scopes nest: unset values are
+    inherited from the enclosing scope, and rows recorded in a nested scope also belong
+    to the enclosing one.
+
+    Context variables do not flow into thread pools, so work submitted to an executor
+    needs its own scope.
+    """
+    parent = _attribution.get()
+    attribution = Attribution(
+        operation=operation or (parent.operation if parent else ''),
+        document_id=document_id if document_id is not None else (parent.document_id if parent else None),
+        recipe_id=recipe_id if recipe_id is not None else (parent.recipe_id if parent else None),
+        usage_ids=parent.usage_ids if parent else [],
+    )
+    token = _attribution.set(attribution)
+    try:
+        yield attribution
+    finally:
+        _attribution.reset(token)
+
+
+def attributed_to_document(operation: str):
+    """Decorator for methods taking a `document_id` first argument: attribute their calls to it."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, document_id, *args, **kwargs):
+            with attribute_usage(operation, document_id=document_id):
+                return method(self, document_id, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_attribution() -> Optional[Attribution]:
+    return _attribution.get()
+
+
+def compute_cost(model: str, prompt_tokens: int = 0, completion_tokens: int = 0, images: int = 0,
+                 batch: bool = False) -> Decimal:
+    prices = settings.OPENAI_PRICES.get(model)
+    if prices is None:
+        logger.debug(f"No price configured for {model}, recording its usage at no cost")
+        return Decimal(0)
+    cost = (
+        Decimal(str(prices.get('input', 0))) * prompt_tokens / MILLION
+        + Decimal(str(prices.get('output', 0))) * completion_tokens / MILLION
+        + Decimal(str(prices.get('image', 0))) * images
+    )
+    if batch:
+        cost *= Decimal(str(settings.OPENAI_BATCH_DISCOUNT))
+    return cost.quantize(Decimal('0.000001'))
+
+
+def record_usage(model: str, kind: str, prompt_tokens: int = 0, completion_tokens: int = 0, images: int = 0,
+                 latency: float = 0.0) -> Optional[OpenAIUsage]:
+    """
+    Store one call, attributed to the current scope. Accounting must never fail the call
+    it describes, so errors are only logged.
+    """
+    attribution = _attribution.get()
+    try:
+        usage = OpenAIUsage.objects.create(
+            model=model,
+            kind=kind,
+            operation=attribution.operation if attribution else '',
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            images=images,
+            latency_ms=round(latency * 1000),
+            cost=compute_cost(model, prompt_tokens, completion_tokens, images, batch=kind == 'batch_embedding'),
+            document_id=attribution.document_id if attribution else None,
+            recipe_id=attribution.recipe_id if attribution else None,
+        )
+    except Exception as e:
+        logger.error(f"Error recording OpenAI usage of {model}: {e}")
+        return None
+    if attribution is not None:
+        attribution.usage_ids.append(usage.id)
+    return usage
+
+
+def _totals(queryset) -> Dict[str, Any]:
+    return queryset.aggregate(
+        calls=Count('id'),
+        prompt_tokens=Sum('prompt_tokens', default=0),
+        completion_tokens=Sum('completion_tokens', default=0),
+        images=Sum('images', default=0),
+        latency_ms=Sum('latency_ms', default=0),
+        cost=Sum('cost', default=Decimal(0)),
+    )
+
+
+def usage_by(key: str, ids: list = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    Usage grouped by `document_id` or `recipe_id`, most expensive first. Each row has per-kind
+    token counts and the totals.
+    """
+    queryset = OpenAIUsage.objects.filter(**{f'{key}__isnull': False})
+    if ids is not None:
+        queryset = queryset.filter(**{f'{key}__in': ids})
+
+    grouped = list(
+        queryset.values(key).annotate(
+            calls=Count('id'),
+            prompt_tokens=Sum('prompt_tokens'),
+            completion_tokens=Sum('completion_tokens'),
+            images=Sum('images'),
+            latency_ms=Sum('latency_ms'),
+            cost=Sum('cost'),
+        ).order_by('-cost', '-prompt_tokens')[:limit]
+    )
+    by_kind = {}
+    for row in queryset.filter(**{f'{key}__in': [row[key] for row in grouped]}).values(key, 'kind').annotate(
+        tokens=Sum('prompt_tokens') + Sum('completion_tokens'), calls=Count('id'), cost=Sum('cost'),
+    ):
+        by_kind.setdefault(row[key], {})[row['kind']] = {
+            'calls': row['calls'], 'tokens': row['tokens'], 'cost': row['cost'],
+        }
+    for row in grouped:
+        row['total_tokens'] = row['prompt_tokens'] + row['completion_tokens']
+        row['by_kind'] = by_kind.get(row[key], {})
+    return grouped
+
+
+def usage_totals(**filters) -> Dict[str, Any]:
+    totals = _totals(OpenAIUsage.objects.filter(**filters))
+    totals['total_tokens'] = totals['prompt_tokens'] + totals['completion_tokens']
+    return totals
@@ -1,40 +1,140 @@
-from django.db import transaction
-from django.db.models import Q, Value, FloatField, F, ExpressionWrapper
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db import connection, transaction
+from django.db.models import Q, Value, FloatField, F
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence
+import numpy as np
 from pgvector.django import CosineDistance
 from django.contrib.postgres.search import SearchQuery, SearchRank
 
-from ..models import DocumentChunk, StoredDocument
+from ai_cooking_project.metrics import CHUNKS_STORED, record_cache_lookup, stage
+from .embedding_providers import EmbeddingProvider, STORAGE_DIMENSIONS, get_embedding_provider
+from .mmr import maximal_marginal_relevance
+from ..models import HEADING_MAX_LENGTH, DocumentChunk, StoredDocument
 
 logger = logging.getLogger(__name__)
 
+# Chunks of documents still being ingested or that failed to ingest are not searched by default
+SEARCHABLE_STATUSES = ('processed',)
+# Filtered searches with at most this many chunks in scope are answered exactly, by sorting
+# the chunks the filter indexes select; larger scopes go through the vector index
+EXACT_SEARCH_MAX_CHUNKS = 2000
+# A filtered index scan that comes back short is retried this many times, each with the
+# ivfflat probes and hnsw ef_search multiplied by ANN_WIDEN_FACTOR, before searching exactly
+ANN_WIDENINGS = 2
+ANN_WIDEN_FACTOR = 4
+HNSW_MAX_EF_SEARCH = 1000
+# Hybrid searches re-rank this many nearest chunks per result by their full-text rank
+HYBRID_CANDIDATES = 4
+# Weight of the full-text rank against the cosine distance in the hybrid ranking
+TEXT_RANK_WEIGHT = 0.2
+
+
+@dataclass
+class ChunkFilter:
+    """
+    Restricts a search to the chunks of the given documents, of documents in the given
+    statuses and created in [created_after, created_before). Empty fields do not filter.
+    """
+    document_ids: Sequence = ()
+    statuses: Sequence[str] = ()
+    created_after: datetime = None
+    created_before: datetime = None
+
+    def __bool__(self):
+        return bool(self.document_ids or self.statuses or self.created_after or self.created_before)
+
+    @property
+    def narrow(self) -> bool:
+        """Whether the filter may leave fewer chunks than all those of searchable documents."""
+        return bool(
+            self.document_ids or self.created_after or self.created_before
+            or (self.statuses and not set(SEARCHABLE_STATUSES).issubset(self.statuses))
+        )
+
+    def apply(self, chunks):
+        if self.document_ids:
+            chunks = chunks.filter(document_id__in=self.document_ids)
+        if self.statuses:
+            chunks = chunks.filter(document__status__in=self.statuses)
+        if self.created_after:
+            chunks = chunks.filter(created_at__gte=self.created_after)
+        if self.created_before:
+            chunks = chunks.filter(created_at__lt=self.created_before)
+        return chunks
+
+
+@lru_cache(maxsize=None)
+def iterative_scans_supported() -> bool:
+    """Whether the pgvector extension can continue index scans until filters are satisfied (0.8.0+)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+    version = tuple(int(part) for part in row[0].split('.')[:2]) if row else (0, 0)
+    return version >= (0, 8)
+
+
+@contextmanager
+def local_settings(parameters: Dict[str, Any]):
+    """
+    Sets configuration parameters for the enclosed queries, inside a transaction. They are
+    restored afterwards, so a search run inside a longer transaction does not leak them.
+    """
+    names = list(parameters)
+    with transaction.atomic(), connection.cursor() as cursor:
+        previous = ()
+        if names:
+            cursor.execute("SELECT " + ", ".join(["current_setting(%s, true)"] * len(names)), names)
+            previous = cursor.fetchone()
+        for name, value in parameters.items():
+            cursor.execute("SELECT set_config(%s, %s, true)", [name, str(value)])
+        yield
+        for name, value in zip(names, previous):
+            if value is not None:
+                cursor.execute("SELECT set_config(%s, %s, true)", [name, value])
+
+
 class VectorService:
-    def __init__(self, openai_service):
+    def __init__(self, openai_service, provider: EmbeddingProvider = None, title_match_threshold: float = None):
         self.openai_service = openai_service
-        self.embedding_dimension = 1536  # Matches the small model dimensions
+        # EMBEDDING_PROVIDER by default; its name is stored with every chunk and scopes searches
+        self.provider = provider or get_embedding_provider(openai_service)
+        self.embedding_dimension = STORAGE_DIMENSIONS
+        self.title_match_threshold = (settings.SEARCH_TITLE_MATCH_THRESHOLD if title_match_threshold is None
+                                      else title_match_threshold)
+
+    @staticmethod
+    def _heading(title: str = None) -> str:
+        return (title or '').strip()[:HEADING_MAX_LENGTH]
     
-    def store_chunk(self, document: StoredDocument, chunk_text: str, chunk_index: int) -> DocumentChunk:
+    def store_chunk(self, document: StoredDocument, chunk_text: str, chunk_index: int, page_number: int = None,
+                    heading: str = None) -> DocumentChunk:
         """
         Generates embedding for a chunk and stores it in the database.
         """
         try:
             # Create embedding
-            embedding = self.openai_service.create_embedding(chunk_text)
-            
-            # Check if the embedding has the correct dimensions
-            if len(embedding) != self.embedding_dimension:
-                raise ValueError(f"Expected embedding of {self.embedding_dimension} dimensions, got {len(embedding)}")
+            embedding = self.embed_texts([chunk_text])[0]
             
             # Create the document chunk without specifying content_tsv
             chunk = DocumentChunk(
                 document=document,
                 chunk_index=chunk_index,
+                page_number=page_number,
                 content=chunk_text,
+                heading=self._heading(heading),
                 embedding=embedding,
+                embedding_provider=self.provider.name,
                 # Don't include content_tsv here - it's generated automatically
             )
             chunk.save()
+            CHUNKS_STORED.labels(self.provider.name).inc()
             
             return chunk
             
@@ -42,59 +142,328 @@ class VectorService:
             logger.error(f"Error storing chunk: {e}")
             raise
 
-    def search_similar(self, text: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Generates embeddings for several chunks in batches without touching the database,
+        so callers can keep network calls outside of their transactions.
+        """
+        if not texts:
+            return []
+        with stage('ingest', 'embed'):
+            embeddings = self.provider.embed_for_storage(texts)
+        if embeddings.shape != (len(texts), self.embedding_dimension):
+            raise ValueError(f"Expected {len(texts)} embeddings of {self.embedding_dimension} dimensions, "
+                             f"got {embeddings.shape}")
+        return list(embeddings)
+
+    def store_chunks(self, document: StoredDocument, chunk_texts: List[str], embeddings: List[List[float]],
+                     start_index: int, page_number: int = None, provider_name: str = None,
+                     headings: List[str] = None) -> List[DocumentChunk]:
         """
-        Hybrid search using both text search and vector similarity.
+        Stores already embedded chunks with consecutive chunk indexes in a single INSERT.
+        `provider_name` overrides the provider recorded for embeddings made elsewhere.
+        `headings` are the recipe titles of the chunks; chunks without one get an empty heading.
+        """
+        CHUNKS_STORED.labels(provider_name or self.provider.name).inc(len(chunk_texts))
+        headings = headings or [None] * len(chunk_texts)
+        return DocumentChunk.objects.bulk_create([
+            DocumentChunk(
+                document=document,
+                chunk_index=start_index + offset,
+                page_number=page_number,
+                content=chunk_text,
+                heading=self._heading(heading),
+                embedding=embedding,
+                embedding_provider=provider_name or self.provider.name,
+            )
+            for offset, (chunk_text, embedding, heading) in enumerate(zip(chunk_texts, embeddings, headings))
+        ])
+
+    def search_similar(self, text: str, limit: int = 5, filters: ChunkFilter = None,
+                       mmr_lambda: float = None) -> List[Dict[str, Any]]:
+        """
+        Hybrid search using both text search and vector similarity, over the chunks
+        selected by `filters` (all chunks without them). Queries that closely match a whole
+        recipe heading are answered by `search_titles` instead, without embedding the query;
+        headings merely containing the query ("zupa") only join the hybrid candidates. With
+        `mmr_lambda` more candidates are fetched and `diversify` picks `limit` of them.
         """
         try:
-            # Create embedding for semantic search
-            query_embedding = self.openai_service.create_embedding(text)
-            
-            # Create search query for text search
-            search_query = SearchQuery(text, config='simple')
-            
-            # Try hybrid search first
-            chunks_with_scores = DocumentChunk.objects.annotate(
-                # Vector similarity (lower is better)
-                distance=CosineDistance("embedding", query_embedding),
-                # Text match score (higher is better)
-                text_rank=SearchRank('content_tsv', search_query),
-                # Combined score calculation
-                combined_score=ExpressionWrapper(
-                    F('distance') - (F('text_rank') * 0.2),
-                    output_field=FloatField()
-                )
-            ).order_by('combined_score')[:limit]
-            
-            # IMPORTANT: If no results found with hybrid search, fall back to pure vector search
-            if not chunks_with_scores.exists():
-                chunks_with_scores = DocumentChunk.objects.annotate(
-                    distance=CosineDistance("embedding", query_embedding),
-                    text_rank=Value(0.0, output_field=FloatField()),
-                    combined_score=F('distance')  # Just use distance for combined score
-                ).order_by('distance')[:limit]
-            
-            # Format results with normalized similarity scores
+            candidates = limit * settings.SEARCH_MMR_CANDIDATES if mmr_lambda is not None else limit
             results = []
-            for chunk in chunks_with_scores:
-                # Convert cosine distance to similarity score (1 - distance)
-                vector_score = round(1 - float(chunk.distance), 4)
-                text_score = float(chunk.text_rank)
-                
-                results.append({
-                    'chunk_id': chunk.id,
-                    'document_id': chunk.document.id,
-                    'document_title': chunk.document.title,
-                    'content': chunk.content,
-                    'chunk_index': chunk.chunk_index,
-                    'vector_similarity': vector_score,
-                    'text_match_score': text_score,
-                    # Combined score formula gives higher weight to text relevance (adjust weights as necessary):
-                    'combined_score': round((vector_score + text_score*5)/6, 4),
-                    'search_method': 'hybrid' if text_score > 0.01 else 'semantic'
-                })
-            
+            title_matches = []
+            if self.title_match_threshold > 0:
+                with stage('search', 'title_match'):
+                    title_matches = self.search_titles(text, limit=candidates, filters=filters)
+                if any(match['heading_similarity'] >= self.title_match_threshold for match in title_matches):
+                    results = title_matches
+                record_cache_lookup('title_match', bool(results))
+
+            if not results:
+                # Create embedding for semantic search
+                with stage('search', 'embed_query'):
+                    query_embedding = self.provider.embed_query(text)
+                results = self.search_by_embedding(
+                    query_embedding, text=text, limit=candidates, filters=filters,
+                    include_ids=[match['chunk_id'] for match in title_matches]
+                )
+
+            if mmr_lambda is not None:
+                results = self.diversify(results, limit, mmr_lambda)
             return results
         except Exception as e:
             logger.error(f"Error searching similar chunks: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def diversify(self, results: List[Dict[str, Any]], limit: int, mmr_lambda: float) -> List[Dict[str, Any]]:
+        """
+        The `limit` results picked by maximal marginal relevance, so that near-duplicate chunks
+        do not crowd out the rest. Relevance is the similarity the results were found by.
+        """
+        if len(results) <= limit:
+            return results
+        with stage('search', 'diversify'):
+            embeddings = self._embeddings([result['chunk_id'] for result in results])
+            relevance = [
+                result['title_similarity'] if result['search_method'] == 'title' else result['vector_similarity']
+                for result in results
+            ]
+            order = maximal_marginal_relevance(
+                relevance, [embeddings[result['chunk_id']] for result in results], limit, mmr_lambda
+            )
+        return [results[index] for index in order]
+
+    @staticmethod
+    def _embeddings(chunk_ids: List[int]) -> Dict[int, np.ndarray]:
+        # pgvector's binary form (dimensions, unused, big-endian float32 values) is decoded in
+        # microseconds; parsing the text form takes about 0.2 ms per 1536-dimension vector
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, vector_send(embedding) FROM {DocumentChunk._meta.db_table} WHERE id = ANY(%s)",
+                [chunk_ids]
+            )
+            return {
+                chunk_id: np.frombuffer(value, dtype='>f4', offset=4).astype(np.float32)
+                for chunk_id, value in cursor.fetchall()
+            }
+
+    def search_titles(self, text: str, limit: int = 5, filters: ChunkFilter = None) -> List[Dict[str, Any]]:
+        """
+        Chunks whose recipe heading contains the query, or a close misspelling of it: a pg_trgm
+        word_similarity of at least `title_match_threshold`, found through the trigram index
+        on headings. Chunks without a detected recipe title have an empty heading and never
+        match. Best matches first; an empty list when no heading is similar enough. Every
+        result also has the `heading_similarity` of the whole heading to the query.
+        """
+        chunks = DocumentChunk.objects.filter(embedding_provider=self.provider.name).select_related(
+            'document').defer('embedding', 'content_tsv')
+        if filters:
+            chunks = filters.apply(chunks)
+        # `heading %> text` is the indexable form of word_similarity(text, heading) >= threshold
+        with local_settings({'pg_trgm.word_similarity_threshold': self.title_match_threshold}):
+            matches = list(chunks.filter(heading__trigram_word_similar=text).annotate(
+                title_similarity=TrigramWordSimilarity(text, 'heading'),
+                # Among equal word matches, headings with fewer other words come first
+                heading_similarity=TrigramSimilarity('heading', text),
+            ).order_by('-title_similarity', '-heading_similarity', 'document_id', 'chunk_index')[:limit])
+        return [
+            dict(
+                self._format_result(chunk.id, chunk.document.id, chunk.document.title, chunk.content,
+                                    chunk.chunk_index, 1.0, 0.0),
+                heading=chunk.heading,
+                # The query is not embedded; the heading match stands in, so every result has a score
+                vector_similarity=round(chunk.title_similarity, 4),
+                title_similarity=round(chunk.title_similarity, 4),
+                heading_similarity=round(chunk.heading_similarity, 4),
+                combined_score=round(chunk.title_similarity, 4),
+                search_method='title',
+            )
+            for chunk in matches
+        ]
+
+    def search_by_embedding(self, query_embedding, text: str = None, limit: int = 5,
+                            filters: ChunkFilter = None, include_ids: Sequence[int] = ()) -> List[Dict[str, Any]]:
+        """
+        Search with an already embedded query. Candidates are the nearest chunks, found
+        through the vector index; with `text` the `HYBRID_CANDIDATES * limit` nearest are
+        re-ranked by vector distance plus full-text rank, without it the search is vector-only.
+        The chunks of `include_ids` (e.g. title matches) are ranked among the candidates too.
+        `filters` are applied inside the query, and filtered searches still return `limit`
+        chunks when that many match.
+        """
+        try:
+            # Only chunks embedded in the same vector space are comparable
+            # Results are built from the chunk text; parsing each vector in Python would cost more than the query
+            chunks = DocumentChunk.objects.filter(embedding_provider=self.provider.name).select_related(
+                'document').defer('embedding', 'content_tsv')
+            if filters:
+                chunks = filters.apply(chunks)
+
+            with stage('search', 'sql'):
+                search_query = SearchQuery(text, config='simple') if text else None
+                # Ordering by a score mixing in the text rank would scan every chunk in scope;
+                # the nearest candidates come from the index and only they are ranked by text
+                candidates = self._nearest_chunks(
+                    chunks, query_embedding, limit * HYBRID_CANDIDATES if text else limit,
+                    scoped=filters is not None and filters.narrow,
+                    search_query=search_query
+                )
+                found = {chunk.id for chunk in candidates}
+                missing = [chunk_id for chunk_id in include_ids if chunk_id not in found]
+                if missing:
+                    candidates += self._ranked(chunks.filter(id__in=missing), query_embedding, search_query)
+                chunks_with_scores = sorted(
+                    candidates, key=lambda chunk: chunk.distance - chunk.text_rank * TEXT_RANK_WEIGHT
+                )[:limit]
+
+            return [
+                self._format_result(chunk.id, chunk.document.id, chunk.document.title, chunk.content,
+                                    chunk.chunk_index, chunk.distance, chunk.text_rank)
+                for chunk in chunks_with_scores
+            ]
+        except Exception as e:
+            logger.error(f"Error searching chunks by embedding: {e}")
+            raise
+
+    def _nearest_chunks(self, chunks, query_embedding, limit: int, scoped: bool,
+                        search_query: SearchQuery = None) -> List[DocumentChunk]:
+        """
+        The `limit` chunks of `chunks` nearest to the query, with the full-text rank of
+        `search_query` as their `text_rank`. The vector indexes filter after scanning, so an
+        index scan can find fewer chunks than the filters let through: small scopes are
+        sorted exactly instead, and short index scans are widened. Only `scoped` searches, whose
+        filters may select few chunks, pay for the planner's estimate of their scope.
+        """
+        ranked = self._ranked(chunks, query_embedding, search_query)
+
+        if scoped and self._estimated_rows(chunks) <= EXACT_SEARCH_MAX_CHUNKS:
+            return self._exact_nearest_chunks(ranked, limit)
+
+        parameters = {}
+        if iterative_scans_supported():
+            # The index scan continues past ef_search/probes until `limit` rows pass the filters
+            parameters = {'hnsw.iterative_scan': 'relaxed_order', 'ivfflat.iterative_scan': 'relaxed_order'}
+        with local_settings(parameters), connection.cursor() as cursor:
+            found = list(ranked[:limit])
+            if len(found) < limit:
+                cursor.execute("SELECT current_setting('ivfflat.probes', true), current_setting('hnsw.ef_search', true)")
+                probes, ef_search = (int(value) if value else default for value, default in zip(cursor.fetchone(), (1, 40)))
+                for _ in range(ANN_WIDENINGS):
+                    probes *= ANN_WIDEN_FACTOR
+                    ef_search = min(ef_search * ANN_WIDEN_FACTOR, HNSW_MAX_EF_SEARCH)
+                    logger.debug("Index scan found %d of %d chunks, retrying with probes=%d ef_search=%d",
+                                 len(found), limit, probes, ef_search)
+                    with local_settings({'ivfflat.probes': probes, 'hnsw.ef_search': ef_search}):
+                        found = list(ranked[:limit])
+                    if len(found) == limit:
+                        break
+        if len(found) < limit:
+            # Fewer matching chunks than `limit`, or the filters are too selective for the index
+            return self._exact_nearest_chunks(ranked, limit)
+        # Relaxed-order iterative scans can return neighbours slightly out of order
+        return sorted(found, key=lambda chunk: chunk.distance)
+
+    @staticmethod
+    def _ranked(chunks, query_embedding, search_query: SearchQuery = None):
+        """`chunks` with their `distance` to the query and `text_rank`, nearest first."""
+        return chunks.annotate(
+            distance=CosineDistance("embedding", query_embedding),
+            # F() ranks the stored tsvector, a plain field name would make SearchRank rebuild it
+            # from its text form on every row
+            text_rank=(SearchRank(F('content_tsv'), search_query) if search_query is not None
+                       else Value(0.0, output_field=FloatField())),
+        ).order_by('distance')
+
+    @staticmethod
+    def _estimated_rows(queryset) -> int:
+        """
+        The planner's estimate of the rows `queryset` selects. Counting them would read as
+        many rows as an exact search; a wrong estimate only costs speed, since both search
+        paths return complete results.
+        """
+        plan = json.loads(queryset.explain(format='json'))
+        return plan[0]['Plan']['Plan Rows']
+
+    @staticmethod
+    def _exact_nearest_chunks(ranked, limit: int) -> List[DocumentChunk]:
+        # Without plain index scans the vector indexes are unusable (they have no bitmap scans),
+        # so the filters are served by bitmap scans of their indexes and the chunks sorted
+        with local_settings({'enable_indexscan': 'off'}):
+            return list(ranked[:limit])
+
+    def search_similar_batch(self, texts: List[str], limit: int = 5) -> List[List[Dict[str, Any]]]:
+        """Vector-only search for several queries: one embedding request and one SQL query for all of them."""
+        try:
+            if not texts:
+                return []
+            with stage('search', 'embed_query'):
+                query_embeddings = self.provider.embed_for_storage(texts)
+            return self.search_batch_by_embedding(query_embeddings, limit=limit)
+        except Exception as e:
+            logger.error(f"Error searching similar chunks for {len(texts)} queries: {e}")
+            raise
+
+    def search_batch_by_embedding(self, query_embeddings, limit: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Vector-only search for several embedded queries in a single round trip. Every query
+        runs as its own LATERAL subquery ordered by distance, so each can use the vector index.
+        Returns one result list per query, in input order.
+        """
+        if not len(query_embeddings):
+            return []
+        chunk_table = DocumentChunk._meta.db_table
+        document_table = StoredDocument._meta.db_table
+        # pgvector's text format; the array is cast once, a cast inside the subquery would
+        # parse the query vector again for every row of a sequential scan
+        literals = ['[' + ','.join(map(repr, np.asarray(embedding, dtype=float).tolist())) + ']'
+                    for embedding in query_embeddings]
+        try:
+            with stage('search', 'sql'), connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT query.ordinality, chunk.id, chunk.document_id, document.title, chunk.content,
+                           chunk.chunk_index, chunk.distance
+                    FROM unnest(%s::vector[]) WITH ORDINALITY AS query (embedding, ordinality)
+                    CROSS JOIN LATERAL (
+                        SELECT id, document_id, content, chunk_index,
+                               embedding <=> query.embedding AS distance
+                        FROM {chunk_table}
+                        WHERE embedding_provider = %s
+                        ORDER BY embedding <=> query.embedding
+                        LIMIT %s
+                    ) AS chunk
+                    JOIN {document_table} AS document ON document.id = chunk.document_id
+                    ORDER BY query.ordinality, chunk.distance
+                    """,
+                    [literals, self.provider.name, limit]
+                )
+                rows = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error in batch search of {len(literals)} queries: {e}")
+            raise
+
+        results = [[] for _ in literals]
+        for ordinality, chunk_id, document_id, title, content, chunk_index, distance in rows:
+            results[ordinality - 1].append(
+                self._format_result(chunk_id, document_id, title, content, chunk_index, distance, 0.0)
+            )
+        return results
+
+    @staticmethod
+    def _format_result(chunk_id, document_id, document_title: str, content: str, chunk_index: int,
+                       distance: float, text_rank: float) -> Dict[str, Any]:
+        # Convert cosine distance to similarity score (1 - distance)
+        vector_score = round(1 - float(distance), 4)
+        text_score = float(text_rank)
+        return {
+            'chunk_id': chunk_id,
+            'document_id': document_id,
+            'document_title': document_title,
+            'content': content,
+            'chunk_index': chunk_index,
+            'vector_similarity': vector_score,
+            'text_match_score': text_score,
+            # Combined score formula gives higher weight to text relevance (adjust weights as necessary):
+            'combined_score': round((vector_score + text_score*5)/6, 4),
+            'search_method': 'hybrid' if text_score > 0.01 else 'semantic'
+        }
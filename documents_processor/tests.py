@@ -1,3 +1,493 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase
+
+from .fakes.pdf import cookbook_pdf
+from .models import IngestionCheckpoint, StoredDocument
+from .services.batch_embedding_service import BatchEmbeddingService
+from .services.embedding_providers import STORAGE_DIMENSIONS, HashingEmbeddingProvider
+from .services.file_processor_service import DocumentBusyError, FileProcessorService
+from .services.mmr import maximal_marginal_relevance
+from .services.rate_limiter import TokenBucket
+from .services.recipe_splitter_service import RecipeSplitterService
+from .services.text_splitter_service import TextSplitterService
+from .services.vector_service import SEARCHABLE_STATUSES, ChunkFilter, VectorService
+from .upload_handlers import HashedUploadedFile
+
+
+class TextSplitterServiceTests(SimpleTestCase):
+    def test_short_text_is_one_window(self):
+        chunks = TextSplitterService(50, 10).split_text("Żurek na zakwasie")
+
+        self.assertEqual([chunk["text"] for chunk in chunks], ["Żurek na zakwasie"])
+
+    def test_empty_text_has_no_windows(self):
+        self.assertEqual(TextSplitterService(50, 10).split_text(""), [])
+
+    def test_windows_are_slices_of_the_text(self):
+        splitter = TextSplitterService(8, 2)
+        text = "Źdźbła szczypiorku, łyżka śmietany, żółty ser i ćwiartka cebuli. " * 5
+
+        chunks = splitter.split_text(text)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(text.startswith(chunks[0]["text"]))
+        self.assertTrue(text.endswith(chunks[-1]["text"]))
+        for chunk in chunks:
+            self.assertIn(chunk["text"], text)
+            self.assertLessEqual(chunk["token_count"], 8)
+
+    def test_split_many_matches_split_text(self):
+        splitter = TextSplitterService(8, 2)
+        texts = ["Gołąbki w sosie pomidorowym z ryżem i mięsem mielonym", "", "Pierogi"]
+
+        self.assertEqual(splitter.split_many(texts), [splitter.split_text(text) for text in texts])
+
+    def test_char_offsets_walk_back_to_the_start_of_a_character(self):
+        # "żół" is three two-byte characters; byte 1 and byte 3 fall inside "ż" and "ó"
+        offsets = TextSplitterService._char_offsets("żółw", [0, 1, 2, 3, 4, 6, 7], [0, 1, 3, 5, 6])
+
+        self.assertEqual(offsets, {0: 0, 1: 0, 3: 1, 5: 3, 6: 4})
+
+    def test_overlap_must_be_smaller_than_chunk_size(self):
+        with self.assertRaises(ValueError):
+            TextSplitterService(10, 10)
+
+
+class RecipeSplitterServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.splitter = RecipeSplitterService()
+
+    def test_one_chunk_per_recipe(self):
+        text = (
+            "JAJKA PO TURECKU\nSkładniki:\n2 jajka\njogurt\nSposób przygotowania\nUgotuj jajka.\n"
+            "CAPRESE z żurawiną\nSkładniki:\npomidor\nmozzarella\nPokrój i podawaj.\n"
+        )
+
+        chunks = self.splitter.split_text(text)
+
+        self.assertEqual([chunk["title"] for chunk in chunks], ["JAJKA PO TURECKU", "CAPRESE z żurawiną"])
+        self.assertIn("Ugotuj jajka.", chunks[0]["text"])
+        self.assertNotIn("mozzarella", chunks[0]["text"])
+
+    def test_text_without_recipes_has_no_title(self):
+        chunks = self.splitter.split_text("Wstęp do książki.\nDziękuję wszystkim.")
+
+        self.assertEqual(len(chunks), 1)
+        self.assertIsNone(chunks[0]["title"])
+
+    def test_long_recipe_falls_back_to_titled_token_windows(self):
+        splitter = RecipeSplitterService(max_tokens=50, text_splitter=TextSplitterService(50, 10))
+        text = "BIGOS\nSkładniki:\n" + "kapusta kiszona, grzyby, śliwki\n" * 40
+
+        chunks = splitter.split_text(text)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual({chunk["title"] for chunk in chunks}, {"BIGOS"})
+        self.assertTrue(all(chunk["token_count"] <= 50 for chunk in chunks))
+
+    def test_table_of_contents_leaders_are_dropped(self):
+        text = "Spis treści\nNocna owsianka .......... 8\nNocna owsianka\nSkładniki:\npłatki\nmleko"
+
+        chunks = self.splitter.split_text(text)
+
+        self.assertEqual(chunks[-1]["title"], "Nocna owsianka")
+        self.assertNotIn("..........", "".join(chunk["text"] for chunk in chunks))
+
+    def test_recipe_over_a_page_break_is_one_chunk(self):
+        pages = {
+            1: "ZUPA DYNIOWA\nRozgrzewająca zupa na jesień.",
+            2: "Składniki:\ndynia\nimbir\nSposób przygotowania\nPodsmaż dynię.",
+            3: "Zmiksuj i podawaj z pestkami.\nPLACKI ZIEMNIACZANE\nSkładniki:\nziemniaki\nSmaż na złoto.",
+        }
+
+        chunks = self.splitter.split_pages(pages)
+
+        self.assertEqual([chunk["title"] for chunk in chunks[1]], ["ZUPA DYNIOWA"])
+        self.assertIn("Rozgrzewająca zupa", chunks[1][0]["text"])
+        self.assertIn("Zmiksuj i podawaj", chunks[1][0]["text"])
+        self.assertEqual(chunks[2], [])
+        self.assertEqual([chunk["title"] for chunk in chunks[3]], ["PLACKI ZIEMNIACZANE"])
+
+    def test_table_of_contents_titles_apply_to_later_pages(self):
+        pages = {
+            1: "Spis treści\nNocna owsianka ........ 2\nSałatka z brokuła ........ 3",
+            2: "Nocna owsianka\nSkładniki:\npłatki\nmleko",
+            3: "Sałatka z brokuła\nSkładniki:\nbrokuł\nPodawaj na zimno.",
+        }
+
+        chunks = self.splitter.split_pages(pages)
+
+        self.assertEqual([chunk["title"] for chunk in chunks[2]], ["Nocna owsianka"])
+        self.assertEqual([chunk["title"] for chunk in chunks[3]], ["Sałatka z brokuła"])
+
+    def test_running_headers_do_not_start_recipes(self):
+        pages = {
+            1: "WEGAŃSKIE OBIADY\nLECZO\nSkładniki:\npapryka\ncukinia",
+            2: "WEGAŃSKIE OBIADY\nDuś pod przykryciem.",
+            3: "WEGAŃSKIE OBIADY\nGULASZ\nSkładniki:\nsoczewica",
+        }
+
+        chunks = self.splitter.split_pages(pages)
+
+        self.assertEqual([chunk["title"] for chunk in chunks[1]], [None, "LECZO"])
+        self.assertIn("Duś pod przykryciem.", chunks[1][1]["text"])
+        self.assertEqual([chunk["title"] for chunk in chunks[3]], ["GULASZ"])
+
+    def test_text_before_the_first_recipe_stays_on_its_page(self):
+        pages = {1: "Wstęp", 2: "Podziękowania", 3: "BIGOS\nSkładniki:\nkapusta"}
+
+        chunks = self.splitter.split_pages(pages)
+
+        self.assertEqual([chunk["text"] for chunk in chunks[1]], ["Wstęp"])
+        self.assertEqual([chunk["text"] for chunk in chunks[2]], ["Podziękowania"])
+        self.assertEqual([chunk["title"] for chunk in chunks[3]], ["BIGOS"])
+
+
+class HashedUploadedFileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def upload(self, contents: bytes) -> HashedUploadedFile:
+        path = self.directory / ".upload-test.part"
+        path.write_bytes(contents)
+        return HashedUploadedFile(
+            path, "book.pdf", "application/pdf", len(contents), None, hashlib.sha256(contents).hexdigest()
+        )
+
+    def test_move_into_free_name(self):
+        path = self.upload(b"new book").move_into(self.directory, "book.pdf")
+
+        self.assertEqual(path, self.directory / "book.pdf")
+        self.assertEqual(path.read_bytes(), b"new book")
+        self.assertFalse((self.directory / ".upload-test.part").exists())
+
+    def test_move_into_never_overwrites_another_file(self):
+        (self.directory / "book.pdf").write_bytes(b"old book")
+        uploaded = self.upload(b"new book")
+
+        path = uploaded.move_into(self.directory, "book.pdf")
+
+        self.assertEqual((self.directory / "book.pdf").read_bytes(), b"old book")
+        self.assertEqual(path.name, f"book_{uploaded.sha256[:12]}.pdf")
+        self.assertEqual(path.read_bytes(), b"new book")
+
+
+class IngestionTestCase(TestCase):
+    """Ingests generated cookbooks with the hashing embedder, without network access."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.processor = FileProcessorService(google_drive_service=mock.Mock(), openai_service=mock.Mock())
+        self.processor.vector_service = VectorService(None, provider=HashingEmbeddingProvider(256))
+
+    def write_cookbook(self, pages: int, name: str = "cookbook.pdf") -> Path:
+        path = self.directory / name
+        path.write_bytes(cookbook_pdf(pages, seed=3))
+        return path
+
+    def chunks_by_page(self, document):
+        return {
+            page_number: list(document.chunks.filter(page_number=page_number).order_by('chunk_index').values_list('id', flat=True))
+            for page_number in document.pages.values_list('page_number', flat=True)
+        }
+
+
+class ReingestionTests(IngestionTestCase):
+    def test_processed_file_is_not_processed_again(self):
+        path = self.write_cookbook(2)
+        document, needs_processing = self.processor.register_document(path, "Cookbook")
+        self.assertTrue(needs_processing)
+        self.processor.process_document(str(document.id))
+
+        again, needs_processing = self.processor.register_document(path, "Cookbook")
+        copy, copy_needs_processing = self.processor.register_document(self.write_cookbook(2, "copy.pdf"), "Copy")
+
+        self.assertEqual((again.id, needs_processing), (document.id, False))
+        self.assertEqual((copy.id, copy_needs_processing), (document.id, False))
+        self.assertEqual(StoredDocument.objects.count(), 1)
+
+    def test_unchanged_pages_are_not_embedded_again(self):
+        path = self.write_cookbook(2)
+        document, _ = self.processor.register_document(path, "Cookbook")
+        self.processor.process_document(str(document.id))
+        before = self.chunks_by_page(document)
+
+        path.write_bytes(cookbook_pdf(3, seed=3))
+        changed, needs_processing = self.processor.register_document(path, "Cookbook")
+        with mock.patch.object(self.processor, "_store_page", wraps=self.processor._store_page) as store_page:
+            result = self.processor.process_document(str(changed.id))
+
+        self.assertEqual((changed.id, needs_processing), (document.id, True))
+        # Page 2 ends with a recipe that now continues on page 3, so only page 1 is kept
+        self.assertEqual([call.args[2] for call in store_page.call_args_list], [2, 3])
+        after = self.chunks_by_page(document)
+        self.assertEqual(after[1], before[1])
+        self.assertEqual(result["chunks"], len(after[2]) + len(after[3]))
+
+    def test_unchanged_file_at_a_new_path_embeds_nothing(self):
+        document, _ = self.processor.register_document(self.write_cookbook(2), "Cookbook")
+        self.processor.process_document(str(document.id))
+        document.status = "pending"
+        document.save()
+
+        result = self.processor.process_document(str(document.id))
+
+        self.assertEqual(result["chunks"], 0)
+        document.refresh_from_db()
+        self.assertEqual(document.status, "processed")
+
+
+class ResumeTests(IngestionTestCase):
+    def fail_on_page(self, page_number):
+        store_page = self.processor._store_page
+
+        def failing(document, checkpoint, number, *args):
+            if number == page_number:
+                raise ConnectionError("OpenAI 503")
+            return store_page(document, checkpoint, number, *args)
+        return mock.patch.object(self.processor, "_store_page", side_effect=failing)
+
+    def test_resume_continues_after_the_last_completed_page(self):
+        document, _ = self.processor.register_document(self.write_cookbook(3), "Cookbook")
+        with self.fail_on_page(2), self.assertRaises(ConnectionError), self.assertLogs(level="ERROR"):
+            self.processor.process_document(str(document.id))
+        document.refresh_from_db()
+        self.assertEqual(document.status, "error")
+        self.assertEqual(IngestionCheckpoint.objects.get(document=document).last_completed_page, 1)
+        first_page = self.chunks_by_page(document)[1]
+
+        with mock.patch.object(self.processor, "_store_page", wraps=self.processor._store_page) as store_page:
+            self.processor.resume(str(document.id))
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, "processed")
+        self.assertEqual([call.args[2] for call in store_page.call_args_list], [2, 3])
+        self.assertEqual(self.chunks_by_page(document)[1], first_page)
+        self.assertEqual(sorted(document.pages.values_list("page_number", flat=True)), [1, 2, 3])
+        indexes = sorted(document.chunks.values_list("chunk_index", flat=True))
+        self.assertEqual(indexes, list(range(len(indexes))))
+
+    def test_document_being_processed_is_not_resumed(self):
+        document, _ = self.processor.register_document(self.write_cookbook(1), "Cookbook")
+        IngestionCheckpoint.objects.create(document=document, mode="pypdf2")
+        document.status = "processing"
+        document.save()
+
+        with self.assertRaises(DocumentBusyError):
+            self.processor.resume(str(document.id))
+        self.assertFalse(document.chunks.exists())
+
+    def test_resume_needs_a_checkpoint(self):
+        document, _ = self.processor.register_document(self.write_cookbook(1), "Cookbook")
+
+        with self.assertRaises(ValueError):
+            self.processor.resume(str(document.id))
+
+
+class TitleSearchTests(TestCase):
+    def setUp(self):
+        self.vector_service = VectorService(None, provider=HashingEmbeddingProvider(256), title_match_threshold=0.7)
+        document = StoredDocument.objects.create(file_path="/tmp/book.pdf", title="Zupy i pierogi", status="processed")
+        texts = ["Pomidory, bulion i bazylia.", "Ogórki kiszone, ziemniaki i koperek.", "Ziemniaki, twaróg i cebula.",
+                 "Wstęp do książki."]
+        headings = ["Zupa pomidorowa", "Zupa ogórkowa", "Pierogi ruskie", None]
+        self.vector_service.store_chunks(
+            document, texts, self.vector_service.embed_texts(texts), 0, page_number=1, headings=headings
+        )
+
+    def test_query_matching_a_whole_heading_skips_the_embedding(self):
+        with mock.patch.object(self.vector_service.provider, "embed_query") as embed_query:
+            results = self.vector_service.search_similar("piergi ruskie", limit=3)
+
+        embed_query.assert_not_called()
+        self.assertEqual(results[0]["search_method"], "title")
+        self.assertEqual(results[0]["heading"], "Pierogi ruskie")
+        self.assertIsInstance(results[0]["vector_similarity"], float)
+
+    def test_word_found_in_many_headings_takes_the_hybrid_path(self):
+        with mock.patch.object(self.vector_service.provider, "embed_query",
+                               wraps=self.vector_service.provider.embed_query) as embed_query:
+            results = self.vector_service.search_similar("zupa", limit=4)
+
+        embed_query.assert_called_once_with("zupa")
+        self.assertNotIn("title", {result["search_method"] for result in results})
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(isinstance(result["vector_similarity"], float) for result in results))
+
+    def test_title_matches_join_the_hybrid_candidates(self):
+        results = self.vector_service.search_similar("zupa", limit=1)
+
+        self.assertIn(results[0]["content"], {"Pomidory, bulion i bazylia.", "Ogórki kiszone, ziemniaki i koperek."})
+
+
+class ChunkFilterTests(SimpleTestCase):
+    def test_default_status_scope_is_not_narrow(self):
+        self.assertFalse(ChunkFilter().narrow)
+        self.assertFalse(ChunkFilter(statuses=SEARCHABLE_STATUSES).narrow)
+        self.assertFalse(ChunkFilter(statuses=[*SEARCHABLE_STATUSES, "error"]).narrow)
+
+    def test_other_filters_are_narrow(self):
+        self.assertTrue(ChunkFilter(statuses=["error"]).narrow)
+        self.assertTrue(ChunkFilter(statuses=SEARCHABLE_STATUSES, document_ids=[1]).narrow)
+
+
+class ScopedSearchTests(TestCase):
+    def setUp(self):
+        self.vector_service = VectorService(None, provider=HashingEmbeddingProvider(256), title_match_threshold=0)
+        self.documents = [
+            StoredDocument.objects.create(file_path=f"/tmp/{name}.pdf", title=name, status="processed")
+            for name in ("zupy", "ciasta")
+        ]
+        for document, texts in zip(self.documents, [["Zupa pomidorowa", "Zupa ogórkowa"], ["Sernik", "Szarlotka"]]):
+            self.vector_service.store_chunks(document, texts, self.vector_service.embed_texts(texts), 0)
+
+    def test_default_scope_skips_the_row_estimate(self):
+        with mock.patch.object(VectorService, "_estimated_rows") as estimated_rows:
+            results = self.vector_service.search_similar("zupa", limit=4, filters=ChunkFilter(statuses=SEARCHABLE_STATUSES))
+
+        estimated_rows.assert_not_called()
+        self.assertEqual(len(results), 4)
+
+    def test_document_scope_is_searched_exactly(self):
+        scope = ChunkFilter(statuses=SEARCHABLE_STATUSES, document_ids=[self.documents[1].id])
+
+        results = self.vector_service.search_similar("zupa", limit=4, filters=scope)
+
+        self.assertEqual({result["content"] for result in results}, {"Sernik", "Szarlotka"})
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("documents_processor.services.rate_limiter.time.monotonic", return_value=100.0)
+        self.monotonic = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_starts_full_and_reports_the_wait(self):
+        bucket = TokenBucket(rate=2, capacity=4)
+
+        self.assertEqual(bucket.try_acquire(3), 0.0)
+        self.assertEqual(bucket.try_acquire(3), 1.0)
+
+    def test_refills_up_to_capacity(self):
+        bucket = TokenBucket(rate=2, capacity=4)
+        bucket.try_acquire(4)
+
+        self.monotonic.return_value = 101.0
+        self.assertEqual(bucket.try_acquire(2), 0.0)
+        self.monotonic.return_value = 200.0
+        self.assertEqual(bucket.try_acquire(4), 0.0)
+        self.assertGreater(bucket.try_acquire(1), 0.0)
+
+    def test_request_larger_than_the_bucket_drains_it(self):
+        bucket = TokenBucket(rate=1, capacity=5)
+
+        self.assertEqual(bucket.try_acquire(50), 0.0)
+        self.assertEqual(bucket.try_acquire(1), 1.0)
+
+    def test_rate_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class BatchResultParsingTests(SimpleTestCase):
+    @staticmethod
+    def result_line(embedding=None, status_code=200, response=True, error=None):
+        body = {"data": [{"embedding": embedding}], "usage": {"prompt_tokens": 7}}
+        return json.dumps({
+            "custom_id": "3-0",
+            "response": {"status_code": status_code, "body": body} if response else None,
+            "error": error,
+        })
+
+    def test_base64_embedding(self):
+        vector = np.array([0.25, -1.5, 3.0], dtype="<f4")
+        line = self.result_line(base64.b64encode(vector.tobytes()).decode())
+
+        custom_id, embedding, tokens = BatchEmbeddingService.parse_result(line)
+
+        self.assertEqual((custom_id, tokens), ("3-0", 7))
+        np.testing.assert_array_equal(embedding, vector)
+
+    def test_float_embedding(self):
+        _, embedding, _ = BatchEmbeddingService.parse_result(self.result_line([0.5, 1.0]))
+
+        self.assertEqual(embedding.dtype, np.float32)
+        np.testing.assert_array_equal(embedding, [0.5, 1.0])
+
+    def test_failed_requests_are_skipped(self):
+        lines = [
+            self.result_line(response=False, error={"code": "server_error"}),
+            self.result_line(response=False),
+            self.result_line(status_code=429),
+        ]
+        with self.assertLogs("documents_processor.services.batch_embedding_service", "WARNING"):
+            self.assertEqual([BatchEmbeddingService.parse_result(line) for line in lines], [None, None, None])
+
+    def test_parse_requests_skips_blank_lines(self):
+        lines = [
+            json.dumps({"custom_id": "1-0", "body": {"input": "Bigos"}}),
+            "",
+            json.dumps({"custom_id": "1-1", "body": {"input": "Żurek"}}),
+        ]
+
+        self.assertEqual(list(BatchEmbeddingService.parse_requests(lines)), [("1-0", "Bigos"), ("1-1", "Żurek")])
+
+
+class HashingEmbeddingProviderTests(SimpleTestCase):
+    def setUp(self):
+        self.provider = HashingEmbeddingProvider(dimensions=256)
+
+    def test_vectors_are_unit_length_and_deterministic(self):
+        vectors = self.provider.embed(["pierogi ruskie", "pierogi ruskie", ""])
+
+        self.assertEqual(vectors.shape, (3, 256))
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, places=5)
+        np.testing.assert_array_equal(vectors[0], vectors[1])
+        self.assertFalse(vectors[2].any())
+
+    def test_case_and_polish_letters_are_folded(self):
+        vectors = self.provider.embed(["Żurek z łazankami", "zurek z lazankami"])
+
+        np.testing.assert_array_equal(vectors[0], vectors[1])
+
+    def test_storage_vectors_are_zero_padded(self):
+        vectors = self.provider.embed_for_storage(["bigos"])
+
+        self.assertEqual(vectors.shape, (1, STORAGE_DIMENSIONS))
+        np.testing.assert_array_equal(vectors[0, :256], self.provider.embed(["bigos"])[0])
+        self.assertFalse(vectors[0, 256:].any())
+        self.assertEqual(self.provider.name, "hashing:256")
+
+    def test_dimensions_are_limited_to_the_storage_width(self):
+        with self.assertRaises(ImproperlyConfigured):
+            HashingEmbeddingProvider(dimensions=STORAGE_DIMENSIONS + 1)
+
+
+class MaximalMarginalRelevanceTests(SimpleTestCase):
+    embeddings = [[1.0, 0.0], [1.0, 0.01], [0.0, 1.0]]
+
+    def test_lambda_one_keeps_the_relevance_order(self):
+        self.assertEqual(maximal_marginal_relevance([0.9, 0.8, 0.7], self.embeddings, 3, lambda_mult=1.0), [0, 1, 2])
+
+    def test_near_copies_fall_behind_different_results(self):
+        self.assertEqual(maximal_marginal_relevance([0.9, 0.8, 0.7], self.embeddings, 3, lambda_mult=0.5), [0, 2, 1])
+
+    def test_k_is_limited_to_the_candidates(self):
+        self.assertEqual(len(maximal_marginal_relevance([0.9, 0.8], self.embeddings[:2], 5)), 2)
+        self.assertEqual(maximal_marginal_relevance([0.9, 0.8], self.embeddings[:2], 0), [])
+        self.assertEqual(maximal_marginal_relevance([], [], 3), [])
+
+    def test_zero_vectors_are_allowed(self):
+        self.assertEqual(maximal_marginal_relevance([0.1, 0.9], [[0.0, 0.0], [1.0, 0.0]], 2), [1, 0])
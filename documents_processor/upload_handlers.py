@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+import hashlib
+import uuid
+from pathlib import Path
+
+
+class HashedUploadedFile(UploadedFile):
+    """An upload already written to `path` in DOCUMENTS_DIR, with the SHA-256 of its contents."""
+
+    def __init__(self, path: Path, name: str, content_type: str, size: int, charset, sha256: str):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset)
+        self.path = path
+        self.sha256 = sha256
+
+    def discard(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def move_into(self, directory: Path, file_name: str) -> Path:
+        """
+        Move the upload to `file_name` in `directory` and return its new path. An existing
+        file is never overwritten: the name then gets the start of the upload's hash appended.
+        """
+        self.close()
+        path = Path(directory) / file_name
+        try:
+            # Claims the name atomically, so concurrent uploads cannot both take it
+            open(path, 'xb').close()
+        except FileExistsError:
+            # Another file has this name, the upload gets a name of its own
+            path = path.with_name(f"{path.stem}_{self.sha256[:12]}{path.suffix}")
+        # A file at the hashed name has the same contents, replacing it changes nothing
+        self.path.replace(path)
+        self.path = path
+        return path
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """
+    Streams the `file` field of a multipart request to disk while hashing it.
+
+    Chunks go straight from the socket into a `.part` file in DOCUMENTS_DIR and into a
+    SHA-256 digest, so memory use does not depend on the size of the upload and the
+    file never has to be read again to fingerprint it. Other file fields are ignored.
+    """
+    chunk_size = 1024 * 1024
+    field_name = 'file'
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.destination = None
+        if field_name != self.field_name:
+            return
+        self.path = Path(settings.DOCUMENTS_DIR) / f".upload-{uuid.uuid4().hex}.part"
+        self.destination = open(self.path, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.destination is not None:
+            self.destination.write(raw_data)
+            self.digest.update(raw_data)
+            self.size += len(raw_data)
+        # Nothing is passed on to other handlers
+        return None
+
+    def file_complete(self, file_size):
+        if self.destination is None:
+            return None
+        self.destination.close()
+        self.destination = None
+        return HashedUploadedFile(
+            self.path, self.file_name, self.content_type, self.size, self.charset, self.digest.hexdigest()
+        )
+
+    def upload_interrupted(self):
+        if getattr(self, 'destination', None) is not None:
+            self.destination.close()
+            self.destination = None
+            self.path.unlink(missing_ok=True)
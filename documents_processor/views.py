@@ -1,16 +1,29 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from .models import StoredDocument
+from .models import StoredDocument, IngestionCheckpoint
 from .serializers import StoredDocumentSerializer
-from .services.file_processor_service import FileProcessorService
+from .services.file_processor_service import DocumentBusyError, FileProcessorService
 from pathlib import Path
 from django.conf import settings
 from .services.google_drive_service import GoogleDriveService
+from .services.ingestion_queue import enqueue_document
+from .services.usage_service import MAX_USAGE_ROWS, usage_by, usage_totals
+from .upload_handlers import HashingFileUploadHandler
+from django.utils.text import get_valid_filename
 
 # Create your views here.
 
+def already_processed_response(document):
+    """Response for a file whose exact contents were already ingested."""
+    return Response({
+        "message": "Document already processed, nothing to do",
+        "document_id": document.id,
+        "status": document.status
+    })
+
 class DocumentProcessorViewSet(viewsets.ModelViewSet):
     queryset = StoredDocument.objects.all()
     serializer_class = StoredDocumentSerializer
@@ -35,15 +48,12 @@ class DocumentProcessorViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Create StoredDocument with pending status
-        document = StoredDocument.objects.create(
-            file_path=str(file_path),
-            title=file_name,
-            status='pending'
-        )
-
-        # Initialize processor and start processing
+        # Initialize processor and find or create the document for this file
         processor = FileProcessorService()
+        document, needs_processing = processor.register_document(file_path, file_name)
+        if not needs_processing:
+            return already_processed_response(document)
+
         try:
             processor.process_document(str(document.id), use_google_drive=use_google_drive)
             return Response({
@@ -58,6 +68,56 @@ class DocumentProcessorViewSet(viewsets.ModelViewSet):
                 "error": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def upload(self, request):
+        # Must be set before the body is parsed: streams the file to disk while hashing it
+        request.upload_handlers = [HashingFileUploadHandler(request)]
+        uploads = request.FILES.getlist('file')
+        if not uploads:
+            return Response(
+                {"error": "No file provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        uploaded, extra = uploads[0], uploads[1:]
+        for other in extra:
+            other.discard()
+
+        file_name = get_valid_filename(Path(uploaded.name).name)
+        if Path(file_name).suffix.lower() != '.pdf':
+            uploaded.discard()
+            return Response(
+                {"error": "Only PDF files can be uploaded"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Reject duplicates before the file is moved into place or processed
+        existing = StoredDocument.objects.filter(
+            file_hash=uploaded.sha256, status__in=['processed', 'processing']
+        ).order_by('-created_at').first()
+        if existing is not None:
+            uploaded.discard()
+            return Response({
+                "error": "This file was already uploaded",
+                "document_id": existing.id,
+                "status": existing.status
+            }, status=status.HTTP_409_CONFLICT)
+
+        file_path = uploaded.move_into(settings.DOCUMENTS_DIR, file_name)
+
+        processor = FileProcessorService()
+        document, needs_processing = processor.register_document(file_path, file_name, file_hash=uploaded.sha256)
+        if not needs_processing:
+            return already_processed_response(document)
+
+        use_google_drive = str(request.data.get('use_google_drive', '')).lower() in ('1', 'true')
+        enqueue_document(str(document.id), use_google_drive=use_google_drive)
+        return Response({
+            "message": "Document uploaded, processing queued",
+            "document_id": document.id,
+            "file_hash": uploaded.sha256,
+            "size": uploaded.size
+        }, status=status.HTTP_202_ACCEPTED)
+
     @action(detail=False, methods=['post'])
     def process_drive_document(self, request):
         drive_file_id = request.data.get('drive_file_id')
@@ -71,23 +131,22 @@ class DocumentProcessorViewSet(viewsets.ModelViewSet):
         drive_service = GoogleDriveService()
         
         try:
-            # Download file from Google Drive
-            file_content = drive_service.download_file(drive_file_id)
-            
-            # Save to temporary file
-            temp_file_path = Path(settings.DOCUMENTS_DIR) / f"drive_{drive_file_id}.pdf"
-            with open(temp_file_path, 'wb') as f:
-                f.write(file_content)
-            
-            # Create StoredDocument with pending status
-            document = StoredDocument.objects.create(
-                file_path=str(temp_file_path),
-                title=f"Google Drive Document {drive_file_id}",
-                status='pending'
+            # Stream the file from Google Drive straight into the documents directory
+            file_path = drive_service.download_to_path(
+                drive_file_id, Path(settings.DOCUMENTS_DIR) / f"drive_{drive_file_id}.pdf"
             )
             
-            # Initialize processor and start processing
+            # Initialize processor and find or create the document for this file
             processor = FileProcessorService()
+            document, needs_processing = processor.register_document(
+                file_path, f"Google Drive Document {drive_file_id}"
+            )
+            if not needs_processing:
+                if document.file_path != str(file_path):
+                    # The same contents are already stored under another name
+                    file_path.unlink(missing_ok=True)
+                return already_processed_response(document)
+
             processor.process_document(str(document.id))
             
             return Response({
@@ -119,15 +178,12 @@ class DocumentProcessorViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Create StoredDocument with pending status
-        document = StoredDocument.objects.create(
-            file_path=str(file_path),
-            title=file_name,
-            status='pending'
-        )
-
-        # Initialize processor and start batched processing
+        # Initialize processor and find or create the document for this file
         processor = FileProcessorService()
+        document, needs_processing = processor.register_document(file_path, file_name)
+        if not needs_processing:
+            return already_processed_response(document)
+
         try:
             # Use the batch processing method
             processor.process_document_with_google_drive_in_batches(
@@ -147,6 +203,92 @@ class DocumentProcessorViewSet(viewsets.ModelViewSet):
                 "error": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['post'])
+    def process_with_batch_api(self, request):
+        file_name = request.data.get('file_name')
+
+        if not file_name:
+            return Response(
+                {"error": "No file name provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        file_path = Path(settings.DOCUMENTS_DIR) / file_name
+
+        if not file_path.exists():
+            return Response(
+                {"error": f"File {file_name} not found in documents directory"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        processor = FileProcessorService()
+        document, needs_processing = processor.register_document(file_path, file_name)
+        if not needs_processing:
+            return already_processed_response(document)
+
+        try:
+            # Embeddings arrive later, collect_embedding_batches completes the document
+            result = processor.process_document_with_batch_api(str(document.id))
+            return Response({
+                "message": "Document submitted to the OpenAI Batch API",
+                "document_id": document.id,
+                "batches": result['batches'],
+                "requests": result['requests']
+            }, status=status.HTTP_202_ACCEPTED)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['get'])
+    def usage(self, request):
+        """OpenAI tokens and cost spent on ingesting each document, most expensive first."""
+        try:
+            limit = int(request.query_params.get('limit', '100'))
+        except ValueError:
+            limit = 100
+        limit = max(1, min(limit, MAX_USAGE_ROWS))
+
+        rows = usage_by('document_id', limit=limit)
+        titles = dict(
+            StoredDocument.objects.filter(id__in=[row['document_id'] for row in rows]).values_list('id', 'title')
+        )
+        for row in rows:
+            row['title'] = titles.get(row['document_id'])
+        return Response({
+            "totals": usage_totals(document_id__isnull=False),
+            "documents": rows
+        })
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        document = self.get_object()
+        if document.status == 'processed':
+            return already_processed_response(document)
+        if document.status == 'processing':
+            return Response({"error": "Document is already being processed"}, status=status.HTTP_409_CONFLICT)
+
+        processor = FileProcessorService()
+        try:
+            processor.resume(str(document.id))
+            checkpoint = IngestionCheckpoint.objects.get(document=document)
+            return Response({
+                "message": "Document processing resumed",
+                "document_id": document.id,
+                "mode": checkpoint.mode,
+                "last_completed_page": checkpoint.last_completed_page
+            })
+        except DocumentBusyError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 def get_document_status(request, document_id):
     try:
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings, picked up automatically when gunicorn is started from this directory.
+
+With PROMETHEUS_MULTIPROC_DIR set, every worker writes its metrics to that directory and
+/metrics aggregates them; see ai_cooking_project/metrics.py.
+"""
+import os
+from pathlib import Path
+
+
+def on_starting(server):
+    # Samples left over from a previous run would be added to the new totals
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for path in Path(directory).glob('*.db'):
+            path.unlink()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from documents_processor.models import StoredDocument
+        from .models import Recipe
+        from .services.suggest_service import schedule_refresh
+
+        # Recipe titles and the headings of processed documents feed the suggest index
+        for model in (Recipe, StoredDocument):
+            post_save.connect(schedule_refresh, sender=model, dispatch_uid=f'suggest-{model.__name__}-save')
+            post_delete.connect(schedule_refresh, sender=model, dispatch_uid=f'suggest-{model.__name__}-delete')
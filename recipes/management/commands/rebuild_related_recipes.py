@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.services.related_recipe_service import RelatedRecipeService
+
+
+class Command(BaseCommand):
+    """Recompute the related-recipes graph"""
+
+    help = (
+        "Embed recipes that have no embedding of the current provider or were edited since they "
+        "were embedded, and recompute every recipe's related recipes. New recipes are linked as "
+        "they are generated; rebuild after switching embedding providers, editing or deleting "
+        "recipes, or importing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--per-recipe', type=int, default=None,
+            help='Related recipes stored per recipe (default: RELATED_RECIPES_PER_RECIPE)'
+        )
+
+    def handle(self, *args, **options):
+        result = RelatedRecipeService(per_recipe=options['per_recipe']).rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Embedded {result['embedded']} recipes, linked {result['recipes']} recipes with {result['edges']} edges"
+        ))
@@ -0,0 +1,138 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:05
+
+import json
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+LIST_FIELDS = ("ingredients", "cooking_methods", "recipe_keys")
+# Entries of the facet arrays are cut to their column width; ingredient lines are unbounded
+MAX_LENGTHS = {"cooking_methods": 100, "recipe_keys": 100}
+
+
+def parse_list(value, max_length=None):
+    """
+    The JSON list written by the recipe generator; other text is taken one entry per line.
+    Entries are cut to `max_length` characters.
+    """
+    if not value or not value.strip():
+        return []
+    try:
+        parsed = json.loads(value)
+    except json.JSONDecodeError:
+        return [line.strip(" -")[:max_length] for line in value.splitlines() if line.strip(" -")]
+    if not isinstance(parsed, list):
+        parsed = [parsed]
+    return [str(item).strip()[:max_length] for item in parsed if item is not None and str(item).strip()]
+
+
+def strings_to_arrays(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    recipes = list(Recipe.objects.only("id", *LIST_FIELDS))
+    for recipe in recipes:
+        for field in LIST_FIELDS:
+            setattr(recipe, f"{field}_array", parse_list(getattr(recipe, field), MAX_LENGTHS.get(field)))
+    Recipe.objects.bulk_update(recipes, [f"{field}_array" for field in LIST_FIELDS], batch_size=500)
+
+
+def arrays_to_strings(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    recipes = list(Recipe.objects.only("id", *(f"{field}_array" for field in LIST_FIELDS)))
+    for recipe in recipes:
+        for field in LIST_FIELDS:
+            setattr(recipe, field, json.dumps(getattr(recipe, f"{field}_array"), ensure_ascii=False))
+    Recipe.objects.bulk_update(recipes, list(LIST_FIELDS), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0005_recipe_cooking_methods_recipe_course_recipe_cuisine_and_more"),
+    ]
+
+    operations = [
+        # The JSON strings cannot be cast to arrays in place, so the arrays are added beside
+        # them, filled in Python and then take over the old column names
+        migrations.AddField(
+            model_name="recipe",
+            name="ingredients_array",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.TextField(), blank=True, default=list, size=None
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="cooking_methods_array",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=100), blank=True, default=list, size=None
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="recipe_keys_array",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=100), blank=True, default=list, size=None
+            ),
+        ),
+        migrations.RunPython(strings_to_arrays, arrays_to_strings),
+        migrations.RemoveField(
+            model_name="recipe",
+            name="ingredients",
+        ),
+        migrations.RemoveField(
+            model_name="recipe",
+            name="cooking_methods",
+        ),
+        migrations.RemoveField(
+            model_name="recipe",
+            name="recipe_keys",
+        ),
+        migrations.RenameField(
+            model_name="recipe",
+            old_name="ingredients_array",
+            new_name="ingredients",
+        ),
+        migrations.RenameField(
+            model_name="recipe",
+            old_name="cooking_methods_array",
+            new_name="cooking_methods",
+        ),
+        migrations.RenameField(
+            model_name="recipe",
+            old_name="recipe_keys_array",
+            new_name="recipe_keys",
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["cooking_methods"], name="recipe_cooking_methods_gin_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["recipe_keys"], name="recipe_recipe_keys_gin_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="difficulty",
+            field=models.CharField(blank=True, db_index=True, max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="season",
+            field=models.CharField(blank=True, db_index=True, max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="course",
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="cuisine",
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
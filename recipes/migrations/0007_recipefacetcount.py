@@ -0,0 +1,119 @@
+# Generated by Django 5.1.6 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+# Facet values of the recipes in a transition table, one row per distinct value of a recipe
+FACET_VALUES = """
+    SELECT facet.facet, facet.value, {delta} AS delta
+    FROM {rows} AS recipe
+    CROSS JOIN LATERAL (
+        SELECT 'difficulty' AS facet, recipe.difficulty AS value
+        UNION SELECT 'season', recipe.season
+        UNION SELECT 'course', recipe.course
+        UNION SELECT 'cuisine', recipe.cuisine
+        UNION SELECT 'cooking_methods', unnest(recipe.cooking_methods)
+        UNION SELECT 'recipe_keys', unnest(recipe.recipe_keys)
+    ) AS facet
+    WHERE facet.value IS NOT NULL AND facet.value <> ''
+"""
+
+APPLY_DELTAS = """
+        INSERT INTO recipes_recipefacetcount (facet, value, count)
+        SELECT facet, value, sum(delta) FROM ({values}) AS delta
+        GROUP BY facet, value
+        HAVING sum(delta) <> 0
+        ON CONFLICT (facet, value) DO UPDATE SET count = recipes_recipefacetcount.count + EXCLUDED.count;
+"""
+
+# Statement-level triggers: a statement writing many recipes (bulk_create, queryset.update)
+# changes every counter once, where row-level triggers would update the same few counter rows
+# once per recipe. An update that leaves the facets alone nets out to no change at all.
+CREATE_TRIGGERS = f"""
+CREATE OR REPLACE FUNCTION update_recipe_facet_counts() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {APPLY_DELTAS.format(values=FACET_VALUES.format(rows='new_rows', delta=1))}
+    ELSIF TG_OP = 'DELETE' THEN
+        {APPLY_DELTAS.format(values=FACET_VALUES.format(rows='old_rows', delta=-1))}
+    ELSE
+        {APPLY_DELTAS.format(values=FACET_VALUES.format(rows='new_rows', delta=1)
+                             + ' UNION ALL ' + FACET_VALUES.format(rows='old_rows', delta=-1))}
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipe_facet_counts_insert
+AFTER INSERT ON recipes_recipe
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_recipe_facet_counts();
+
+CREATE TRIGGER recipe_facet_counts_update
+AFTER UPDATE ON recipes_recipe
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_recipe_facet_counts();
+
+CREATE TRIGGER recipe_facet_counts_delete
+AFTER DELETE ON recipes_recipe
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_recipe_facet_counts();
+"""
+
+# Same statement as recipe_facet_service.rebuild_facet_counts(); migrations do not import app code
+REBUILD_COUNTS = """
+DELETE FROM recipes_recipefacetcount;
+INSERT INTO recipes_recipefacetcount (facet, value, count)
+SELECT facet, value, count(*)
+FROM recipes_recipe AS recipe
+CROSS JOIN LATERAL (
+    SELECT 'difficulty' AS facet, recipe.difficulty AS value
+    UNION SELECT 'season', recipe.season
+    UNION SELECT 'course', recipe.course
+    UNION SELECT 'cuisine', recipe.cuisine
+    UNION SELECT 'cooking_methods', unnest(recipe.cooking_methods)
+    UNION SELECT 'recipe_keys', unnest(recipe.recipe_keys)
+) AS facet
+WHERE value IS NOT NULL AND value <> ''
+GROUP BY facet, value;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0006_recipe_facet_arrays"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeFacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("facet", models.CharField(max_length=32)),
+                ("value", models.CharField(max_length=100)),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "unique_together": {("facet", "value")},
+            },
+        ),
+        migrations.RunSQL(
+            CREATE_TRIGGERS,
+            """
+            DROP TRIGGER IF EXISTS recipe_facet_counts_insert ON recipes_recipe;
+            DROP TRIGGER IF EXISTS recipe_facet_counts_update ON recipes_recipe;
+            DROP TRIGGER IF EXISTS recipe_facet_counts_delete ON recipes_recipe;
+            DROP FUNCTION IF EXISTS update_recipe_facet_counts();
+            """,
+        ),
+        # Counts of the recipes that exist already
+        migrations.RunSQL(REBUILD_COUNTS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.6 on 2026-10-19 21:10
+
+import django.db.models.deletion
+import pgvector.django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0007_recipefacetcount"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeEmbedding",
+            fields=[
+                (
+                    "recipe",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="embedding",
+                        serialize=False,
+                        to="recipes.recipe",
+                    ),
+                ),
+                ("embedding", pgvector.django.VectorField(dimensions=1536)),
+                ("embedding_provider", models.CharField(db_index=True, max_length=128)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RelatedRecipe",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("similarity", models.FloatField()),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_edges",
+                        to="recipes.recipe",
+                    ),
+                ),
+                (
+                    "related",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="recipes.recipe",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["recipe", "-similarity"], name="related_recipe_lookup_idx"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(fields=("recipe", "related"), name="related_recipe_unique"),
+                ],
+            },
+        ),
+    ]
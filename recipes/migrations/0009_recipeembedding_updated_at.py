@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-19 23:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0008_recipeembedding_relatedrecipe"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipeembedding",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # Existing embeddings were made when they were created
+        migrations.RunSQL(
+            "UPDATE recipes_recipeembedding SET updated_at = created_at;",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,24 +1,86 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from pgvector.django import VectorField
 
 class Recipe(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     instructions = models.TextField()
     blog_content = models.TextField(blank=True, null=True)
-    difficulty = models.CharField(max_length=50, blank=True, null=True)
-    season = models.CharField(max_length=50, blank=True, null=True)
+    difficulty = models.CharField(max_length=50, blank=True, null=True, db_index=True)
+    season = models.CharField(max_length=50, blank=True, null=True, db_index=True)
     image_url = models.URLField(max_length=1000, blank=True, null=True)
     keywords = models.CharField(max_length=100, blank=True, null=True)
-    ingredients = models.CharField(max_length=1000, blank=True, null=True)
+    # One entry per ingredient line, e.g. "mąka pszenna - 200 g"; free text, so not a filter
+    ingredients = ArrayField(models.TextField(), default=list, blank=True)
     
     subtitle = models.CharField(max_length=255, blank=True, null=True)
-    course = models.CharField(max_length=100, blank=True, null=True)
-    cuisine = models.CharField(max_length=100, blank=True, null=True)
-    cooking_methods = models.CharField(max_length=500, blank=True, null=True)
-    recipe_keys = models.CharField(max_length=1000, blank=True, null=True)
+    course = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    cuisine = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    # Facets such as "Pieczenie" or "Wegańskie"; GIN indexes serve containment (@>) filters
+    cooking_methods = ArrayField(models.CharField(max_length=100), default=list, blank=True)
+    recipe_keys = ArrayField(models.CharField(max_length=100), default=list, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['cooking_methods'], name='recipe_cooking_methods_gin_idx'),
+            GinIndex(fields=['recipe_keys'], name='recipe_recipe_keys_gin_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+class RecipeFacetCount(models.Model):
+    """
+    Number of recipes per facet value, e.g. ('season', 'Zima') -> 12. Statement-level
+    triggers on the recipe table keep it up to date on every insert, update and delete.
+    """
+    facet = models.CharField(max_length=32)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value')
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
+
+class RecipeEmbedding(models.Model):
+    """
+    Embedding of a recipe's title, description, ingredients and keys, kept apart from the
+    recipe so that listing recipes does not read the vectors.
+    """
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    embedding = VectorField(dimensions=1536)
+    embedding_provider = models.CharField(max_length=128, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Embeddings older than their recipe's updated_at are redone by a rebuild
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Embedding of recipe {self.recipe_id} ({self.embedding_provider})"
+
+class RelatedRecipe(models.Model):
+    """
+    Edge of the related-recipes graph: `related` is one of the RELATED_RECIPES_PER_RECIPE
+    recipes most similar to `recipe`. The (recipe, -similarity) index answers a recipe's
+    related recipes, most similar first, with one index range scan.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='related_edges', db_index=False)
+    related = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+')
+    similarity = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'related'], name='related_recipe_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-similarity'], name='related_recipe_lookup_idx'),
+        ]
+
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f"{self.recipe_id} -> {self.related_id} ({self.similarity:.3f})"
@@ -4,4 +4,5 @@ from .models import Recipe
 class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
-        fields = ['id', 'title', 'subtitle', 'description', 'blog_content', 'difficulty', 'season',  'keywords',  'ingredients', 'instructions', 'image_url', 'created_at', 'updated_at']
+        fields = ['id', 'title', 'subtitle', 'description', 'blog_content', 'difficulty', 'season',  'keywords',  'ingredients', 'instructions', 'image_url',
+                  'course', 'cuisine', 'cooking_methods', 'recipe_keys', 'created_at', 'updated_at']
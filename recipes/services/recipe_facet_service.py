@@ -0,0 +1,87 @@
+from django.db import connection, transaction
+from django.db.models import QuerySet
+import logging
+from typing import Dict, List
+
+from recipes.models import Recipe, RecipeFacetCount
+
+logger = logging.getLogger(__name__)
+
+# Facets with one value per recipe, and facets whose recipes can have several values
+VALUE_FACETS = ('difficulty', 'season', 'course', 'cuisine')
+ARRAY_FACETS = ('cooking_methods', 'recipe_keys')
+FACETS = VALUE_FACETS + ARRAY_FACETS
+
+FacetCounts = Dict[str, List[Dict[str, object]]]
+
+
+def _as_facets(rows) -> FacetCounts:
+    """(facet, value, count) rows, as value/count lists per facet, most frequent first."""
+    facets = {facet: [] for facet in FACETS}
+    for facet, value, count in sorted(rows, key=lambda row: (row[0], -row[2], row[1])):
+        facets[facet].append({'value': value, 'count': count})
+    return facets
+
+
+def facet_counts() -> FacetCounts:
+    """Recipes per facet value over the whole catalogue, read from the trigger-maintained counters."""
+    rows = RecipeFacetCount.objects.filter(count__gt=0).values_list('facet', 'value', 'count')
+    return _as_facets(rows)
+
+
+def filtered_facet_counts(recipes: QuerySet) -> FacetCounts:
+    """
+    Recipes per facet value within a filtered queryset, in one query. The filters narrow the
+    recipes through their indexes first, so the cost grows with the selection, not the catalogue.
+    """
+    sql, params = recipes.order_by().values('id', *FACETS).query.sql_with_params()
+    value_counts = ' UNION ALL '.join(
+        f"SELECT '{facet}', {facet}, count(*) FROM filtered "
+        f"WHERE {facet} IS NOT NULL AND {facet} <> '' GROUP BY {facet}"
+        for facet in VALUE_FACETS
+    )
+    # DISTINCT so a value repeated within one recipe counts once, as in the counters
+    array_counts = ' UNION ALL '.join(
+        f"SELECT '{facet}', value, count(*) FROM filtered "
+        f"CROSS JOIN LATERAL (SELECT DISTINCT unnest({facet}) AS value) AS element "
+        f"WHERE value <> '' GROUP BY value"
+        for facet in ARRAY_FACETS
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"WITH filtered AS MATERIALIZED ({sql}) {value_counts} UNION ALL {array_counts}", params)
+        return _as_facets(cursor.fetchall())
+
+
+def rebuild_facet_counts() -> int:
+    """
+    Recount every facet from the recipe table, e.g. after a TRUNCATE or a bulk load with
+    triggers disabled. Returns the number of counter rows.
+    """
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Writes to recipes wait until the recount is committed instead of being lost in it
+            cursor.execute(f"LOCK TABLE {Recipe._meta.db_table} IN SHARE MODE")
+            cursor.execute(f"DELETE FROM {RecipeFacetCount._meta.db_table}")
+            cursor.execute(
+                f"""
+                INSERT INTO {RecipeFacetCount._meta.db_table} (facet, value, count)
+                SELECT facet, value, count(*)
+                FROM {Recipe._meta.db_table} AS recipe
+                CROSS JOIN LATERAL (
+                    SELECT 'difficulty' AS facet, recipe.difficulty AS value
+                    UNION SELECT 'season', recipe.season
+                    UNION SELECT 'course', recipe.course
+                    UNION SELECT 'cuisine', recipe.cuisine
+                    UNION SELECT 'cooking_methods', unnest(recipe.cooking_methods)
+                    UNION SELECT 'recipe_keys', unnest(recipe.recipe_keys)
+                ) AS facet
+                WHERE value IS NOT NULL AND value <> ''
+                GROUP BY facet, value
+                """
+            )
+            rows = cursor.rowcount
+        logger.info("Rebuilt %s recipe facet counters", rows)
+        return rows
+    except Exception as e:
+        logger.error("Error rebuilding recipe facet counters: %s", e)
+        raise
@@ -7,12 +7,18 @@ from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 
+from ai_cooking_project.metrics import stage
 from documents_processor.services.openai_service import OpenAIService
+from documents_processor.services.usage_service import attribute_usage, current_attribution
 from documents_processor.services.vector_service import VectorService
 from recipes.models import Recipe
 from recipes.services.recipe_search_service import RecipeSearchService
+from recipes.services.related_recipe_service import RelatedRecipeService
 from recipes.models.chat_models import ChatRequest, Message
 
+# Width of the cooking_methods and recipe_keys entries
+FACET_MAX_LENGTH = Recipe._meta.get_field('recipe_keys').base_field.max_length
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,54 +29,68 @@ class RecipeGeneratorService:
         self.openai_service = OpenAIService()
         self.vector_service = VectorService(self.openai_service)
         self.search_service = RecipeSearchService()
+        self.related_service = RelatedRecipeService(self.openai_service)
 
-    def generate_recipe(self, query: str, num_examples: int = 3) -> Dict[str, Any]:
+    def generate_recipe(self, query: str, num_examples: int = 3,
+                        mmr_lambda: float = settings.SEARCH_MMR_LAMBDA) -> Dict[str, Any]:
         """
         Generate a new recipe based on similar existing recipes.
 
         Args:
             query: The recipe name or description to generate
             num_examples: Number of similar recipes to use as examples
+            mmr_lambda: Lambda of the maximal marginal relevance picking the examples,
+                so they are not near-copies of each other; None for the most similar ones
 
         Returns:
             Dictionary containing the generated recipe
         """
+        with stage("generate", "total"), attribute_usage("generate"):
+            return self._generate_recipe(query, num_examples, mmr_lambda)
+
+    def _generate_recipe(self, query: str, num_examples: int, mmr_lambda: float) -> Dict[str, Any]:
         try:
             logger.info(
-                f"Starting recipe generation for query: '{query}' with {num_examples} examples"
+                "Starting recipe generation for query: '%s' with %s examples",
+                query,
+                num_examples,
             )
 
             # Step 1: Find similar recipes to use as examples
-            logger.info(f"Step 1: Searching for similar recipes using semantic search")
-            similar_recipes = self.search_service.search_recipes_by_semantic(
-                query, limit=num_examples
-            )
-            logger.info(f"Found {len(similar_recipes)} similar recipes")
-
-            # Log titles and similarity scores of found recipes
-            for i, recipe in enumerate(similar_recipes, 1):
-                logger.info(
-                    f"Similar recipe {i}: '{recipe.get('document_title', 'Unknown')}' (similarity: {recipe.get('vector_similarity', 0):.4f})"
+            logger.debug("Step 1: Searching for similar recipes using semantic search")
+            with stage("generate", "search"):
+                similar_recipes = self.search_service.search_recipes_by_semantic(
+                    query, limit=num_examples, mmr_lambda=mmr_lambda
                 )
+            # One record with the titles and similarity scores of all found recipes
+            logger.info(
+                "Found %s similar recipes: %s",
+                len(similar_recipes),
+                "; ".join(
+                    f"'{recipe.get('document_title', 'Unknown')}' ({recipe.get('combined_score', 0):.4f})"
+                    for recipe in similar_recipes
+                ),
+            )
 
             # Step 2: Format similar recipes as context for the LLM
-            logger.info(f"Step 2: Formatting recipes for context")
+            logger.debug("Step 2: Formatting recipes for context")
             recipes_context = self._format_recipes_for_context(similar_recipes)
-            logger.debug(f"Recipe context length: {len(recipes_context)} characters")
+            logger.debug("Recipe context length: %s characters", len(recipes_context))
 
             # Step 3: Create a system prompt and user prompt
-            logger.info(f"Step 3: Creating system and user prompts")
+            logger.debug("Step 3: Creating system and user prompts")
             # system_prompt = self._create_system_prompt(recipes_context)
             # system_prompt = self._create_system_prompt_v2(recipes_context)
             system_prompt = self._create_system_prompt_v3(recipes_context)
             # user_prompt = self._create_user_prompt(query)
             # user_prompt = self._create_user_prompt_v2(query)
             user_prompt = self._create_user_prompt_v3(query)
-            logger.debug(f"System prompt length: {len(system_prompt)} characters")
-            logger.debug(f"User prompt: {user_prompt}")
+            logger.debug("System prompt length: %s characters", len(system_prompt))
+            # Prompts and model output contain whole recipes, only their sizes are logged
+            logger.debug("User prompt length: %s characters", len(user_prompt))
 
             # Step 4: Call LLM to generate new recipe (synchronously)
-            logger.info(f"Step 4: Calling LLM to generate recipe with model: gpt-4o")
+            logger.debug("Step 4: Calling LLM to generate recipe with model: gpt-4o")
 
             chat_request = ChatRequest(
                 messages=[
@@ -83,38 +103,39 @@ class RecipeGeneratorService:
             )
 
             # Use the synchronous method
-            logger.info(f"Sending request to OpenAI API")
-            response = self.openai_service.create_completion(chat_request)
+            logger.debug("Sending request to OpenAI API")
+            with stage("generate", "completion"):
+                response = self.openai_service.create_completion(chat_request)
 
             # Step 5: Parse and structure the response
-            logger.info(f"Step 5: Parsing LLM response")
+            logger.debug("Step 5: Parsing LLM response")
             content = (
                 response.content if hasattr(response, "content") else str(response)
             )
-            logger.debug(
-                f"Raw LLM response: {content[:500]}..."
-                if len(content) > 500
-                else content
-            )
+            logger.debug("LLM response length: %s characters", len(content))
 
             # Step 6: Save the generated recipe to the database
-            logger.info(f"Step 6: Saving generated recipe to database")
-            new_recipe = self._save_recipe_to_database(query, content)
+            logger.debug("Step 6: Saving generated recipe to database")
+            with stage("generate", "save"):
+                new_recipe = self._save_recipe_to_database(query, content)
             logger.info(
-                f"Recipe saved with ID: {new_recipe.id}, title: '{new_recipe.title}'"
+                "Recipe saved with ID: %s, title: '%s'", new_recipe.id, new_recipe.title
             )
+            # The search and completion calls made so far are accounted to the new recipe too
+            current_attribution().set_recipe(new_recipe.id)
 
             # Step 6.5: Generate an image for the recipe
-            logger.info(f"Step 6.5: Generating image for recipe")
-            image_url = self._generate_recipe_image(new_recipe)
-            logger.info(f"Image generated for recipe: {image_url}")
+            logger.debug("Step 6.5: Generating image for recipe")
+            with stage("generate", "image"):
+                image_url = self._generate_recipe_image(new_recipe)
+            logger.info("Image generated for recipe: %s", image_url)
 
             # If you have image_url field in your model:
             new_recipe.image_url = image_url
             new_recipe.save()
 
             # Step 7: Return formatted result with image
-            logger.info(f"Step 7: Generation complete, returning recipe data")
+            logger.debug("Step 7: Generation complete, returning recipe data")
             return {
                 "status": "success",
                 "recipe": {
@@ -140,12 +161,12 @@ class RecipeGeneratorService:
             }
 
         except Exception as e:
-            logger.error(f"Error generating recipe: {e}", exc_info=True)
+            logger.error("Error generating recipe: %s", e, exc_info=True)
             raise
 
     def _format_recipes_for_context(self, recipes: list) -> str:
         """Format a list of recipes into a context string for the LLM."""
-        logger.info(f"Formatting {len(recipes)} recipes for context")
+        logger.debug("Formatting %s recipes for context", len(recipes))
         context = "Here are some similar recipes to use as reference:\n\n"
 
         for i, recipe in enumerate(recipes, 1):
@@ -158,18 +179,16 @@ class RecipeGeneratorService:
                 else recipe.get("content", "")
             )
             context += f"Content: {recipe.get('content', '')}\n\n"
-            logger.debug(
-                f"Added recipe '{title}' to context (content length: {len(recipe.get('content', ''))} chars)"
-            )
 
-        logger.info(
-            f"Context preparation complete, total context size: {len(context)} characters"
+        logger.debug(
+            "Context preparation complete, total context size: %s characters",
+            len(context),
         )
         return context
 
     def _create_system_prompt(self, recipes_context: str) -> str:
         """Create a system prompt with instructions and recipe examples."""
-        logger.info(f"Creating system prompt with recipes context")
+        logger.debug("Creating system prompt with recipes context")
         prompt = f"""Jesteś profesjonalnym szefem kuchni i twórcą przepisów. Twoim zadaniem jest stworzenie nowego przepisu WYŁĄCZNIE na podstawie dostarczonych przykładów.
 
 WAŻNE ZASADY:
@@ -201,7 +220,7 @@ Sformatuj odpowiedź jako obiekt JSON z następującymi polami:
 
 Bądź precyzyjny i upewnij się, że przepis jest praktyczny i może być łatwo wykonany przez domowych kucharzy. Cały przepis MUSI być w języku polskim.
 """
-        logger.debug(f"System prompt created with length {len(prompt)} characters")
+        logger.debug("System prompt created with length %s characters", len(prompt))
         return prompt
 
     def _create_system_prompt_v2(self, recipes_context: str) -> str:
@@ -249,7 +268,7 @@ Bądź precyzyjny i upewnij się, że przepis jest praktyczny i może być łatw
         ```
         Nie wolno ci użyć niczego, czego nie znajdziesz w podanych przykładach.
         """
-        logger.debug(f"System prompt V2 created with length {len(prompt)} characters")
+        logger.debug("System prompt V2 created with length %s characters", len(prompt))
         return prompt
 
     def _create_system_prompt_v3(self, recipes_context: str) -> str:
@@ -316,18 +335,18 @@ Bądź precyzyjny i upewnij się, że przepis jest praktyczny i może być łatw
         ```
         Nie wolno ci użyć niczego, czego nie znajdziesz w podanych przykładach.
         """
-        logger.debug(f"System prompt V3 created with length {len(prompt)} characters")
+        logger.debug("System prompt V3 created with length %s characters", len(prompt))
         return prompt
 
     def _create_user_prompt(self, query: str) -> str:
         """Create a user prompt based on the query."""
-        logger.info(f"Creating user prompt for query: '{query}'")
+        logger.debug("Creating user prompt for query: '%s'", query)
         prompt = f"""Stwórz nowy przepis dla "{query}" WYŁĄCZNIE na podstawie podanych przykładów. 
         
 NIE dodawaj żadnych składników ani technik, których nie ma w przykładach.
 Odpowiedź powinna być W CAŁOŚCI PO POLSKU i zawierać wszystkie wymagane sekcje w formacie JSON.
 Upewnij się, że przepis jest praktyczny i bazuje tylko na informacjach z przykładowych przepisów."""
-        logger.debug(f"User prompt created: {prompt}")
+        logger.debug("User prompt created with length %s characters", len(prompt))
         return prompt
 
     def _create_user_prompt_v2(self, query: str) -> str:
@@ -357,29 +376,40 @@ Upewnij się, że przepis jest praktyczny i bazuje tylko na informacjach z przyk
         """
         return prompt
 
+    @staticmethod
+    def _as_list(value, max_length: int = None) -> List[str]:
+        """
+        A list facet from the model's JSON; a single string becomes one entry. Entries are cut
+        to `max_length` characters, the width of the facet's column.
+        """
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = [value]
+        return [str(item).strip()[:max_length] for item in value if item is not None and str(item).strip()]
+
     def _save_recipe_to_database(self, title: str, recipe_content: str) -> Recipe:
         """Save the generated recipe to the database."""
-        logger.info(f"Saving recipe to database with title: '{title}'")
+        logger.info("Saving recipe to database with title: '%s'", title)
         # Parse the JSON content if needed
         try:
             # Remove markdown code block markers if present
-            logger.debug(f"Processing raw recipe content ({len(recipe_content)} chars)")
+            logger.debug("Processing raw recipe content (%s chars)", len(recipe_content))
             cleaned_content = (
                 recipe_content.replace("```json", "").replace("```", "").strip()
             )
-            logger.debug(f"Cleaned content for JSON parsing")
+            logger.debug("Cleaned content for JSON parsing")
 
             try:
                 recipe_data = json.loads(cleaned_content)
-                logger.info(f"Successfully parsed JSON content")
+                logger.info("Successfully parsed JSON content")
 
                 # Log recipe structure
-                logger.debug(f"Recipe structure: title='{recipe_data.get('title')}'")
+                logger.debug("Recipe structure: title='%s'", recipe_data.get('title'))
                 logger.debug(
-                    f"Recipe has {len(recipe_data.get('ingredients', []))} ingredients"
-                )
-                logger.debug(
-                    f"Recipe has {len(recipe_data.get('instructions', []))} instruction steps"
+                    "Recipe has %s ingredients and %s instruction steps",
+                    len(recipe_data.get("ingredients", [])),
+                    len(recipe_data.get("instructions", [])),
                 )
 
                 # Create formatted content for instructions
@@ -409,7 +439,8 @@ Upewnij się, że przepis jest praktyczny i bazuje tylko na informacjach z przyk
                 )
 
                 logger.debug(
-                    f"Formatted instructions text created ({len(instructions_text)} chars)"
+                    "Formatted instructions text created (%s chars)",
+                    len(instructions_text),
                 )
 
                 new_recipe = Recipe.objects.create(
@@ -420,24 +451,18 @@ Upewnij się, że przepis jest praktyczny i bazuje tylko na informacjach z przyk
                     season=recipe_data.get("season", "all_year"),
                     instructions=instructions_text,
                     keywords=recipe_data.get("keywords", ""),
-                    ingredients=json.dumps(
-                        recipe_data.get("ingredients", []), ensure_ascii=False
-                    ),
+                    ingredients=self._as_list(recipe_data.get("ingredients")),
                     subtitle=recipe_data.get("subtitle", ""),
                     course=recipe_data.get("course", "Obiad"),
                     cuisine=recipe_data.get("cuisine", "Rodzaj kuchni"),
-                    cooking_methods=json.dumps(
-                        recipe_data.get("cooking_methods", []), ensure_ascii=False
-                    ),
-                    recipe_keys=json.dumps(
-                        recipe_data.get("recipe_keys", []), ensure_ascii=False
-                    ),
+                    cooking_methods=self._as_list(recipe_data.get("cooking_methods"), FACET_MAX_LENGTH),
+                    recipe_keys=self._as_list(recipe_data.get("recipe_keys"), FACET_MAX_LENGTH),
                 )
-                logger.info(f"Recipe created in database with ID: {new_recipe.id}")
+                logger.info("Recipe created in database with ID: %s", new_recipe.id)
 
             except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON content: {e}")
-                logger.debug(f"Problematic content: {cleaned_content[:500]}...")
+                logger.error("Failed to parse JSON content: %s", e)
+                logger.debug("Unparsable content length: %s characters", len(cleaned_content))
 
                 # Fallback if JSON parsing fails
                 new_recipe = Recipe.objects.create(
@@ -446,18 +471,25 @@ Upewnij się, że przepis jest praktyczny i bazuje tylko na informacjach z przyk
                     instructions=recipe_content,
                 )
                 logger.info(
-                    f"Created fallback recipe with raw content, ID: {new_recipe.id}"
+                    "Created fallback recipe with raw content, ID: %s", new_recipe.id
                 )
 
         except Exception as e:
-            logger.error(f"Unexpected error saving recipe: {e}", exc_info=True)
+            logger.error("Unexpected error saving recipe: %s", e, exc_info=True)
             # Last resort fallback
             new_recipe = Recipe.objects.create(
                 title=title,
                 description="Recipe generation encountered an error",
                 instructions="Error occurred during recipe generation and formatting.",
             )
-            logger.info(f"Created error fallback recipe, ID: {new_recipe.id}")
+            logger.info("Created error fallback recipe, ID: %s", new_recipe.id)
+
+        try:
+            with stage("generate", "related"):
+                self.related_service.add_recipe(new_recipe)
+        except Exception as e:
+            # The recipe is kept; `rebuild_related_recipes` links it later
+            logger.error("Recipe %s was not linked into the related-recipes graph: %s", new_recipe.id, e)
 
         return new_recipe
 
@@ -467,7 +499,7 @@ Upewnij się, że przepis jest praktyczny i bazuje tylko na informacjach z przyk
         download it, and save it locally.
         """
         try:
-            logger.info(f"Generating image for recipe: '{recipe.title}'")
+            logger.info("Generating image for recipe: '%s'", recipe.title)
 
             # Create a detailed prompt that describes the dish
             recipe_description = (
@@ -484,13 +516,15 @@ Upewnij się, że przepis jest praktyczny i bazuje tylko na informacjach z przyk
             """
 
             # 1. Generujemy tymczasowy URL z OpenAI
-            temp_image_url = self.openai_service.generate_image(
-                prompt=prompt, size="1024x1024", quality="standard", model="dall-e-3"
-            )
+            with stage("generate", "image_generation"):
+                temp_image_url = self.openai_service.generate_image(
+                    prompt=prompt, size="1024x1024", quality="standard", model="dall-e-3"
+                )
 
             # 2. Pobieramy fizyczny plik z OpenAI zanim link wygaśnie
-            logger.info(f"Downloading image from OpenAI: {temp_image_url}")
-            response = requests.get(temp_image_url)
+            logger.info("Downloading image from OpenAI: %s", temp_image_url)
+            with stage("generate", "image_download"):
+                response = requests.get(temp_image_url)
 
             if response.status_code == 200:
                 # 3. Tworzymy unikalną nazwę pliku
@@ -498,24 +532,26 @@ Upewnij się, że przepis jest praktyczny i bazuje tylko na informacjach z przyk
                 filename = f"recipes/{recipe.id}_{uuid.uuid4().hex[:8]}.{file_ext}"
 
                 # 4. Zapisujemy plik w MEDIA_ROOT
-                saved_path = default_storage.save(
-                    filename, ContentFile(response.content)
-                )
+                with stage("generate", "image_save"):
+                    saved_path = default_storage.save(
+                        filename, ContentFile(response.content)
+                    )
 
                 # 5. Tworzymy trwały, lokalny URL
                 # Zakładamy, że WordPress widzi Django pod localhost:8000
                 local_url = f"http://localhost:8000{settings.MEDIA_URL}{saved_path}"
 
-                logger.info(f"Image saved locally at: {saved_path}")
-                logger.info(f"Permanent local URL: {local_url}")
+                logger.info("Image saved locally at: %s", saved_path)
+                logger.info("Permanent local URL: %s", local_url)
 
                 return local_url
             else:
                 logger.error(
-                    f"Failed to download image from OpenAI. Status: {response.status_code}"
+                    "Failed to download image from OpenAI. Status: %s",
+                    response.status_code,
                 )
                 return "https://placeholder.com/food-placeholder-image"
 
         except Exception as e:
-            logger.error(f"Error generating image for recipe: {e}", exc_info=True)
+            logger.error("Error generating image for recipe: %s", e, exc_info=True)
             return "https://placeholder.com/food-placeholder-image"
@@ -1,7 +1,8 @@
 import logging
 from typing import List, Dict, Any
 from documents_processor.services.openai_service import OpenAIService
-from documents_processor.services.vector_service import VectorService
+from documents_processor.services.usage_service import attribute_usage
+from documents_processor.services.vector_service import SEARCHABLE_STATUSES, ChunkFilter, VectorService
 from documents_processor.models import DocumentChunk, StoredDocument
 
 logger = logging.getLogger(__name__)
@@ -11,20 +12,30 @@ class RecipeSearchService:
         self.openai_service = OpenAIService()
         self.vector_service = VectorService(self.openai_service)
     
-    def search_recipes_by_semantic(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def search_recipes_by_semantic(self, query: str, limit: int = 5,
+                                   filters: ChunkFilter = None, mmr_lambda: float = None) -> List[Dict[str, Any]]:
         """
         Search for recipes semantically similar to the query text
         
         Args:
             query: The search query (meal name or description)
             limit: Maximum number of results to return
+            filters: Documents, statuses and creation range to search; by default
+                chunks of all processed documents
+            mmr_lambda: Diversify the results by maximal marginal relevance with this
+                lambda (1 ranks by relevance alone); by default they are not diversified
             
         Returns:
             List of matching document chunks with similarity scores
         """
         try:
             # Use the improved vector service that returns chunks with scores
-            results = self.vector_service.search_similar(query, limit=limit)
+            with attribute_usage("search"):
+                results = self.vector_service.search_similar(
+                    query, limit=limit,
+                    filters=ChunkFilter(statuses=SEARCHABLE_STATUSES) if filters is None else filters,
+                    mmr_lambda=mmr_lambda
+                )
             return results
             
         except Exception as e:
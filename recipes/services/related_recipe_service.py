@@ -0,0 +1,229 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+
+from documents_processor.services.embedding_providers import STORAGE_DIMENSIONS, get_embedding_provider
+from recipes.models import Recipe, RecipeEmbedding, RelatedRecipe
+
+logger = logging.getLogger(__name__)
+
+# Serializes graph updates, so that recipes saved at the same time see each other's embeddings
+GRAPH_LOCK_KEY = 'recipes.related_recipes'
+# Rows of the similarity matrix computed at once by a full rebuild
+REBUILD_BLOCK_ROWS = 1024
+EMBED_BATCH_SIZE = 100
+
+EMBEDDING_TABLE = RecipeEmbedding._meta.db_table
+EDGE_TABLE = RelatedRecipe._meta.db_table
+
+# The new recipe's neighbours are the most similar recipes embedded by the same provider. It
+# becomes a neighbour itself of every recipe it is more similar to than that recipe's current
+# k-th neighbour (or of recipes with fewer than k). Recipes that were linked to an earlier
+# version of it are refilled by REFILL_EDGES, so the graph stays an exact k-NN graph.
+LINK_RECIPE = f"""
+    WITH candidate AS MATERIALIZED (
+        SELECT other.recipe_id,
+               1 - (other.embedding <=> (SELECT embedding FROM {EMBEDDING_TABLE} WHERE recipe_id = %(recipe_id)s))
+                   AS similarity
+        FROM {EMBEDDING_TABLE} AS other
+        WHERE other.embedding_provider = %(provider)s AND other.recipe_id <> %(recipe_id)s
+    ),
+    own AS (
+        INSERT INTO {EDGE_TABLE} (recipe_id, related_id, similarity)
+        SELECT %(recipe_id)s, recipe_id, similarity FROM candidate
+        ORDER BY similarity DESC, recipe_id
+        LIMIT %(k)s
+        RETURNING related_id
+    ),
+    reverse AS (
+        INSERT INTO {EDGE_TABLE} (recipe_id, related_id, similarity)
+        SELECT candidate.recipe_id, %(recipe_id)s, candidate.similarity FROM candidate
+        WHERE candidate.similarity > coalesce((
+            SELECT edge.similarity FROM {EDGE_TABLE} AS edge
+            WHERE edge.recipe_id = candidate.recipe_id
+            ORDER BY edge.similarity DESC
+            OFFSET %(k)s - 1 LIMIT 1
+        ), -2)
+        ON CONFLICT (recipe_id, related_id) DO UPDATE SET similarity = EXCLUDED.similarity
+        RETURNING recipe_id
+    )
+    SELECT (SELECT count(*) FROM own), array(SELECT recipe_id FROM reverse)
+"""
+
+# Links the given recipes to their k most similar recipes, by one nearest-neighbour scan each
+REFILL_EDGES = f"""
+    INSERT INTO {EDGE_TABLE} (recipe_id, related_id, similarity)
+    SELECT source.recipe_id, nearest.recipe_id, nearest.similarity
+    FROM {EMBEDDING_TABLE} AS source
+    CROSS JOIN LATERAL (
+        SELECT other.recipe_id, 1 - (other.embedding <=> source.embedding) AS similarity
+        FROM {EMBEDDING_TABLE} AS other
+        WHERE other.embedding_provider = %(provider)s AND other.recipe_id <> source.recipe_id
+        ORDER BY other.embedding <=> source.embedding, other.recipe_id
+        LIMIT %(k)s
+    ) AS nearest
+    WHERE source.recipe_id = ANY(%(recipe_ids)s) AND source.embedding_provider = %(provider)s
+    ON CONFLICT (recipe_id, related_id) DO NOTHING
+"""
+
+# Drops the edges beyond the k most similar of the given recipes
+TRIM_EDGES = f"""
+    DELETE FROM {EDGE_TABLE} WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (PARTITION BY recipe_id ORDER BY similarity DESC, related_id) AS position
+            FROM {EDGE_TABLE} WHERE recipe_id = ANY(%s)
+        ) AS ranked
+        WHERE position > %s
+    )
+"""
+
+
+def recipe_text(recipe: Recipe) -> str:
+    """The text a recipe is embedded by: what it is, what goes into it and how it is tagged."""
+    parts = [recipe.title, recipe.subtitle, recipe.description, ', '.join(recipe.ingredients),
+             ', '.join(recipe.cooking_methods), ', '.join(recipe.recipe_keys), recipe.course, recipe.cuisine]
+    return '\n'.join(part for part in parts if part)
+
+
+def related_recipes(recipe_id: int, limit: int = None) -> List[Dict[str, Any]]:
+    """
+    The precomputed related recipes of a recipe, most similar first. One query: a range scan of
+    the (recipe, -similarity) index joined to the related recipes by primary key.
+    """
+    limit = max(1, min(limit or settings.RELATED_RECIPES_PER_RECIPE, settings.RELATED_RECIPES_PER_RECIPE))
+    edges = (
+        RelatedRecipe.objects.filter(recipe_id=recipe_id)
+        .order_by('-similarity')
+        .values_list('related_id', 'related__title', 'related__subtitle', 'related__image_url', 'similarity')
+    )[:limit]
+    return [
+        {'id': related_id, 'title': title, 'subtitle': subtitle, 'image_url': image_url, 'similarity': similarity}
+        for related_id, title, subtitle, image_url, similarity in edges
+    ]
+
+
+class RelatedRecipeService:
+    """
+    Maintains the related-recipes graph: every recipe linked to the RELATED_RECIPES_PER_RECIPE
+    recipes with the most similar embeddings. New recipes are linked in as they are saved, so
+    serving related recipes needs neither an embedding call nor a vector search.
+    """
+
+    def __init__(self, openai_service=None, per_recipe: int = None):
+        self.provider = get_embedding_provider(openai_service)
+        self.per_recipe = per_recipe or settings.RELATED_RECIPES_PER_RECIPE
+
+    def add_recipe(self, recipe: Recipe) -> int:
+        """
+        Embed a recipe and link it into the graph, replacing its previous links. Recipes that
+        were linked to it before are linked again to their nearest recipes, as it may have moved
+        away from them. Returns the number of recipes whose neighbours now include it.
+        """
+        try:
+            vector = self.provider.embed_for_storage([recipe_text(recipe)])[0]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [GRAPH_LOCK_KEY])
+                RecipeEmbedding.objects.update_or_create(
+                    recipe=recipe, defaults={'embedding': vector, 'embedding_provider': self.provider.name}
+                )
+                RelatedRecipe.objects.filter(recipe=recipe).delete()
+                # Only a recipe saved again has incoming edges, computed from its old embedding
+                relinked = list(RelatedRecipe.objects.filter(related=recipe).values_list('recipe_id', flat=True))
+                RelatedRecipe.objects.filter(recipe_id__in=relinked).delete()
+                cursor.execute(LINK_RECIPE, {
+                    'recipe_id': recipe.id, 'provider': self.provider.name, 'k': self.per_recipe,
+                })
+                neighbours, linked_from = cursor.fetchone()
+                if relinked:
+                    cursor.execute(REFILL_EDGES, {
+                        'recipe_ids': relinked, 'provider': self.provider.name, 'k': self.per_recipe,
+                    })
+                if linked_from or relinked:
+                    cursor.execute(TRIM_EDGES, [list(set(linked_from) | set(relinked)), self.per_recipe])
+            logger.info(
+                "Linked recipe %s to %s related recipes, and from %s", recipe.id, neighbours, len(linked_from)
+            )
+            return len(linked_from)
+        except Exception as e:
+            logger.error(f"Error linking recipe {recipe.id} into the related-recipes graph: {e}")
+            raise
+
+    def rebuild(self) -> Dict[str, int]:
+        """
+        Embed the recipes without an up-to-date embedding of the current provider, then recompute
+        the whole graph: the similarity matrix of all recipes is computed in NumPy, one block of rows at a
+        time, and the edges are replaced in one transaction.
+        """
+        try:
+            embedded = self._embed_stale()
+            recipe_ids, vectors = self._load_embeddings()
+            edges = []
+            for start in range(0, len(recipe_ids), REBUILD_BLOCK_ROWS):
+                edges.extend(self._nearest(recipe_ids, vectors, start))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [GRAPH_LOCK_KEY])
+                RelatedRecipe.objects.all().delete()
+                RelatedRecipe.objects.bulk_create(edges, batch_size=5000)
+            logger.info("Rebuilt the related-recipes graph: %s recipes, %s edges", len(recipe_ids), len(edges))
+            return {'embedded': embedded, 'recipes': len(recipe_ids), 'edges': len(edges)}
+        except Exception as e:
+            logger.error(f"Error rebuilding the related-recipes graph: {e}")
+            raise
+
+    def _embed_stale(self) -> int:
+        """Embed the recipes not embedded by the current provider, or edited since they were."""
+        current = RecipeEmbedding.objects.filter(
+            embedding_provider=self.provider.name, updated_at__gte=F('recipe__updated_at')
+        )
+        recipes = list(Recipe.objects.exclude(id__in=current.values('recipe_id')).order_by('id'))
+        for start in range(0, len(recipes), EMBED_BATCH_SIZE):
+            batch = recipes[start:start + EMBED_BATCH_SIZE]
+            vectors = self.provider.embed_for_storage([recipe_text(recipe) for recipe in batch])
+            RecipeEmbedding.objects.bulk_create(
+                [RecipeEmbedding(recipe=recipe, embedding=vector, embedding_provider=self.provider.name)
+                 for recipe, vector in zip(batch, vectors)],
+                update_conflicts=True, unique_fields=['recipe'],
+                update_fields=['embedding', 'embedding_provider', 'updated_at'],
+            )
+        return len(recipes)
+
+    def _load_embeddings(self):
+        """Ids and unit-length embedding matrix of the recipes embedded by the current provider."""
+        # pgvector's binary form (dimensions, unused, big-endian float32 values) is decoded
+        # without parsing text
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT recipe_id, vector_send(embedding) FROM {EMBEDDING_TABLE} "
+                f"WHERE embedding_provider = %s ORDER BY recipe_id",
+                [self.provider.name]
+            )
+            rows = cursor.fetchall()
+        recipe_ids = np.array([recipe_id for recipe_id, _ in rows], dtype=np.int64)
+        vectors = np.empty((len(rows), STORAGE_DIMENSIONS), dtype=np.float32)
+        for row, (_, value) in enumerate(rows):
+            vectors[row] = np.frombuffer(value, dtype='>f4', offset=4)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return recipe_ids, vectors / np.where(norms == 0, 1, norms)
+
+    def _nearest(self, recipe_ids: np.ndarray, vectors: np.ndarray, start: int) -> List[RelatedRecipe]:
+        """Edges to the k most similar other recipes of the rows in the block starting at `start`."""
+        block = vectors[start:start + REBUILD_BLOCK_ROWS]
+        similarity = block @ vectors.T
+        rows = np.arange(len(block))
+        similarity[rows, start + rows] = -np.inf
+        k = min(self.per_recipe, len(recipe_ids) - 1)
+        if k <= 0:
+            return []
+        nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        edges = []
+        for row, columns in enumerate(nearest):
+            for column in columns:
+                edges.append(RelatedRecipe(
+                    recipe_id=int(recipe_ids[start + row]), related_id=int(recipe_ids[column]),
+                    similarity=float(similarity[row, column]),
+                ))
+        return edges
@@ -0,0 +1,228 @@
+"""
+Search-as-you-type suggestions from an in-process prefix index.
+
+The index holds the titles of recipes and the recipe headings of searchable document chunks. The
+start of a title and every later word of at least three letters begin one key: the folded
+text from there on ("pierogi ruskie", "ruskie"), so typing any word of a title finds it.
+Keys are folded to lowercase ASCII (Żurek -> zurek, łazanki -> lazanki), which lets users
+type without Polish characters.
+Keys are kept in one sorted list: the keys starting with a prefix are a contiguous range
+found by binary search, and the best ranked of them come from an argpartition over the
+range's precomputed ranks, so a lookup takes microseconds even for one-letter prefixes.
+
+The index is built when the server starts (wsgi.py, asgi.py) and rebuilt by a background
+thread, woken by saved or deleted recipes and documents. Writes from other processes are
+noticed within SUGGEST_REFRESH_SECONDS.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from bisect import bisect_left
+import logging
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ai_cooking_project.metrics import stage
+from documents_processor.models import DocumentChunk, StoredDocument
+from recipes.models import Recipe
+from recipes.services.recipe_search_service import SEARCHABLE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Keys are cut to this many characters; longer prefixes are matched on their start
+KEY_LENGTH = 32
+# Shorter words (z, w, i, na) start no key of their own; titles still match from their start
+MIN_WORD_LENGTH = 3
+MAX_SUGGESTIONS = 50
+KINDS = ('recipe', 'heading')
+
+NON_WORD = re.compile(r"[^0-9a-z]+")
+WORD = re.compile(r"(?<= )[0-9a-z]+")
+
+
+def fold(text: str) -> str:
+    """Lowercase ASCII words separated by single spaces: 'Żurek  na zakwasie!' -> 'zurek na zakwasie'."""
+    text = unicodedata.normalize("NFKD", text.casefold().replace("ł", "l"))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return NON_WORD.sub(" ", text).strip()
+
+
+class _PackedKeys:
+    """Sorted ASCII keys packed into one bytes object, as a sequence `bisect` can search."""
+
+    def __init__(self, keys: List[str]):
+        encoded = [key.encode('ascii') for key in keys]
+        self.data = b''.join(encoded)
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(key) for key in encoded], out=self.offsets[1:])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> bytes:
+        return self.data[self.offsets[position]:self.offsets[position + 1]]
+
+
+class SuggestIndex:
+    """
+    An immutable prefix index over suggestions, given as (text, kind, recipe_id, chunks) tuples.
+
+    Suggestions whose text starts with the prefix come before those matching a later word.
+    Then recipes come before chunk headings, headings shared by more chunks come first, and
+    shorter texts before longer ones. Of suggestions that fold to the same text (a recipe and
+    the heading it was generated from, "Zurek" and "Żurek") only the best ranked is kept.
+    """
+
+    def __init__(self, entries: List[Tuple[str, str, Optional[int], int]]):
+        self.entries = []
+        keys = []
+        seen = set()
+        for entry in sorted(entries, key=lambda entry: (KINDS.index(entry[1]), -entry[3], len(entry[0]), entry[0])):
+            folded = fold(entry[0])
+            if not folded or folded in seen:
+                continue
+            seen.add(folded)
+            entry_rank = len(self.entries)
+            self.entries.append(entry)
+            starts = [0] + [match.start() for match in WORD.finditer(folded) if len(match.group()) >= MIN_WORD_LENGTH]
+            for start in starts:
+                keys.append((folded[start:start + KEY_LENGTH], entry_rank, start > 0))
+        keys.sort()
+        # Rank of a key: any match of the title start outranks any later-word match
+        self.key_ranks = np.array(
+            [entry_rank + (len(self.entries) if later else 0) for _, entry_rank, later in keys], dtype=np.int64
+        )
+        self.key_entries = np.array([entry_rank for _, entry_rank, _ in keys], dtype=np.int64)
+        self.keys = _PackedKeys([key for key, _, _ in keys])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def complete(self, prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """The `limit` best suggestions with a word starting with `prefix`."""
+        key = fold(prefix)[:KEY_LENGTH].encode('ascii')
+        if not key or limit <= 0:
+            return []
+        low = bisect_left(self.keys, key)
+        high = bisect_left(self.keys, key + b"\x7f", low)
+        ranks = self.key_ranks[low:high]
+
+        # Several words of one suggestion can match, so more keys than suggestions are taken
+        take = limit * 2
+        while True:
+            if take < len(ranks):
+                candidates = np.argpartition(ranks, take)[:take]
+            else:
+                candidates = np.arange(len(ranks))
+            candidates = candidates[np.argsort(ranks[candidates], kind='stable')]
+            entry_ranks = dict.fromkeys(self.key_entries[low + candidates].tolist())
+            if len(entry_ranks) >= limit or len(candidates) == len(ranks):
+                break
+            take *= 4
+        suggestions = []
+        for entry_rank in list(entry_ranks)[:limit]:
+            text, kind, recipe_id, chunks = self.entries[entry_rank]
+            suggestions.append({'text': text, 'kind': kind, 'recipe_id': recipe_id, 'chunks': chunks})
+        return suggestions
+
+
+def build_index() -> SuggestIndex:
+    """An index over all recipe titles and the recipe headings of searchable chunks."""
+    with stage('suggest', 'build'):
+        entries = [(title, 'recipe', recipe_id, 0) for recipe_id, title in Recipe.objects.values_list('id', 'title')]
+        # Chunks without a recipe title have an empty heading
+        headings = (
+            DocumentChunk.objects.filter(document__status__in=SEARCHABLE_STATUSES)
+            .exclude(heading='')
+            .values('heading')
+            .annotate(chunks=Count('id'))
+            .values_list('heading', 'chunks')
+        )
+        entries.extend((heading, 'heading', None, chunks) for heading, chunks in headings)
+        index = SuggestIndex(entries)
+    logger.info("Built the suggest index: %s suggestions, %s keys", len(index), len(index.keys))
+    return index
+
+
+def _watermark() -> tuple:
+    """Changes whenever a recipe or document is created, saved or deleted."""
+    recipes = Recipe.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    documents = StoredDocument.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return recipes['count'], recipes['updated'], documents['count'], documents['updated']
+
+
+class _Refresher:
+    """Background thread that rebuilds the index when the watermark of the tables changes."""
+
+    def __init__(self):
+        self.index = None
+        self.watermark = None
+        self.wake = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='suggest-index', daemon=True)
+                self.thread.start()
+
+    def current(self) -> SuggestIndex:
+        index = self.index
+        if index is None:
+            # Requested before the first build finished, or outside a server: build in the
+            # calling thread, and keep the index current from then on
+            with self.lock:
+                if self.index is None:
+                    self.watermark = _watermark()
+                    self.index = build_index()
+                index = self.index
+            self.start()
+        return index
+
+    def _run(self):
+        while True:
+            # Cleared before reading, so writes committed during a build trigger another one
+            self.wake.clear()
+            try:
+                watermark = _watermark()
+                if watermark != self.watermark or self.index is None:
+                    index = build_index()
+                    self.index, self.watermark = index, watermark
+            except Exception as e:
+                logger.error(f"Error refreshing the suggest index: {e}")
+            finally:
+                # The thread keeps no connection open between refreshes
+                connection.close()
+            self.wake.wait(settings.SUGGEST_REFRESH_SECONDS)
+
+    def after_fork(self):
+        # A forked worker inherits the index but not the thread
+        self.thread = None
+        self.lock = threading.Lock()
+        if self.index is not None:
+            self.start()
+
+
+_refresher = _Refresher()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_refresher.after_fork)
+
+
+def start_suggest_index():
+    """Build the index in the background and keep it current; called once the server starts."""
+    _refresher.start()
+
+
+def suggest(prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+    return _refresher.current().complete(prefix, min(limit, MAX_SUGGESTIONS))
+
+
+def schedule_refresh(sender=None, **kwargs):
+    """Signal receiver: rebuild the index once the current transaction commits."""
+    transaction.on_commit(_refresher.wake.set)
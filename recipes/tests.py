@@ -1,3 +1,247 @@
-from django.test import TestCase
+import importlib
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from documents_processor.models import StoredDocument
+from documents_processor.services.embedding_providers import HashingEmbeddingProvider
+from documents_processor.services.vector_service import VectorService
+from .models import Recipe, RecipeFacetCount, RelatedRecipe
+from .services.recipe_facet_service import facet_counts, filtered_facet_counts, rebuild_facet_counts
+from .services.related_recipe_service import RelatedRecipeService
+from .services.suggest_service import KEY_LENGTH, SuggestIndex, build_index, fold
+
+facet_arrays = importlib.import_module("recipes.migrations.0006_recipe_facet_arrays")
+
+DISHES = [
+    ("Pierogi ruskie", "Ziemniaki, twaróg i cebula w cieście"),
+    ("Pierogi z mięsem", "Mięso mielone i cebula w cieście"),
+    ("Zupa pomidorowa", "Pomidory, bulion i ryż"),
+    ("Zupa ogórkowa", "Ogórki kiszone, bulion i ziemniaki"),
+    ("Sernik", "Twaróg, jajka i cukier"),
+    ("Szarlotka", "Jabłka, cukier i kruche ciasto"),
+]
+
+
+class RelatedRecipeGraphTests(TestCase):
+    def setUp(self):
+        self.service = RelatedRecipeService(openai_service=mock.Mock(), per_recipe=2)
+        self.service.provider = HashingEmbeddingProvider(256)
+        self.recipes = [
+            Recipe.objects.create(title=title, description=description, instructions="")
+            for title, description in DISHES
+        ]
+
+    @staticmethod
+    def edges():
+        return set(RelatedRecipe.objects.values_list('recipe_id', 'related_id'))
+
+    def test_linked_recipes_form_the_rebuilt_graph(self):
+        for recipe in self.recipes:
+            self.service.add_recipe(recipe)
+        linked = self.edges()
+
+        self.service.rebuild()
+
+        self.assertEqual(len(linked), len(self.recipes) * 2)
+        self.assertEqual(linked, self.edges())
+
+    def test_edited_recipe_is_unlinked_from_its_old_neighbours(self):
+        for recipe in self.recipes:
+            self.service.add_recipe(recipe)
+        sernik = self.recipes[4]
+        sernik.title, sernik.description = "Pierogi leniwe", "Twaróg, mąka i ziemniaki w cieście"
+        sernik.save()
+
+        self.service.add_recipe(sernik)
+        linked = self.edges()
+        self.service.rebuild()
+
+        self.assertEqual(linked, self.edges())
+
+    def test_rebuild_embeds_new_and_edited_recipes_only(self):
+        self.assertEqual(self.service.rebuild()['embedded'], len(self.recipes))
+        self.assertEqual(self.service.rebuild()['embedded'], 0)
+
+        self.recipes[0].description = "Ziemniaki, twaróg, cebula i pieprz"
+        self.recipes[0].save()
+
+        self.assertEqual(self.service.rebuild()['embedded'], 1)
+
+
+class FoldTests(SimpleTestCase):
+    def test_folds_to_lowercase_ascii_words(self):
+        self.assertEqual(fold("Żurek  na zakwasie!"), "zurek na zakwasie")
+        self.assertEqual(fold("ŁAZANKI z kapustą"), "lazanki z kapusta")
+        self.assertEqual(fold(" -- "), "")
+
+
+class SuggestIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SuggestIndex([
+            ("Pierogi ruskie", "recipe", 1, 0),
+            ("Żurek na zakwasie", "recipe", 2, 0),
+            ("Zupa z pieczarek", "heading", None, 3),
+            ("Pieczarki marynowane", "heading", None, 5),
+            ("Pierniczki", "heading", None, 1),
+            ("żurek na zakwasie", "heading", None, 9),
+            ("!!!", "heading", None, 1),
+        ])
+
+    def texts(self, prefix, limit=8):
+        return [suggestion["text"] for suggestion in self.index.complete(prefix, limit)]
+
+    def test_suggestions_folding_to_the_same_text_are_kept_once(self):
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.index.complete("zurek"), [
+            {"text": "Żurek na zakwasie", "kind": "recipe", "recipe_id": 2, "chunks": 0},
+        ])
+
+    def test_title_start_comes_before_later_words(self):
+        self.assertEqual(
+            self.texts("pie"), ["Pierogi ruskie", "Pieczarki marynowane", "Pierniczki", "Zupa z pieczarek"]
+        )
+
+    def test_later_words_and_polish_letters_are_optional(self):
+        self.assertEqual(self.texts("RUSK"), ["Pierogi ruskie"])
+        self.assertEqual(self.texts("żur"), ["Żurek na zakwasie"])
+        self.assertEqual(self.texts("zakwasie"), ["Żurek na zakwasie"])
+
+    def test_short_words_start_no_key(self):
+        self.assertEqual(self.texts("na"), [])
+
+    def test_recipes_come_first_then_headings_shared_by_more_chunks(self):
+        self.assertEqual(self.texts("pier"), ["Pierogi ruskie", "Pierniczki"])
+        self.assertEqual(self.texts("pie", limit=2), ["Pierogi ruskie", "Pieczarki marynowane"])
+
+    def test_limit_and_empty_prefix(self):
+        self.assertEqual(self.texts("pie", limit=1), ["Pierogi ruskie"])
+        self.assertEqual(self.texts("pie", limit=0), [])
+        self.assertEqual(self.texts("  "), [])
+
+    def test_long_prefixes_match_on_their_start(self):
+        index = SuggestIndex([("Sałatka " + "bardzo " * 10 + "długa", "recipe", 3, 0)])
+
+        self.assertEqual(len(index.complete(fold(index.entries[0][0])[:KEY_LENGTH + 10])), 1)
+
+
+class BuildIndexTests(TestCase):
+    def test_recipes_and_headings_of_searchable_chunks(self):
+        Recipe.objects.create(title="Pierogi ruskie", description="", instructions="")
+        vector_service = VectorService(None, provider=HashingEmbeddingProvider(256))
+        for status, headings in [("processed", ["Bigos", "Bigos", None]), ("pending", ["Barszcz"])]:
+            document = StoredDocument.objects.create(file_path=f"/tmp/{status}.pdf", title="Bigos", status=status)
+            texts = [f"{status} {index}" for index in range(len(headings))]
+            vector_service.store_chunks(document, texts, vector_service.embed_texts(texts), 0, headings=headings)
+
+        index = build_index()
+
+        self.assertEqual(index.complete("bi"), [{"text": "Bigos", "kind": "heading", "recipe_id": None, "chunks": 2}])
+        self.assertEqual(index.complete("ba"), [])
+        self.assertEqual(len(index), 2)
+
+
+class ParseListTests(SimpleTestCase):
+    def test_json_lists_and_lines(self):
+        self.assertEqual(facet_arrays.parse_list('["pieczenie", " duszenie ", "", null]'), ["pieczenie", "duszenie"])
+        self.assertEqual(facet_arrays.parse_list("- mąka\n\n- jajka "), ["mąka", "jajka"])
+        self.assertEqual(facet_arrays.parse_list('"obiad"'), ["obiad"])
+        self.assertEqual(facet_arrays.parse_list(" "), [])
+        self.assertEqual(facet_arrays.parse_list(None), [])
+
+    def test_entries_are_cut_to_the_column_width(self):
+        self.assertEqual(facet_arrays.parse_list(json.dumps(["a" * 150]), 100), ["a" * 100])
+        self.assertEqual(facet_arrays.parse_list("b" * 150, 100), ["b" * 100])
+
+
+class FacetArrayMigrationTests(TransactionTestCase):
+    before = [("recipes", "0005_recipe_cooking_methods_recipe_course_recipe_cuisine_and_more")]
+    after = [("recipes", "0006_recipe_facet_arrays")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        self.addCleanup(self.migrate, MigrationExecutor(connection).loader.graph.leaf_nodes("recipes"))
+        Recipe = self.migrate(self.before).get_model("recipes", "Recipe")
+        self.recipe_id = Recipe.objects.create(
+            title="Bigos",
+            description="",
+            instructions="",
+            ingredients="- kapusta\n- kiełbasa",
+            cooking_methods=json.dumps(["duszenie", "x" * 150], ensure_ascii=False),
+            recipe_keys="",
+        ).id
+
+    def test_strings_become_arrays_and_back(self):
+        Recipe = self.migrate(self.after).get_model("recipes", "Recipe")
+        recipe = Recipe.objects.get(id=self.recipe_id)
+
+        self.assertEqual(recipe.ingredients, ["kapusta", "kiełbasa"])
+        self.assertEqual(recipe.cooking_methods, ["duszenie", "x" * 100])
+        self.assertEqual(recipe.recipe_keys, [])
+
+        Recipe = self.migrate(self.before).get_model("recipes", "Recipe")
+        recipe = Recipe.objects.get(id=self.recipe_id)
+
+        self.assertEqual(json.loads(recipe.ingredients), ["kapusta", "kiełbasa"])
+        self.assertEqual(recipe.recipe_keys, "[]")
+
+
+class FacetCountTriggerTests(TestCase):
+    @staticmethod
+    def counts():
+        return dict(((facet, value), count) for facet, value, count in RecipeFacetCount.objects.filter(
+            count__gt=0).values_list('facet', 'value', 'count'))
+
+    def assertCountsMatchTheRecipes(self):
+        self.assertEqual(facet_counts(), filtered_facet_counts(Recipe.objects.all()))
+        counts = self.counts()
+        rebuild_facet_counts()
+        self.assertEqual(counts, self.counts())
+
+    def create(self, title, **facets):
+        return Recipe.objects.create(title=title, description="", instructions="", **facets)
+
+    def test_inserts_count_each_value_once_per_recipe(self):
+        self.create("Bigos", cuisine="polska", cooking_methods=["duszenie", "duszenie"], recipe_keys=[""])
+        Recipe.objects.bulk_create([
+            Recipe(title=title, description="", instructions="", cuisine="polska", cooking_methods=["pieczenie"])
+            for title in ("Sernik", "Szarlotka")
+        ])
+
+        self.assertEqual(self.counts(), {
+            ("cuisine", "polska"): 3, ("cooking_methods", "duszenie"): 1, ("cooking_methods", "pieczenie"): 2,
+        })
+        self.assertCountsMatchTheRecipes()
+
+    def test_updates_move_counts_between_values(self):
+        bigos = self.create("Bigos", cuisine="polska", season="zima")
+        self.create("Leczo", cuisine="węgierska", season="lato")
+
+        Recipe.objects.filter(season="zima").update(cuisine="węgierska")
+        bigos.refresh_from_db()
+        bigos.title = "Bigos myśliwski"
+        bigos.save()
+
+        self.assertEqual(self.counts(), {("cuisine", "węgierska"): 2, ("season", "zima"): 1, ("season", "lato"): 1})
+        self.assertCountsMatchTheRecipes()
+
+    def test_deletes_release_their_values(self):
+        bigos = self.create("Bigos", cuisine="polska", recipe_keys=["kapusta"])
+        self.create("Kapuśniak", cuisine="polska", recipe_keys=["kapusta", "zupa"])
+
+        bigos.delete()
+        self.assertEqual(
+            self.counts(), {("cuisine", "polska"): 1, ("recipe_keys", "kapusta"): 1, ("recipe_keys", "zupa"): 1}
+        )
+        Recipe.objects.all().delete()
+
+        self.assertEqual(self.counts(), {})
+        self.assertCountsMatchTheRecipes()
@@ -1,8 +1,15 @@
 from django.urls import path
-from .views import RecipeListCreateAPIView, search_recipes, generate_recipe
+from .views import (
+    RecipeListCreateAPIView, search_recipes, suggest_recipes, generate_recipe, recipe_usage, recipe_facets,
+    related_recipes,
+)
 
 urlpatterns = [
     path('recipes/', RecipeListCreateAPIView.as_view(), name='recipe-list-create'),
     path('recipes/search/', search_recipes, name='recipe-semantic-search'),
+    path('recipes/suggest/', suggest_recipes, name='recipe-suggest'),
     path('recipes/generate/', generate_recipe, name='recipe-generate'),
+    path('recipes/usage/', recipe_usage, name='recipe-usage'),
+    path('recipes/facets/', recipe_facets, name='recipe-facets'),
+    path('recipes/<int:recipe_id>/related/', related_recipes, name='recipe-related'),
 ]
@@ -1,16 +1,185 @@
+import uuid
+from datetime import datetime, time
+
+from django.conf import settings
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
 from rest_framework import generics, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .models import Recipe
 from .serializers import RecipeSerializer
-from .services.recipe_search_service import RecipeSearchService
+from .services.recipe_search_service import SEARCHABLE_STATUSES, RecipeSearchService
 from .services.recipe_generator_service import RecipeGeneratorService
+from .services.recipe_facet_service import facet_counts, filtered_facet_counts
+from .services.related_recipe_service import related_recipes as find_related_recipes
+from .services.suggest_service import suggest
 from recipes.models.chat_models import ChatRequest, Message
+from documents_processor.models import StoredDocument
+from documents_processor.services.usage_service import MAX_USAGE_ROWS, usage_by, usage_totals
+from documents_processor.services.vector_service import ChunkFilter
+
+# List filters on single-valued fields: a recipe matches any of the given values
+VALUE_FILTERS = ('difficulty', 'season', 'course', 'cuisine')
+# List filters on array fields: a recipe must have all of the given values (GIN-indexed @>)
+ARRAY_FILTERS = ('cooking_methods', 'recipe_keys')
+
+
+def filter_values(request, name):
+    """Values of a list filter, given repeated (?season=Zima&season=Lato) or comma-separated."""
+    return [value.strip() for param in request.query_params.getlist(name)
+            for value in param.split(',') if value.strip()]
+
+
+def filter_recipes(queryset, request):
+    """The recipe list filters of a request applied to `queryset`; returns it with the filters used."""
+    filters = {}
+    for name in VALUE_FILTERS:
+        values = filter_values(request, name)
+        if values:
+            queryset = queryset.filter(**{f'{name}__in': values})
+            filters[name] = values
+    for name in ARRAY_FILTERS:
+        values = filter_values(request, name)
+        if values:
+            queryset = queryset.filter(**{f'{name}__contains': values})
+            filters[name] = values
+    return queryset, filters
+
+
+def parse_timestamp(value):
+    """An ISO date or datetime query parameter as an aware datetime; ValueError if malformed."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value!r}")
+        parsed = datetime.combine(day, time.min)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def parse_mmr_lambda(value):
+    """An optional diversification lambda between 0 and 1; ValueError if malformed."""
+    if value is None or value == '':
+        return None
+    mmr_lambda = float(value)
+    if not 0 <= mmr_lambda <= 1:
+        raise ValueError(f"Invalid mmr_lambda: {value!r}, expected a number between 0 and 1")
+    return mmr_lambda
+
+
+def chunk_filter(request):
+    """The document scope of a search request; ValueError for malformed parameters."""
+    statuses = filter_values(request, 'status') or list(SEARCHABLE_STATUSES)
+    valid_statuses = {choice for choice, _ in StoredDocument.STATUS_CHOICES}
+    if 'all' in statuses:
+        statuses = []
+    elif not valid_statuses.issuperset(statuses):
+        raise ValueError(f"Invalid status, expected some of {sorted(valid_statuses)} or 'all'")
+    created_after = request.query_params.get('created_after')
+    created_before = request.query_params.get('created_before')
+    return ChunkFilter(
+        document_ids=[uuid.UUID(value) for value in filter_values(request, 'document_ids')],
+        statuses=statuses,
+        created_after=parse_timestamp(created_after) if created_after else None,
+        created_before=parse_timestamp(created_before) if created_before else None,
+    )
+
 
 class RecipeListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Recipe.objects.all()
+    """
+    List recipes, newest first, or create one.
+
+    Query Parameters:
+        difficulty, season, course, cuisine: Recipes with any of the values
+        cooking_methods, recipe_keys: Recipes with all of the values
+
+    e.g. ?recipe_keys=Wegańskie,Szybkie posiłki&season=Zima
+    """
     serializer_class = RecipeSerializer
 
+    def get_queryset(self):
+        queryset, _ = filter_recipes(Recipe.objects.order_by('-created_at', '-id'), self.request)
+        return queryset
+
+
+@api_view(['GET'])
+def recipe_facets(request):
+    """
+    Number of recipes per value of each facet (difficulty, season, course, cuisine,
+    cooking_methods, recipe_keys), most frequent first.
+
+    Query Parameters:
+        The filters of the recipe list; counts are then taken within the filtered recipes.
+        Without filters they are read from precomputed counters.
+    """
+    try:
+        recipes, filters = filter_recipes(Recipe.objects.all(), request)
+        if filters:
+            facets = filtered_facet_counts(recipes)
+        else:
+            facets = facet_counts()
+        return Response({"filters": filters, "facets": facets})
+    except Exception as e:
+        return Response(
+            {"error": f"Error counting recipe facets: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+def related_recipes(request, recipe_id):
+    """
+    Recipes most similar to the given one, most similar first, read from the precomputed
+    related-recipes graph without embedding or searching anything.
+
+    Query Parameters:
+        limit: Maximum number of results (default and maximum: RELATED_RECIPES_PER_RECIPE)
+    """
+    try:
+        limit = int(request.query_params.get('limit', settings.RELATED_RECIPES_PER_RECIPE))
+    except ValueError:
+        limit = settings.RELATED_RECIPES_PER_RECIPE
+
+    try:
+        results = find_related_recipes(recipe_id, limit=limit)
+        # Only a recipe without related recipes costs a second query
+        if not results and not Recipe.objects.filter(id=recipe_id).exists():
+            return Response({"error": f"Recipe {recipe_id} not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "recipe_id": recipe_id,
+            "results_count": len(results),
+            "results": results
+        })
+    except Exception as e:
+        return Response(
+            {"error": f"Error reading related recipes: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+def suggest_recipes(request):
+    """
+    Completions for a search box, from recipe titles and the recipe headings of processed
+    documents. Answered from an in-memory index, without queries or embedding calls.
+
+    Query Parameters:
+        q: The text typed so far; any word of a title can be started, Polish letters optional
+        limit: Maximum number of suggestions (default: 8, max: 50)
+    """
+    query = request.query_params.get('q', '')
+    try:
+        limit = int(request.query_params.get('limit', '8'))
+    except ValueError:
+        limit = 8
+
+    try:
+        return Response({"query": query, "results": suggest(query, limit=limit)})
+    except Exception as e:
+        return Response(
+            {"error": f"Error suggesting recipes: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @api_view(['GET'])
 def search_recipes(request):
     """
@@ -19,6 +188,11 @@ def search_recipes(request):
     Query Parameters:
         meal_name: The name of the meal to search for
         limit: Maximum number of results to return (default: 5)
+        document_ids: Only search these documents (comma-separated or repeated)
+        status: Only search documents in these statuses (default: processed; 'all' for any)
+        created_after, created_before: Only search chunks created in this range (ISO dates)
+        mmr_lambda: Diversify the results by maximal marginal relevance (0 to 1; 1 ranks by
+            relevance alone, lower values prefer results unlike each other)
     """
     meal_name = request.query_params.get('meal_name', '')
     if not meal_name:
@@ -31,13 +205,23 @@ def search_recipes(request):
         limit = int(request.query_params.get('limit', '5'))
     except ValueError:
         limit = 5
+
+    try:
+        filters = chunk_filter(request)
+        mmr_lambda = parse_mmr_lambda(request.query_params.get('mmr_lambda'))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
         search_service = RecipeSearchService()
-        results = search_service.search_recipes_by_semantic(meal_name, limit=limit)
+        results = search_service.search_recipes_by_semantic(
+            meal_name, limit=limit, filters=filters, mmr_lambda=mmr_lambda
+        )
         
         return Response({
             "query": meal_name,
+            # 'title' when a recipe title matched and the query was not embedded
+            "search_path": "title" if results and results[0]['search_method'] == 'title' else "embedding",
             "results_count": len(results),
             "results": results
         })
@@ -56,6 +240,8 @@ def generate_recipe(request):
     Request Body:
         query: The recipe name or concept to generate
         num_examples: (Optional) Number of similar recipes to use as examples (default: 3)
+        mmr_lambda: (Optional) Lambda of the maximal marginal relevance picking the examples
+            (default: SEARCH_MMR_LAMBDA; 1 for the most similar recipes)
     """
     query = request.data.get('query', '')
     if not query:
@@ -68,13 +254,20 @@ def generate_recipe(request):
         num_examples = int(request.data.get('num_examples', '3'))
     except ValueError:
         num_examples = 3
+
+    try:
+        mmr_lambda = parse_mmr_lambda(request.data.get('mmr_lambda'))
+    except (TypeError, ValueError) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if mmr_lambda is None:
+        mmr_lambda = settings.SEARCH_MMR_LAMBDA
     
     try:
         # Initialize the generator service
         generator_service = RecipeGeneratorService()
         
         # Call the generation method (now synchronous)
-        result = generator_service.generate_recipe(query, num_examples=num_examples)
+        result = generator_service.generate_recipe(query, num_examples=num_examples, mmr_lambda=mmr_lambda)
         
         return Response(result)
         
@@ -83,3 +276,27 @@ def generate_recipe(request):
             {"error": f"Error generating recipe: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+@api_view(['GET'])
+def recipe_usage(request):
+    """
+    OpenAI tokens and cost spent on generating each recipe, most expensive first.
+
+    Query Parameters:
+        limit: Maximum number of recipes to return (default: 100, max: 1000)
+    """
+    try:
+        limit = int(request.query_params.get('limit', '100'))
+    except ValueError:
+        limit = 100
+    limit = max(1, min(limit, MAX_USAGE_ROWS))
+
+    rows = usage_by('recipe_id', limit=limit)
+    titles = dict(Recipe.objects.filter(id__in=[row['recipe_id'] for row in rows]).values_list('id', 'title'))
+    for row in rows:
+        row['title'] = titles.get(row['recipe_id'])
+
+    return Response({
+        "totals": usage_totals(recipe_id__isnull=False),
+        "recipes": rows
+    })